@@ -0,0 +1,60 @@
+-- Migration 000: tables, columns and indexes added before versioned migrations existed
+-- (notification read watermark, support thread summaries, MTTR statistics, report jobs).
+-- Databases built from an earlier schema.sql need these before 001 onwards.
+-- After applying, run `flask rebuild-message-threads` to fill message_threads from existing messages.
+
+ALTER TABLE customers ADD COLUMN notifications_read_through TIMESTAMP NULL;
+ALTER TABLE customers ADD COLUMN notifications_read_through_id INT NULL;
+
+CREATE INDEX idx_resolution_date ON faults (resolution_date);
+CREATE INDEX idx_notification_customer_created ON notifications (customer_id, created_at);
+
+CREATE TABLE message_threads (
+    thread_id INT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    last_activity_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    reply_count INT NOT NULL DEFAULT 0,
+    unread_for_customer INT NOT NULL DEFAULT 0,
+    unread_for_staff INT NOT NULL DEFAULT 0,
+
+    FOREIGN KEY (thread_id) REFERENCES customer_messages(message_id) ON DELETE CASCADE,
+    FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE,
+    INDEX idx_thread_customer_activity (customer_id, last_activity_at),
+    INDEX idx_thread_staff_unread (unread_for_staff, last_activity_at)
+);
+
+CREATE TABLE mttr_stats (
+    stat_id INT AUTO_INCREMENT PRIMARY KEY,
+    group_type VARCHAR(20) NOT NULL,
+    group_value VARCHAR(50) NOT NULL,
+    sample_count INT NOT NULL DEFAULT 0,
+    total_hours DOUBLE NOT NULL DEFAULT 0,
+    p50_hours DOUBLE,
+    p90_hours DOUBLE,
+    p99_hours DOUBLE,
+    histogram JSON,
+    computed_through TIMESTAMP NULL,
+    computed_through_id INT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uq_mttr_group (group_type, group_value)
+);
+
+CREATE TABLE report_jobs (
+    job_id INT AUTO_INCREMENT PRIMARY KEY,
+    report_name VARCHAR(50) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    requested_by INT,
+    status ENUM('queued', 'running', 'completed', 'failed') NOT NULL DEFAULT 'queued',
+    progress INT NOT NULL DEFAULT 0,
+    result JSON,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+
+    FOREIGN KEY (requested_by) REFERENCES users(user_id) ON DELETE SET NULL,
+    INDEX idx_report_job_status (status, created_at),
+    INDEX idx_report_job_range (report_name, start_date, end_date)
+);
@@ -0,0 +1,17 @@
+-- Migration 001: indexes for the filters the routes actually run
+-- Found by benchmarks/index_advisor.py (full scans / filesorts on the statements below)
+
+-- Technician fault list and workload: WHERE assigned_to = ? [AND status ...]
+CREATE INDEX idx_fault_assigned_status ON faults (assigned_to, status);
+
+-- Portal connection page: WHERE connection_id = ? ORDER BY reported_date DESC LIMIT 5
+CREATE INDEX idx_fault_connection_reported ON faults (connection_id, reported_date);
+
+-- Customer portal "my faults": WHERE reported_by_customer = ? ORDER BY reported_date DESC
+CREATE INDEX idx_fault_customer_reported ON faults (reported_by_customer, reported_date);
+
+-- Portal unread badge: WHERE customer_id = ? AND is_read = 0 AND created_at > ?
+CREATE INDEX idx_notification_customer_unread ON notifications (customer_id, is_read, created_at);
+
+-- Technician maintenance list and calendar: WHERE assigned_to = ? ORDER BY / BETWEEN scheduled_date
+CREATE INDEX idx_maintenance_assigned_date ON maintenance_schedules (assigned_to, scheduled_date);
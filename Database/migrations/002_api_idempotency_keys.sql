@@ -0,0 +1,14 @@
+-- Migration 002: idempotency keys for the batch field-update API (/api/v1/field-updates)
+
+CREATE TABLE api_idempotency_keys (
+    key_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    idempotency_key VARCHAR(64) NOT NULL,
+    item_type VARCHAR(30) NOT NULL,
+    result JSON,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    UNIQUE KEY uq_api_idempotency_user_key (user_id, idempotency_key),
+    INDEX idx_api_idempotency_created (created_at)
+);
@@ -0,0 +1,32 @@
+-- Migration 003: change sequence numbers and tombstones for offline device sync (/api/v1/sync)
+
+ALTER TABLE faults ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+ALTER TABLE faults ADD COLUMN change_seq BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE fault_updates ADD COLUMN change_seq BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE maintenance_schedules ADD COLUMN change_seq BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE maintenance_logs ADD COLUMN change_seq BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_fault_assigned_change ON faults (assigned_to, change_seq);
+CREATE INDEX idx_fault_change ON faults (change_seq);
+CREATE INDEX idx_fault_update_change ON fault_updates (change_seq);
+CREATE INDEX idx_maintenance_assigned_change ON maintenance_schedules (assigned_to, change_seq);
+CREATE INDEX idx_maintenance_change ON maintenance_schedules (change_seq);
+CREATE INDEX idx_maintenance_log_change ON maintenance_logs (change_seq);
+
+CREATE TABLE sync_sequence (
+    name VARCHAR(30) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE sync_tombstones (
+    tombstone_id INT AUTO_INCREMENT PRIMARY KEY,
+    change_seq BIGINT NOT NULL,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INT NOT NULL,
+    user_id INT,
+    reason ENUM('deleted', 'unassigned') NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    INDEX idx_sync_tombstone_user_change (user_id, change_seq),
+    INDEX idx_sync_tombstone_change (change_seq)
+);
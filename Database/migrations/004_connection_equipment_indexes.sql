@@ -0,0 +1,4 @@
+-- Migration 004: find the connections behind a transformer or feeder (bulk fault resolution)
+
+CREATE INDEX idx_connection_transformer ON connections (transformer_id);
+CREATE INDEX idx_connection_feeder ON connections (feeder_line);
@@ -0,0 +1,30 @@
+-- Migration 005: outage broadcasts to every customer behind a feeder or transformer
+
+CREATE TABLE outage_broadcasts (
+    broadcast_id INT AUTO_INCREMENT PRIMARY KEY,
+    scope_type ENUM('feeder', 'transformer') NOT NULL,
+    scope_value VARCHAR(50) NOT NULL,
+    title VARCHAR(100) NOT NULL,
+    message TEXT NOT NULL,
+    notification_type ENUM('alert', 'maintenance_reminder') NOT NULL DEFAULT 'alert',
+    status ENUM('queued', 'running', 'completed', 'failed') NOT NULL DEFAULT 'queued',
+    total_recipients INT,
+    sent_count INT NOT NULL DEFAULT 0,
+    last_customer_id INT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_by INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    heartbeat_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE SET NULL,
+    INDEX idx_outage_broadcast_status (status, created_at)
+);
+
+-- Recipients are read as DISTINCT customer_id in customer_id order per feeder/transformer;
+-- carrying customer_id in the index makes each chunk a short range scan
+CREATE INDEX idx_connection_transformer_customer ON connections (transformer_id, customer_id);
+CREATE INDEX idx_connection_feeder_customer ON connections (feeder_line, customer_id);
+DROP INDEX idx_connection_transformer ON connections;
+DROP INDEX idx_connection_feeder ON connections;
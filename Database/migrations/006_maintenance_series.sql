@@ -0,0 +1,38 @@
+-- Migration 006: recurring maintenance series, expanded on demand; a maintenance_schedules
+-- row is only stored once an occurrence is started, logged or changed
+
+CREATE TABLE maintenance_series (
+    series_id INT AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(100) NOT NULL,
+    description TEXT,
+    maintenance_type ENUM('preventive', 'corrective', 'emergency', 'inspection') NOT NULL,
+    equipment_type ENUM('transformer', 'feeder_line', 'meter', 'pole', 'substation', 'other') NOT NULL,
+    equipment_id VARCHAR(50),
+    location_description TEXT NOT NULL,
+    location_coordinates VARCHAR(50),
+    rrule VARCHAR(255) NOT NULL COMMENT 'RFC 5545 RRULE body, e.g. FREQ=WEEKLY',
+    dtstart DATE NOT NULL,
+    until DATE NULL COMMENT 'Last possible occurrence, NULL when open-ended',
+    scheduled_time TIME,
+    estimated_duration INT COMMENT 'Duration in hours',
+    assigned_team VARCHAR(100),
+    assigned_to INT,
+    priority ENUM('low', 'medium', 'high', 'critical') DEFAULT 'medium',
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_by INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (assigned_to) REFERENCES users(user_id) ON DELETE SET NULL,
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE RESTRICT,
+    INDEX idx_maintenance_series_window (is_active, dtstart, until),
+    INDEX idx_maintenance_series_assigned (assigned_to, is_active)
+);
+
+ALTER TABLE maintenance_schedules ADD COLUMN series_id INT NULL;
+ALTER TABLE maintenance_schedules ADD COLUMN occurrence_date DATE NULL;
+ALTER TABLE maintenance_schedules ADD CONSTRAINT fk_maintenance_series
+    FOREIGN KEY (series_id) REFERENCES maintenance_series(series_id) ON DELETE SET NULL;
+
+-- One stored row per occurrence; also answers "which occurrences in this window are stored"
+CREATE UNIQUE INDEX uq_maintenance_occurrence ON maintenance_schedules (occurrence_date, series_id);
@@ -0,0 +1,20 @@
+-- Migration 007: per-technician workload and performance projection, recomputed with
+-- each committing write to the technician's faults, maintenance or work logs
+
+CREATE TABLE technician_stats (
+    user_id INT PRIMARY KEY,
+    open_faults_low INT NOT NULL DEFAULT 0,
+    open_faults_medium INT NOT NULL DEFAULT 0,
+    open_faults_high INT NOT NULL DEFAULT 0,
+    open_faults_critical INT NOT NULL DEFAULT 0,
+    active_maintenance INT NOT NULL DEFAULT 0 COMMENT 'Scheduled or in-progress maintenance',
+    resolved_30d INT NOT NULL DEFAULT 0,
+    median_resolution_hours FLOAT NULL COMMENT 'Over faults resolved in the last 30 days',
+    logged_minutes_30d INT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP NULL,
+
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Work logged by a technician over the last 30 days
+CREATE INDEX idx_maintenance_log_user_date ON maintenance_logs (logged_by, log_date);
@@ -0,0 +1,3 @@
+-- Migration 008: let the in-memory topology graph pick up connections changed since its last look
+
+CREATE INDEX idx_connection_updated ON connections (updated_at);
@@ -0,0 +1,10 @@
+-- Migration 009: committed writes to report tables, read by every process's report cache
+
+CREATE TABLE report_cache_invalidations (
+    seq BIGINT NOT NULL COMMENT 'sync_sequence report_cache value of the writing transaction',
+    table_name VARCHAR(50) NOT NULL,
+    first_day DATE NULL COMMENT 'Earliest report day the write touched, NULL when undated',
+    last_day DATE NULL,
+
+    PRIMARY KEY (seq, table_name)
+);
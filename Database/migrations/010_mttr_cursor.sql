@@ -0,0 +1,4 @@
+-- Migration 010: resume MTTR refreshes from a (resolution_date, fault_id) cursor so faults resolved
+-- in the same second as the last one folded in are not skipped
+
+ALTER TABLE mttr_stats ADD COLUMN computed_through_id INT NULL;
@@ -0,0 +1,24 @@
+-- Migration 011: fold MTTR statistics per fault instead of from a resolution_date cursor.
+-- Writes flag the faults whose resolution may have changed (mttr_dirty), and the background
+-- refresh subtracts each flagged fault's previous contribution (mttr_folds) before adding the
+-- new one, so reopened, re-resolved and backdated faults are counted exactly once.
+-- The stats are rebuilt from every resolved fault on the first refresh after this migration.
+
+ALTER TABLE faults ADD COLUMN mttr_dirty BOOLEAN NOT NULL DEFAULT FALSE;
+CREATE INDEX idx_fault_mttr_dirty ON faults (mttr_dirty);
+
+CREATE TABLE mttr_folds (
+    fault_id INT PRIMARY KEY,
+    hours DOUBLE NOT NULL,
+    fault_type VARCHAR(30) NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    county VARCHAR(50) NOT NULL,
+
+    FOREIGN KEY (fault_id) REFERENCES faults(fault_id) ON DELETE CASCADE
+);
+
+ALTER TABLE mttr_stats DROP COLUMN computed_through_id;
+ALTER TABLE mttr_stats DROP COLUMN computed_through;
+
+DELETE FROM mttr_stats;
+UPDATE faults SET mttr_dirty = TRUE, updated_at = updated_at WHERE resolution_date IS NOT NULL;
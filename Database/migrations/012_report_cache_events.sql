@@ -0,0 +1,16 @@
+-- Migration 012: report cache invalidations take an auto-increment id instead of the next value of a
+-- locked sync_sequence row, so writes to report tables no longer serialize on one counter.
+-- Ids can become visible out of order, so caches re-read the most recent ones (see report_cache.py).
+
+DROP TABLE IF EXISTS report_cache_invalidations;
+DELETE FROM sync_sequence WHERE name = 'report_cache';
+
+CREATE TABLE report_cache_events (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    first_day DATE NULL COMMENT 'Earliest report day the write touched, NULL when undated',
+    last_day DATE NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    INDEX idx_report_cache_event_created (created_at)
+);
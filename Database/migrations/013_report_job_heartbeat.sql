@@ -0,0 +1,6 @@
+-- Migration 013: running report jobs touch heartbeat_at while they compute, and are handed back
+-- to the queue once it goes stale instead of a fixed time after they started
+
+ALTER TABLE report_jobs ADD COLUMN heartbeat_at TIMESTAMP NULL;
+
+UPDATE report_jobs SET heartbeat_at = started_at WHERE status = 'running';
@@ -46,6 +46,8 @@ CREATE TABLE customers (
     password VARCHAR(255),
     portal_registered BOOLEAN DEFAULT FALSE,
     last_login TIMESTAMP NULL,
+    notifications_read_through TIMESTAMP NULL COMMENT 'Notifications created after this are unread',
+    notifications_read_through_id INT NULL COMMENT 'Newest notification ID at the watermark, breaks same-second ties',
 
     INDEX idx_account_number (account_number),
     INDEX idx_phone (phone)
@@ -71,7 +73,10 @@ CREATE TABLE connections (
 
     FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE RESTRICT,
     INDEX idx_meter_number (meter_number),
-    INDEX idx_status (connection_status)
+    INDEX idx_status (connection_status),
+    INDEX idx_connection_transformer_customer (transformer_id, customer_id),
+    INDEX idx_connection_feeder_customer (feeder_line, customer_id),
+    INDEX idx_connection_updated (updated_at)
 );
 
 -- TABLE: service_requests
@@ -118,6 +123,9 @@ CREATE TABLE faults (
     resolution_date TIMESTAMP NULL,
     resolution_notes TEXT,
     affected_customers INT DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    change_seq BIGINT NOT NULL DEFAULT 0 COMMENT 'sync_sequence value of the last change',
+    mttr_dirty BOOLEAN NOT NULL DEFAULT FALSE COMMENT 'Resolution changed since last folded into mttr_stats',
 
     FOREIGN KEY (connection_id) REFERENCES connections(connection_id) ON DELETE SET NULL,
     FOREIGN KEY (reported_by_customer) REFERENCES customers(customer_id) ON DELETE SET NULL,
@@ -125,7 +133,14 @@ CREATE TABLE faults (
     FOREIGN KEY (assigned_to) REFERENCES users(user_id) ON DELETE SET NULL,
     INDEX idx_status (status),
     INDEX idx_severity (severity),
-    INDEX idx_reported_date (reported_date)
+    INDEX idx_reported_date (reported_date),
+    INDEX idx_resolution_date (resolution_date),
+    INDEX idx_fault_assigned_status (assigned_to, status),
+    INDEX idx_fault_connection_reported (connection_id, reported_date),
+    INDEX idx_fault_customer_reported (reported_by_customer, reported_date),
+    INDEX idx_fault_assigned_change (assigned_to, change_seq),
+    INDEX idx_fault_change (change_seq),
+    INDEX idx_fault_mttr_dirty (mttr_dirty)
 );
 
 
@@ -141,9 +156,43 @@ CREATE TABLE fault_updates (
     new_status VARCHAR(50),
     notes TEXT,
     update_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    change_seq BIGINT NOT NULL DEFAULT 0,
 
     FOREIGN KEY (fault_id) REFERENCES faults(fault_id) ON DELETE CASCADE,
-    FOREIGN KEY (updated_by) REFERENCES users(user_id) ON DELETE RESTRICT
+    FOREIGN KEY (updated_by) REFERENCES users(user_id) ON DELETE RESTRICT,
+    INDEX idx_fault_update_change (change_seq)
+);
+
+
+-- TABLE: maintenance_series
+-- Purpose: Recurring maintenance; occurrences are expanded from the rule on demand
+
+CREATE TABLE maintenance_series (
+    series_id INT AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(100) NOT NULL,
+    description TEXT,
+    maintenance_type ENUM('preventive', 'corrective', 'emergency', 'inspection') NOT NULL,
+    equipment_type ENUM('transformer', 'feeder_line', 'meter', 'pole', 'substation', 'other') NOT NULL,
+    equipment_id VARCHAR(50),
+    location_description TEXT NOT NULL,
+    location_coordinates VARCHAR(50),
+    rrule VARCHAR(255) NOT NULL COMMENT 'RFC 5545 RRULE body, e.g. FREQ=WEEKLY',
+    dtstart DATE NOT NULL,
+    until DATE NULL COMMENT 'Last possible occurrence, NULL when open-ended',
+    scheduled_time TIME,
+    estimated_duration INT COMMENT 'Duration in hours',
+    assigned_team VARCHAR(100),
+    assigned_to INT,
+    priority ENUM('low', 'medium', 'high', 'critical') DEFAULT 'medium',
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_by INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (assigned_to) REFERENCES users(user_id) ON DELETE SET NULL,
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE RESTRICT,
+    INDEX idx_maintenance_series_window (is_active, dtstart, until),
+    INDEX idx_maintenance_series_assigned (assigned_to, is_active)
 );
 
 
@@ -171,11 +220,20 @@ CREATE TABLE maintenance_schedules (
     created_by INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    change_seq BIGINT NOT NULL DEFAULT 0 COMMENT 'sync_sequence value of the last change',
+    series_id INT NULL COMMENT 'Set when this row is a stored occurrence of a recurring series',
+    occurrence_date DATE NULL COMMENT 'Date the series rule produced for this occurrence',
 
     FOREIGN KEY (assigned_to) REFERENCES users(user_id) ON DELETE SET NULL,
     FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE RESTRICT,
+    CONSTRAINT fk_maintenance_series FOREIGN KEY (series_id) REFERENCES maintenance_series(series_id)
+        ON DELETE SET NULL,
+    UNIQUE KEY uq_maintenance_occurrence (occurrence_date, series_id),
     INDEX idx_scheduled_date (scheduled_date),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_maintenance_assigned_date (assigned_to, scheduled_date),
+    INDEX idx_maintenance_assigned_change (assigned_to, change_seq),
+    INDEX idx_maintenance_change (change_seq)
 );
 
 
@@ -192,9 +250,12 @@ CREATE TABLE maintenance_logs (
     recommendations TEXT,
     actual_duration INT COMMENT 'Actual duration in hours',
     log_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    change_seq BIGINT NOT NULL DEFAULT 0,
 
     FOREIGN KEY (maintenance_id) REFERENCES maintenance_schedules(maintenance_id) ON DELETE CASCADE,
-    FOREIGN KEY (logged_by) REFERENCES users(user_id) ON DELETE RESTRICT
+    FOREIGN KEY (logged_by) REFERENCES users(user_id) ON DELETE RESTRICT,
+    INDEX idx_maintenance_log_change (change_seq),
+    INDEX idx_maintenance_log_user_date (logged_by, log_date)
 );
 
 
@@ -214,7 +275,9 @@ CREATE TABLE notifications (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-    FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE
+    FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE,
+    INDEX idx_notification_customer_created (customer_id, created_at),
+    INDEX idx_notification_customer_unread (customer_id, is_read, created_at)
 );
 
 
@@ -240,6 +303,24 @@ CREATE TABLE customer_messages (
 );
 
 
+-- TABLE: message_threads
+-- Purpose: Maintained summary of each support conversation (one row per top-level message)
+
+CREATE TABLE message_threads (
+    thread_id INT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    last_activity_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    reply_count INT NOT NULL DEFAULT 0,
+    unread_for_customer INT NOT NULL DEFAULT 0,
+    unread_for_staff INT NOT NULL DEFAULT 0,
+
+    FOREIGN KEY (thread_id) REFERENCES customer_messages(message_id) ON DELETE CASCADE,
+    FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE,
+    INDEX idx_thread_customer_activity (customer_id, last_activity_at),
+    INDEX idx_thread_staff_unread (unread_for_staff, last_activity_at)
+);
+
+
 -- TABLE: audit_log
 -- Purpose: Track all system changes for security
 
@@ -260,6 +341,184 @@ CREATE TABLE audit_log (
 );
 
 
+-- TABLE: mttr_stats
+-- Purpose: Precomputed resolution-time percentiles and histograms per fault type, severity and county
+
+CREATE TABLE mttr_stats (
+    stat_id INT AUTO_INCREMENT PRIMARY KEY,
+    group_type VARCHAR(20) NOT NULL COMMENT 'overall, fault_type, severity or county',
+    group_value VARCHAR(50) NOT NULL,
+    sample_count INT NOT NULL DEFAULT 0,
+    total_hours DOUBLE NOT NULL DEFAULT 0,
+    p50_hours DOUBLE,
+    p90_hours DOUBLE,
+    p99_hours DOUBLE,
+    histogram JSON COMMENT 'Sparse {bin: count} over log-spaced bins',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uq_mttr_group (group_type, group_value)
+);
+
+
+-- TABLE: mttr_folds
+-- Purpose: Each resolved fault's current contribution to mttr_stats, subtracted when it is re-folded
+
+CREATE TABLE mttr_folds (
+    fault_id INT PRIMARY KEY,
+    hours DOUBLE NOT NULL,
+    fault_type VARCHAR(30) NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    county VARCHAR(50) NOT NULL,
+
+    FOREIGN KEY (fault_id) REFERENCES faults(fault_id) ON DELETE CASCADE
+);
+
+
+-- TABLE: report_jobs
+-- Purpose: Long-range reports computed in the background, with progress and cached result
+
+CREATE TABLE report_jobs (
+    job_id INT AUTO_INCREMENT PRIMARY KEY,
+    report_name VARCHAR(50) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    requested_by INT,
+    status ENUM('queued', 'running', 'completed', 'failed') NOT NULL DEFAULT 'queued',
+    progress INT NOT NULL DEFAULT 0 COMMENT 'Percent complete',
+    result JSON,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    heartbeat_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+
+    FOREIGN KEY (requested_by) REFERENCES users(user_id) ON DELETE SET NULL,
+    INDEX idx_report_job_status (status, created_at),
+    INDEX idx_report_job_range (report_name, start_date, end_date)
+);
+
+
+-- TABLE: outage_broadcasts
+-- Purpose: Outage notices sent to every customer behind a feeder or transformer, with a resume cursor
+
+CREATE TABLE outage_broadcasts (
+    broadcast_id INT AUTO_INCREMENT PRIMARY KEY,
+    scope_type ENUM('feeder', 'transformer') NOT NULL,
+    scope_value VARCHAR(50) NOT NULL,
+    title VARCHAR(100) NOT NULL,
+    message TEXT NOT NULL,
+    notification_type ENUM('alert', 'maintenance_reminder') NOT NULL DEFAULT 'alert',
+    status ENUM('queued', 'running', 'completed', 'failed') NOT NULL DEFAULT 'queued',
+    total_recipients INT,
+    sent_count INT NOT NULL DEFAULT 0,
+    last_customer_id INT NOT NULL DEFAULT 0 COMMENT 'Highest customer_id already notified',
+    error TEXT,
+    created_by INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    heartbeat_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE SET NULL,
+    INDEX idx_outage_broadcast_status (status, created_at)
+);
+
+
+-- TABLE: api_idempotency_keys
+-- Purpose: Results of applied batch API items, so retried requests are not applied twice
+
+CREATE TABLE api_idempotency_keys (
+    key_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    idempotency_key VARCHAR(64) NOT NULL,
+    item_type VARCHAR(30) NOT NULL,
+    result JSON,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    UNIQUE KEY uq_api_idempotency_user_key (user_id, idempotency_key),
+    INDEX idx_api_idempotency_created (created_at)
+);
+
+
+-- TABLE: sync_sequence
+-- Purpose: Named counters; 'changes' numbers every transaction that writes a synced table
+
+CREATE TABLE sync_sequence (
+    name VARCHAR(30) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO sync_sequence (name, value) VALUES ('changes', 0);
+
+
+-- TABLE: sync_tombstones
+-- Purpose: Synced rows deleted or reassigned away from a technician, for offline devices to drop
+
+CREATE TABLE sync_tombstones (
+    tombstone_id INT AUTO_INCREMENT PRIMARY KEY,
+    change_seq BIGINT NOT NULL,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INT NOT NULL,
+    user_id INT,
+    reason ENUM('deleted', 'unassigned') NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    INDEX idx_sync_tombstone_user_change (user_id, change_seq),
+    INDEX idx_sync_tombstone_change (change_seq)
+);
+
+
+-- TABLE: report_cache_events
+-- Purpose: Committed writes to report tables, so every process's report cache drops what they made stale
+
+CREATE TABLE report_cache_events (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    first_day DATE NULL COMMENT 'Earliest report day the write touched, NULL when undated',
+    last_day DATE NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    INDEX idx_report_cache_event_created (created_at)
+);
+
+
+-- TABLE: technician_stats
+-- Purpose: Workload and performance figures per technician, maintained on every write that moves them
+
+CREATE TABLE technician_stats (
+    user_id INT PRIMARY KEY,
+    open_faults_low INT NOT NULL DEFAULT 0,
+    open_faults_medium INT NOT NULL DEFAULT 0,
+    open_faults_high INT NOT NULL DEFAULT 0,
+    open_faults_critical INT NOT NULL DEFAULT 0,
+    active_maintenance INT NOT NULL DEFAULT 0 COMMENT 'Scheduled or in-progress maintenance',
+    resolved_30d INT NOT NULL DEFAULT 0,
+    median_resolution_hours FLOAT NULL COMMENT 'Over faults resolved in the last 30 days',
+    logged_minutes_30d INT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP NULL,
+
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+
+-- TABLE: schema_migrations
+-- Purpose: Versioned migrations from Database/migrations already applied (see `flask migrate-db`)
+
+CREATE TABLE schema_migrations (
+    version VARCHAR(50) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- This schema already includes every migration below
+INSERT INTO schema_migrations (version) VALUES ('000_feature_tables'), ('001_query_indexes'),
+    ('002_api_idempotency_keys'), ('003_sync_sequence'), ('004_connection_equipment_indexes'),
+    ('005_outage_broadcasts'), ('006_maintenance_series'), ('007_technician_stats'),
+    ('008_connection_updated_index'), ('009_report_cache_invalidations'),
+    ('010_mttr_cursor'), ('011_mttr_folds'), ('012_report_cache_events'),
+    ('013_report_job_heartbeat');
+
+
 -- Create Views for Reporting
 
 
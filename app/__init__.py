@@ -4,12 +4,14 @@ Application Factory for Kenya Power Management System
 from datetime import datetime
 
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import config
+from app.utils.db_routing import RoutingSession
 
-# Initialize extensions
-db = SQLAlchemy()
+# Initialize extensions (the routing session sends eligible reads to a replica, if configured)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
@@ -29,6 +31,12 @@ def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
 
+    # Persist compiled templates so new workers skip the Jinja compile step
+    # (entries are keyed by template source checksum, so edits invalidate them)
+    if app.config.get('JINJA_BYTECODE_CACHE', True):
+        app.jinja_options = {**app.jinja_options,
+                             'bytecode_cache': FileSystemBytecodeCache(app.config.get('JINJA_BYTECODE_CACHE_DIR'))}
+
     # Register custom Jinja2 filters
     @app.template_filter('datetime')
     def datetime_filter(value, format='%B %d, %Y %H:%M'):
@@ -43,6 +51,58 @@ def create_app(config_name='default'):
     db.init_app(app)
     login_manager.init_app(app)
 
+    # Compression, ETags and Cache-Control; registered first so it sees the final response
+    from app.utils.http_cache import init_http_cache
+    init_http_cache(app)
+
+    # Token buckets for login and intake routes
+    from app.utils.rate_limit import init_rate_limiter
+    init_rate_limiter(app)
+
+    # Password hashing on a bounded thread pool
+    from app.utils.passwords import init_passwords
+    init_passwords(app)
+
+    # Replica engine, lag monitoring and read-your-writes stickiness (no-op without a replica)
+    from app.utils.db_routing import init_db_routing
+    init_db_routing(app)
+
+    # Audit trail hooks and background writer
+    from app.utils.audit import init_audit
+    init_audit(app)
+
+    # Change sequence numbers for offline device sync
+    from app.utils.sync import init_sync
+    init_sync()
+
+    # Technician workload projection, recomputed as part of each committing write
+    from app.utils.technician_stats import init_technician_stats
+    init_technician_stats()
+
+    # Grid topology graph, patched as connections change
+    from app.utils.topology import init_topology
+    init_topology()
+
+    # Report result cache, invalidated by committed writes
+    from app.utils.report_cache import init_report_cache
+    init_report_cache(app)
+
+    # {% cache %} template tag for navigation and filter fragments
+    from app.utils.fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+
+    # Background runner for long-range report jobs
+    from app.utils.report_jobs import init_report_jobs
+    init_report_jobs(app, config_name)
+
+    # MTTR statistics: writes flag changed faults, a background refresher folds them in
+    from app.utils.mttr import init_mttr
+    init_mttr(app)
+
+    # Background sender for outage broadcasts
+    from app.utils.broadcasts import init_broadcasts
+    init_broadcasts(app)
+
     # Register blueprints (routes)
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
@@ -53,6 +113,7 @@ def create_app(config_name='default'):
     from app.routes.reports import reports_bp
     from app.routes.customer import customer_bp
     from app.routes.staff import staff_bp
+    from app.routes.api import api_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
@@ -63,5 +124,6 @@ def create_app(config_name='default'):
     app.register_blueprint(reports_bp, url_prefix='/reports')
     app.register_blueprint(customer_bp, url_prefix='/portal')
     app.register_blueprint(staff_bp, url_prefix='/staff')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
 
     return app
\ No newline at end of file
@@ -2,6 +2,7 @@
 Database Models for Kenya Power Management System
 """
 from app import db, login_manager
+from app.utils.passwords import hash_password, verify_password
 from flask_login import UserMixin
 from datetime import datetime
 
@@ -18,7 +19,7 @@ class User(UserMixin, db.Model):
 
     user_id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
-    password = db.Column(db.String(255), nullable=False)  # Will store plain password now
+    password = db.Column(db.String(255), nullable=False)  # Password hash (see app.utils.passwords)
     email = db.Column(db.String(100), unique=True, nullable=False)
     full_name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20))
@@ -35,12 +36,15 @@ class User(UserMixin, db.Model):
         return str(self.user_id)
 
     def set_password(self, password):
-        """Store password directly (plain text - for demo only)"""
-        self.password = password
+        """Store a hash of the password"""
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        """Check password directly (plain text comparison)"""
-        return self.password == password
+        """Check a password, upgrading the stored hash if it uses an old scheme or plain text"""
+        matches, upgraded = verify_password(self.password, password)
+        if upgraded:
+            self.password = upgraded
+        return matches
 
 
 class Customer(db.Model):
@@ -66,6 +70,8 @@ class Customer(db.Model):
     password = db.Column(db.String(255))
     portal_registered = db.Column(db.Boolean, default=False)
     last_login = db.Column(db.DateTime)
+    notifications_read_through = db.Column(db.DateTime)  # Read watermark for the notifications page
+    notifications_read_through_id = db.Column(db.Integer)  # Tie-break for notifications created in the same second
 
     # Relationships
     connections = db.relationship('Connection', backref='customer', lazy='dynamic')
@@ -78,12 +84,45 @@ class Customer(db.Model):
         return f"{self.first_name} {self.last_name}"
 
     def set_password(self, password):
-        """Store password (plain text for demo)"""
-        self.password = password
+        """Store a hash of the password"""
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        """Check password (plain text comparison)"""
-        return self.password == password
+        """Check a password, upgrading the stored hash if it uses an old scheme or plain text"""
+        matches, upgraded = verify_password(self.password, password)
+        if upgraded:
+            self.password = upgraded
+        return matches
+
+    @property
+    def notifications_watermark(self):
+        """(created_at, notification_id) of the newest notification seen, or None"""
+        if self.notifications_read_through is None:
+            return None
+        return self.notifications_read_through, self.notifications_read_through_id or 0
+
+    def unread_notifications(self):
+        """Query for notifications newer than the read watermark and not explicitly marked read"""
+        query = Notification.query.filter_by(customer_id=self.customer_id, is_read=False)
+        if self.notifications_read_through:
+            # created_at has second precision and broadcasts insert whole chunks with one timestamp,
+            # so the notification ID breaks ties
+            read_through, read_through_id = self.notifications_watermark
+            query = query.filter(db.or_(
+                Notification.created_at > read_through,
+                db.and_(Notification.created_at == read_through, Notification.notification_id > read_through_id)
+            ))
+        return query
+
+    def advance_notifications_watermark(self):
+        """Move the read watermark up to the newest notification; returns True if it moved"""
+        latest = db.session.query(Notification.created_at, Notification.notification_id).filter(
+            Notification.customer_id == self.customer_id
+        ).order_by(Notification.created_at.desc(), Notification.notification_id.desc()).first()
+        if latest and (self.notifications_watermark is None or tuple(latest) > self.notifications_watermark):
+            self.notifications_read_through, self.notifications_read_through_id = latest
+            return True
+        return False
 
     def __repr__(self):
         return f'<Customer {self.account_number}>'
@@ -112,6 +151,12 @@ class Connection(db.Model):
     faults = db.relationship('Fault', backref='connection', lazy='dynamic')
     service_requests = db.relationship('ServiceRequest', backref='connection', lazy='dynamic')
 
+    __table_args__ = (
+        db.Index('idx_connection_transformer_customer', 'transformer_id', 'customer_id'),
+        db.Index('idx_connection_feeder_customer', 'feeder_line', 'customer_id'),
+        db.Index('idx_connection_updated', 'updated_at'),
+    )
+
     def __repr__(self):
         return f'<Connection {self.meter_number}>'
 
@@ -136,10 +181,24 @@ class Fault(db.Model):
     resolution_date = db.Column(db.DateTime)
     resolution_notes = db.Column(db.Text)
     affected_customers = db.Column(db.Integer, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, default=0, nullable=False)  # Sync sequence of the last change
+    mttr_dirty = db.Column(db.Boolean, default=False, nullable=False)  # to be re-folded into mttr_stats
 
     # Relationships
     updates = db.relationship('FaultUpdate', backref='fault', lazy='dynamic', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('idx_reported_date', 'reported_date'),
+        db.Index('idx_resolution_date', 'resolution_date'),
+        db.Index('idx_fault_assigned_status', 'assigned_to', 'status'),
+        db.Index('idx_fault_connection_reported', 'connection_id', 'reported_date'),
+        db.Index('idx_fault_customer_reported', 'reported_by_customer', 'reported_date'),
+        db.Index('idx_fault_assigned_change', 'assigned_to', 'change_seq'),
+        db.Index('idx_fault_change', 'change_seq'),
+        db.Index('idx_fault_mttr_dirty', 'mttr_dirty'),
+    )
+
     @property
     def resolution_time_hours(self):
         """Calculate resolution time in hours"""
@@ -164,10 +223,15 @@ class FaultUpdate(db.Model):
     new_status = db.Column(db.String(50))
     notes = db.Column(db.Text)
     update_date = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, default=0, nullable=False)
 
     # Relationship
     user = db.relationship('User', backref='fault_updates')
 
+    __table_args__ = (
+        db.Index('idx_fault_update_change', 'change_seq'),
+    )
+
     def __repr__(self):
         return f'<FaultUpdate {self.update_id}>'
 
@@ -196,15 +260,72 @@ class MaintenanceSchedule(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, default=0, nullable=False)  # Sync sequence of the last change
+    # Set when this row is a materialized occurrence of a recurring series (occurrence_date is the
+    # date the rule produced, which stays put if the visit is rescheduled)
+    series_id = db.Column(db.Integer, db.ForeignKey('maintenance_series.series_id', ondelete='SET NULL',
+                                                        name='fk_maintenance_series'))
+    occurrence_date = db.Column(db.Date)
 
     # Relationships
     logs = db.relationship('MaintenanceLog', backref='schedule', lazy='dynamic', cascade='all, delete-orphan')
     creator = db.relationship('User', foreign_keys=[created_by], backref='created_maintenance')
+    series = db.relationship('MaintenanceSeries', backref=db.backref('occurrences', lazy='dynamic'))
+
+    __table_args__ = (
+        db.Index('idx_maintenance_assigned_date', 'assigned_to', 'scheduled_date'),
+        db.Index('idx_maintenance_assigned_change', 'assigned_to', 'change_seq'),
+        db.Index('idx_maintenance_change', 'change_seq'),
+        db.UniqueConstraint('occurrence_date', 'series_id', name='uq_maintenance_occurrence'),
+    )
 
     def __repr__(self):
         return f'<MaintenanceSchedule {self.maintenance_id}>'
 
 
+class MaintenanceSeries(db.Model):
+    """
+    Recurring maintenance definition (e.g. monthly transformer inspections)
+
+    Occurrences are expanded from the rule on demand (app.utils.recurrence); a
+    maintenance_schedules row is created only once an occurrence is worked on.
+    """
+    __tablename__ = 'maintenance_series'
+
+    series_id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    maintenance_type = db.Column(db.Enum('preventive', 'corrective', 'emergency', 'inspection'), nullable=False)
+    equipment_type = db.Column(db.Enum('transformer', 'feeder_line', 'meter', 'pole', 'substation', 'other'), nullable=False)
+    equipment_id = db.Column(db.String(50))
+    location_description = db.Column(db.Text, nullable=False)
+    location_coordinates = db.Column(db.String(50))
+    rrule = db.Column(db.String(255), nullable=False)  # RFC 5545 subset, e.g. FREQ=MONTHLY;BYDAY=1MO
+    dtstart = db.Column(db.Date, nullable=False)
+    until = db.Column(db.Date)  # last possible occurrence (from UNTIL or COUNT); NULL = open-ended
+    scheduled_time = db.Column(db.Time)
+    estimated_duration = db.Column(db.Integer)
+    assigned_team = db.Column(db.String(100))
+    assigned_to = db.Column(db.Integer, db.ForeignKey('users.user_id'))
+    priority = db.Column(db.Enum('low', 'medium', 'high', 'critical'), default='medium')
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    technician = db.relationship('User', foreign_keys=[assigned_to])
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    __table_args__ = (
+        db.Index('idx_maintenance_series_window', 'is_active', 'dtstart', 'until'),
+        db.Index('idx_maintenance_series_assigned', 'assigned_to', 'is_active'),
+    )
+
+    def __repr__(self):
+        return f'<MaintenanceSeries {self.series_id} {self.rrule}>'
+
+
 class MaintenanceLog(db.Model):
     """Maintenance log/work record model"""
     __tablename__ = 'maintenance_logs'
@@ -218,10 +339,16 @@ class MaintenanceLog(db.Model):
     recommendations = db.Column(db.Text)
     actual_duration = db.Column(db.Integer)
     log_date = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, default=0, nullable=False)
 
     # Relationship
     user = db.relationship('User', backref='maintenance_logs')
 
+    __table_args__ = (
+        db.Index('idx_maintenance_log_change', 'change_seq'),
+        db.Index('idx_maintenance_log_user_date', 'logged_by', 'log_date'),
+    )
+
     def __repr__(self):
         return f'<MaintenanceLog {self.log_id}>'
 
@@ -264,6 +391,11 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_notification_customer_created', 'customer_id', 'created_at'),
+        db.Index('idx_notification_customer_unread', 'customer_id', 'is_read', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Notification {self.notification_id}>'
 
@@ -287,4 +419,365 @@ class CustomerMessage(db.Model):
     replies = db.relationship('CustomerMessage', backref=db.backref('parent', remote_side=[message_id]), lazy='dynamic')
 
     def __repr__(self):
-        return f'<CustomerMessage {self.message_id}>'
\ No newline at end of file
+        return f'<CustomerMessage {self.message_id}>'
+
+
+class AuditLog(db.Model):
+    """Audit trail of changes to core records (written in batches by app.utils.audit)"""
+    __tablename__ = 'audit_log'
+
+    log_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='SET NULL'))
+    action = db.Column(db.String(50), nullable=False)
+    table_name = db.Column(db.String(50))
+    record_id = db.Column(db.Integer)
+    old_values = db.Column(db.JSON)
+    new_values = db.Column(db.JSON)
+    ip_address = db.Column(db.String(45))
+    action_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_action_date', 'action_date'),
+        db.Index('idx_user', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<AuditLog {self.log_id}>'
+
+
+class MttrStat(db.Model):
+    """Precomputed fault resolution-time percentiles per group (maintained by app.utils.mttr)"""
+    __tablename__ = 'mttr_stats'
+
+    stat_id = db.Column(db.Integer, primary_key=True)
+    group_type = db.Column(db.String(20), nullable=False)  # overall, fault_type, severity, county
+    group_value = db.Column(db.String(50), nullable=False)
+    sample_count = db.Column(db.Integer, default=0, nullable=False)
+    total_hours = db.Column(db.Float, default=0.0, nullable=False)
+    p50_hours = db.Column(db.Float)
+    p90_hours = db.Column(db.Float)
+    p99_hours = db.Column(db.Float)
+    histogram = db.Column(db.JSON)  # sparse {bin index: count} over app.utils.mttr.HISTOGRAM_EDGES
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('group_type', 'group_value', name='uq_mttr_group'),
+    )
+
+    @property
+    def mean_hours(self):
+        return round(self.total_hours / self.sample_count, 2) if self.sample_count else None
+
+    def __repr__(self):
+        return f'<MttrStat {self.group_type}:{self.group_value}>'
+
+
+class MttrFold(db.Model):
+    """What one resolved fault currently contributes to mttr_stats, so it can be taken out again"""
+    __tablename__ = 'mttr_folds'
+
+    fault_id = db.Column(db.Integer, db.ForeignKey('faults.fault_id', ondelete='CASCADE'), primary_key=True)
+    hours = db.Column(db.Float, nullable=False)
+    fault_type = db.Column(db.String(30), nullable=False)
+    severity = db.Column(db.String(20), nullable=False)
+    county = db.Column(db.String(50), nullable=False)
+
+    def __repr__(self):
+        return f'<MttrFold {self.fault_id}>'
+
+
+class TechnicianStats(db.Model):
+    """Workload and performance figures per technician (maintained by app.utils.technician_stats)"""
+    __tablename__ = 'technician_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    open_faults_low = db.Column(db.Integer, default=0, nullable=False)
+    open_faults_medium = db.Column(db.Integer, default=0, nullable=False)
+    open_faults_high = db.Column(db.Integer, default=0, nullable=False)
+    open_faults_critical = db.Column(db.Integer, default=0, nullable=False)
+    active_maintenance = db.Column(db.Integer, default=0, nullable=False)  # scheduled or in progress
+    resolved_30d = db.Column(db.Integer, default=0, nullable=False)
+    median_resolution_hours = db.Column(db.Float)  # over the faults resolved in the last 30 days
+    logged_minutes_30d = db.Column(db.Integer, default=0, nullable=False)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def open_faults(self):
+        return self.open_faults_low + self.open_faults_medium + self.open_faults_high + self.open_faults_critical
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'open_faults': {
+                'low': self.open_faults_low,
+                'medium': self.open_faults_medium,
+                'high': self.open_faults_high,
+                'critical': self.open_faults_critical
+            },
+            'active_maintenance': self.active_maintenance,
+            'resolved_30d': self.resolved_30d,
+            'median_resolution_hours': self.median_resolution_hours,
+            'logged_minutes_30d': self.logged_minutes_30d,
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
+        }
+
+    def __repr__(self):
+        return f'<TechnicianStats {self.user_id}>'
+
+
+class MessageThread(db.Model):
+    """Summary row for a customer support conversation, maintained on every post"""
+    __tablename__ = 'message_threads'
+
+    thread_id = db.Column(db.Integer, db.ForeignKey('customer_messages.message_id', ondelete='CASCADE'), primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.customer_id', ondelete='CASCADE'), nullable=False)
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    reply_count = db.Column(db.Integer, default=0, nullable=False)
+    unread_for_customer = db.Column(db.Integer, default=0, nullable=False)
+    unread_for_staff = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_thread_customer_activity', 'customer_id', 'last_activity_at'),
+        db.Index('idx_thread_staff_unread', 'unread_for_staff', 'last_activity_at'),
+    )
+
+    # Relationship
+    root = db.relationship('CustomerMessage', lazy='joined',
+                           backref=db.backref('thread', uselist=False, passive_deletes=True))
+
+    @classmethod
+    def start(cls, message):
+        """Create the summary row for a new top-level message (must be flushed first)"""
+        now = message.created_at or datetime.utcnow()
+        return cls(
+            thread_id=message.message_id,
+            customer_id=message.customer_id,
+            last_activity_at=now,
+            reply_count=0,
+            unread_for_customer=0 if message.is_from_customer else 1,
+            unread_for_staff=1 if message.is_from_customer else 0
+        )
+
+    @classmethod
+    def record_reply(cls, reply):
+        """Bump counters for a reply with a single UPDATE so concurrent posts don't race"""
+        unread_column = cls.unread_for_staff if reply.is_from_customer else cls.unread_for_customer
+        return cls.query.filter_by(thread_id=reply.parent_message_id).update({
+            cls.last_activity_at: reply.created_at or datetime.utcnow(),
+            cls.reply_count: cls.reply_count + 1,
+            unread_column: unread_column + 1
+        }, synchronize_session=False)
+
+    def mark_read(self, by_customer=True):
+        """Mark the other side's messages in this thread as read with one set-based UPDATE"""
+        CustomerMessage.query.filter(
+            db.or_(CustomerMessage.message_id == self.thread_id,
+                   CustomerMessage.parent_message_id == self.thread_id),
+            CustomerMessage.is_from_customer == (not by_customer),
+            CustomerMessage.is_read == False  # noqa: E712
+        ).update({CustomerMessage.is_read: True}, synchronize_session=False)
+
+        if by_customer:
+            self.unread_for_customer = 0
+        else:
+            self.unread_for_staff = 0
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every summary row from customer_messages (backfill / repair)"""
+        reply = db.aliased(CustomerMessage)
+        unread_for_customer = db.func.sum(db.case(
+            (db.and_(reply.is_from_customer == False, reply.is_read == False), 1), else_=0))  # noqa: E712
+        unread_for_staff = db.func.sum(db.case(
+            (db.and_(reply.is_from_customer == True, reply.is_read == False), 1), else_=0))  # noqa: E712
+
+        rows = db.session.query(
+            CustomerMessage,
+            db.func.max(reply.created_at),
+            db.func.count(reply.message_id),
+            unread_for_customer,
+            unread_for_staff
+        ).outerjoin(reply, reply.parent_message_id == CustomerMessage.message_id).filter(
+            CustomerMessage.parent_message_id.is_(None)
+        ).group_by(CustomerMessage.message_id).all()
+
+        cls.query.delete()
+        for root, last_reply_at, reply_count, unread_customer, unread_staff in rows:
+            thread = cls.start(root)
+            thread.last_activity_at = max(filter(None, [root.created_at, last_reply_at]),
+                                          default=thread.last_activity_at)
+            thread.reply_count = reply_count
+            thread.unread_for_customer = (unread_customer or 0) + (0 if root.is_from_customer or root.is_read else 1)
+            thread.unread_for_staff = (unread_staff or 0) + (1 if root.is_from_customer and not root.is_read else 0)
+            db.session.add(thread)
+        return len(rows)
+
+    def __repr__(self):
+        return f'<MessageThread {self.thread_id}>'
+
+
+class ReportJob(db.Model):
+    """Long-range report computed in the background (run by app.utils.report_jobs)"""
+    __tablename__ = 'report_jobs'
+
+    job_id = db.Column(db.Integer, primary_key=True)
+    report_name = db.Column(db.String(50), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='SET NULL'))
+    status = db.Column(db.Enum('queued', 'running', 'completed', 'failed'), default='queued', nullable=False)
+    progress = db.Column(db.Integer, default=0, nullable=False)  # percent
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)  # also identifies the claim the job is running under
+    heartbeat_at = db.Column(db.DateTime)  # touched while the job computes
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_report_job_status', 'status', 'created_at'),
+        db.Index('idx_report_job_range', 'report_name', 'start_date', 'end_date'),
+    )
+
+    # Relationship
+    requester = db.relationship('User', foreign_keys=[requested_by])
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'report_name': self.report_name,
+            'start_date': self.start_date.isoformat(),
+            'end_date': self.end_date.isoformat(),
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<ReportJob {self.job_id} {self.report_name}>'
+
+
+class OutageBroadcast(db.Model):
+    """Outage notice to every customer behind a feeder or transformer (sent by app.utils.broadcasts)"""
+    __tablename__ = 'outage_broadcasts'
+
+    broadcast_id = db.Column(db.Integer, primary_key=True)
+    scope_type = db.Column(db.Enum('feeder', 'transformer'), nullable=False)
+    scope_value = db.Column(db.String(50), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.Enum('alert', 'maintenance_reminder'), default='alert', nullable=False)
+    status = db.Column(db.Enum('queued', 'running', 'completed', 'failed'), default='queued', nullable=False)
+    total_recipients = db.Column(db.Integer)  # counted when sending starts
+    sent_count = db.Column(db.Integer, default=0, nullable=False)
+    last_customer_id = db.Column(db.Integer, default=0, nullable=False)  # resume cursor
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # last committed chunk
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_outage_broadcast_status', 'status', 'created_at'),
+    )
+
+    # Relationship
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    @property
+    def progress(self):
+        """Percent of recipients notified"""
+        if self.status == 'completed':
+            return 100
+        if not self.total_recipients:
+            return 0
+        return min(99, int(self.sent_count * 100 / self.total_recipients))
+
+    def to_dict(self):
+        return {
+            'broadcast_id': self.broadcast_id,
+            'scope_type': self.scope_type,
+            'scope_value': self.scope_value,
+            'title': self.title,
+            'status': self.status,
+            'progress': self.progress,
+            'total_recipients': self.total_recipients,
+            'sent_count': self.sent_count,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<OutageBroadcast {self.broadcast_id} {self.scope_type} {self.scope_value}>'
+
+
+class SyncSequence(db.Model):
+    """Named counters; 'changes' numbers every transaction that touches a synced table"""
+    __tablename__ = 'sync_sequence'
+
+    name = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class SyncTombstone(db.Model):
+    """A synced row that was deleted, or reassigned away from a technician, at change_seq"""
+    __tablename__ = 'sync_tombstones'
+
+    tombstone_id = db.Column(db.Integer, primary_key=True)
+    change_seq = db.Column(db.BigInteger, nullable=False)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)  # technician who lost the row (NULL when it had no assignee)
+    reason = db.Column(db.Enum('deleted', 'unassigned'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_sync_tombstone_user_change', 'user_id', 'change_seq'),
+        db.Index('idx_sync_tombstone_change', 'change_seq'),
+    )
+
+
+class ReportCacheInvalidation(db.Model):
+    """A committed write to a report table, shared so every process's report cache sees it"""
+    __tablename__ = 'report_cache_events'
+    __table_args__ = (
+        db.Index('idx_report_cache_event_created', 'created_at'),
+    )
+
+    event_id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    first_day = db.Column(db.Date)  # earliest and latest report day the write touched, NULL when undated
+    last_day = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ApiIdempotencyKey(db.Model):
+    """Result of an applied batch API item, replayed when the client retries the same key"""
+    __tablename__ = 'api_idempotency_keys'
+
+    key_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    item_type = db.Column(db.String(30), nullable=False)
+    result = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_api_idempotency_user_key'),
+        db.Index('idx_api_idempotency_created', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<ApiIdempotencyKey {self.user_id}:{self.idempotency_key}>'
@@ -0,0 +1,242 @@
+"""
+Versioned JSON API for field work
+Technicians on slow mobile links send a batch of fault status changes, fault notes
+and maintenance log entries in one request instead of one form post (and redirect)
+each. Every item carries a client-chosen idempotency key; a retried key returns the
+stored result instead of being applied twice.
+
+Offline devices keep a local copy of their assignments and pull only what changed
+since their last sync token (GET /sync).
+"""
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Fault, FaultUpdate, MaintenanceSchedule, MaintenanceLog, ApiIdempotencyKey
+from app.utils.decorators import role_required
+from app.utils.http_cache import cache_policy
+from app.utils.sync import changes_since, transaction_change_seq
+from app.utils.technician_stats import mark_technicians
+
+api_bp = Blueprint('api', __name__)
+
+ITEM_TYPES = ('status_change', 'note', 'maintenance_log')
+FAULT_STATUSES = tuple(Fault.status.type.enums)
+RESOLVED_STATUSES = ('resolved', 'closed')
+
+
+class ItemError(ValueError):
+    """An item that cannot be applied; reported in its result, the rest of the batch goes on"""
+
+
+def _recorded_at(item, now):
+    """When the work happened on the device (defaults to now, never in the future)"""
+    value = item.get('recorded_at')
+    if not value:
+        return now
+    try:
+        recorded = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ItemError('recorded_at must be an ISO timestamp')
+    if recorded.tzinfo is not None:
+        recorded = (recorded - recorded.utcoffset()).replace(tzinfo=None)  # stored times are naive UTC
+    return min(recorded, now)
+
+
+def _check_assignment(assigned_to, what):
+    if current_user.role == 'technician' and assigned_to != current_user.user_id:
+        raise ItemError(f'{what} is not assigned to you')
+
+
+class _Batch:
+    """Validates items against pre-loaded rows and collects the rows to write"""
+
+    def __init__(self, items, now):
+        self.now = now
+        fault_ids = {item.get('fault_id') for item in items if item.get('type') in ('status_change', 'note')}
+        maintenance_ids = {item.get('maintenance_id') for item in items if item.get('type') == 'maintenance_log'}
+        fault_ids = {i for i in fault_ids if isinstance(i, int)}
+        maintenance_ids = {i for i in maintenance_ids if isinstance(i, int)}
+        # One query per table for the whole batch
+        self.faults = {f.fault_id: f for f in Fault.query.filter(Fault.fault_id.in_(fault_ids))} if fault_ids else {}
+        self.schedules = ({m.maintenance_id: m for m in
+                           MaintenanceSchedule.query.filter(MaintenanceSchedule.maintenance_id.in_(maintenance_ids))}
+                          if maintenance_ids else {})
+        self.fault_updates = []
+        self.maintenance_logs = []
+
+    def _fault(self, item):
+        fault = self.faults.get(item.get('fault_id'))
+        if fault is None:
+            raise ItemError('Fault not found')
+        _check_assignment(fault.assigned_to, 'Fault')
+        return fault
+
+    def status_change(self, item):
+        fault = self._fault(item)
+        new_status = item.get('status')
+        if new_status not in FAULT_STATUSES:
+            raise ItemError(f"status must be one of {', '.join(FAULT_STATUSES)}")
+        notes = item.get('notes') or ''
+        recorded = _recorded_at(item, self.now)
+
+        previous_status = fault.status
+        fault.status = new_status
+        if new_status in RESOLVED_STATUSES:
+            # Keep the original resolution time when a resolved fault is later closed
+            fault.resolution_date = fault.resolution_date or recorded
+            fault.resolution_notes = notes
+        else:
+            fault.resolution_date = None  # reopened: the next resolution is timed afresh
+        self.fault_updates.append({
+            'fault_id': fault.fault_id, 'updated_by': current_user.user_id, 'update_type': 'status_change',
+            'previous_status': previous_status, 'new_status': new_status, 'notes': notes, 'update_date': recorded
+        })
+        return {'fault_id': fault.fault_id, 'previous_status': previous_status, 'new_status': new_status}
+
+    def note(self, item):
+        fault = self._fault(item)
+        notes = (item.get('notes') or '').strip()
+        if not notes:
+            raise ItemError('notes is required')
+        self.fault_updates.append({
+            'fault_id': fault.fault_id, 'updated_by': current_user.user_id, 'update_type': 'note',
+            'previous_status': None, 'new_status': None, 'notes': notes, 'update_date': _recorded_at(item, self.now)
+        })
+        return {'fault_id': fault.fault_id}
+
+    def maintenance_log(self, item):
+        schedule = self.schedules.get(item.get('maintenance_id'))
+        if schedule is None:
+            raise ItemError('Maintenance schedule not found')
+        _check_assignment(schedule.assigned_to, 'Maintenance')
+        work_performed = (item.get('work_performed') or '').strip()
+        if not work_performed:
+            raise ItemError('work_performed is required')
+        duration = item.get('actual_duration')
+        if duration is not None and (not isinstance(duration, int) or duration < 0):
+            raise ItemError('actual_duration must be a non-negative whole number of hours')
+        self.maintenance_logs.append({
+            'maintenance_id': schedule.maintenance_id, 'logged_by': current_user.user_id,
+            'work_performed': work_performed, 'parts_used': item.get('parts_used'),
+            'issues_found': item.get('issues_found'), 'recommendations': item.get('recommendations'),
+            'actual_duration': duration, 'log_date': _recorded_at(item, self.now)
+        })
+        return {'maintenance_id': schedule.maintenance_id}
+
+
+def _idempotency_key(item):
+    key = item.get('key')
+    if not isinstance(key, str) or not 0 < len(key) <= 64:
+        raise ItemError('key must be a string of 1-64 characters')
+    return key
+
+
+@api_bp.route('/field-updates', methods=['POST'])
+@login_required
+@role_required('admin', 'manager', 'technician')
+@cache_policy(no_store=True)
+def field_updates():
+    """
+    Apply a batch of field updates in one transaction
+
+    Body: {"items": [{"key": "...", "type": "status_change", "fault_id": 1, "status": "in_progress",
+                      "notes": "...", "recorded_at": "2024-05-01T08:30:00"}, ...], "atomic": false}
+
+    Each result is {"key", "status": "applied" | "duplicate" | "error", ...}. Valid items are
+    written together; with "atomic": true any invalid item rejects the whole batch (422).
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('items'), list):
+        return jsonify({'error': 'Expected a JSON object with an "items" list'}), 400
+    items = body['items']
+    if len(items) > current_app.config.get('API_BATCH_MAX_ITEMS', 200):
+        return jsonify({'error': f"At most {current_app.config.get('API_BATCH_MAX_ITEMS', 200)} items per batch"}), 413
+
+    keys = [item.get('key') for item in items if isinstance(item, dict)]
+    seen = {row.idempotency_key: row for row in ApiIdempotencyKey.query.filter(
+        ApiIdempotencyKey.user_id == current_user.user_id,
+        ApiIdempotencyKey.idempotency_key.in_([k for k in keys if isinstance(k, str)])
+    )} if keys else {}
+
+    now = datetime.utcnow()
+    batch = _Batch([item for item in items if isinstance(item, dict)], now)
+    results, new_keys, batch_keys = [], [], set()
+    for item in items:
+        try:
+            if not isinstance(item, dict):
+                raise ItemError('Each item must be an object')
+            key = _idempotency_key(item)
+            if key in seen:
+                results.append({'key': key, 'status': 'duplicate', **(seen[key].result or {})})
+                continue
+            if key in batch_keys:
+                raise ItemError('Duplicate key within the batch')
+            if item.get('type') not in ITEM_TYPES:
+                raise ItemError(f"type must be one of {', '.join(ITEM_TYPES)}")
+            result = getattr(batch, item['type'])(item)
+        except ItemError as exc:
+            results.append({'key': item.get('key') if isinstance(item, dict) else None, 'status': 'error',
+                            'error': str(exc)})
+            continue
+        batch_keys.add(key)
+        new_keys.append({'user_id': current_user.user_id, 'idempotency_key': key, 'item_type': item['type'],
+                         'result': result, 'created_at': now})
+        results.append({'key': key, 'status': 'applied', **result})
+
+    errors = sum(1 for r in results if r['status'] == 'error')
+    if errors and body.get('atomic'):
+        db.session.rollback()
+        return jsonify({'results': results, 'applied': 0, 'errors': errors}), 422
+
+    try:
+        # Fault status changes go through the ORM (audited); the new rows are multi-row INSERTs
+        if batch.fault_updates or batch.maintenance_logs:
+            change_seq = transaction_change_seq(db.session)
+        if batch.fault_updates:
+            db.session.execute(insert(FaultUpdate), [{**row, 'change_seq': change_seq} for row in batch.fault_updates])
+        if batch.maintenance_logs:
+            db.session.execute(insert(MaintenanceLog),
+                               [{**row, 'change_seq': change_seq} for row in batch.maintenance_logs])
+            mark_technicians(db.session, {row['logged_by'] for row in batch.maintenance_logs})
+        if new_keys:
+            db.session.execute(insert(ApiIdempotencyKey), new_keys)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry of the same keys won the race; the client should retry to get its results
+        db.session.rollback()
+        return jsonify({'error': 'Batch conflicts with a concurrent request; retry it'}), 409
+
+    applied = sum(1 for r in results if r['status'] == 'applied')
+    return jsonify({'results': results, 'applied': applied,
+                    'duplicates': sum(1 for r in results if r['status'] == 'duplicate'), 'errors': errors})
+
+
+@api_bp.route('/sync')
+@login_required
+@role_required('admin', 'manager', 'technician')
+@cache_policy(no_store=True)
+def sync():
+    """
+    Changes to faults, fault updates, maintenance schedules and logs after a sync token
+
+    Query: ?since=<token from the previous response>&limit=<rows per table>. Without
+    `since` the device's whole scope is returned, paged like any delta. Technicians receive
+    their own assignments; admins and managers receive everything.
+
+    Response: {"token", "more", "changes": {table: [row, ...]}, "removed": {table: [id, ...]}}.
+    Store "token" and call again with it; while "more" is true, call again straight away.
+    """
+    since = request.args.get('since')
+    if since is not None:
+        if not since.isdigit():
+            return jsonify({'error': 'since must be a sync token'}), 400
+        since = int(since)
+    max_limit = current_app.config.get('API_SYNC_MAX_ROWS', 500)
+    limit = min(request.args.get('limit', max_limit, type=int) or max_limit, max_limit)
+    user_id = current_user.user_id if current_user.role == 'technician' else None
+    return jsonify(changes_since(user_id, since=since, limit=max(limit, 1)))
@@ -5,11 +5,15 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User
 from app import db
+from app.utils.passwords import PasswordHashBusy
+from app.utils.rate_limit import rate_limit
 
 auth_bp = Blueprint('auth', __name__)
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('20/minute', by='ip')
+@rate_limit('5/minute', by='form:username')
 def login():
     """User login"""
     if current_user.is_authenticated:
@@ -22,12 +26,19 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user and user.check_password(password):
+        try:
+            password_ok = user is not None and user.check_password(password)
+        except PasswordHashBusy:
+            flash('The system is busy signing other users in. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html'), 503
+
+        if password_ok:
             if not user.is_active:
                 flash('Your account has been deactivated. Contact administrator.', 'danger')
                 return render_template('auth/login.html')
 
             login_user(user, remember=remember)
+            db.session.commit()  # saves an upgraded password hash, if any
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.full_name}!', 'success')
             return redirect(next_page or url_for('main.dashboard'))
@@ -74,7 +85,11 @@ def register():
             phone=phone,
             role=role
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHashBusy:
+            flash('The system is busy. Please try registering again in a moment.', 'warning')
+            return render_template('auth/register.html'), 503
 
         db.session.add(user)
         db.session.commit()
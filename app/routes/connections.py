@@ -1,11 +1,14 @@
 """
 Connection management routes
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from app.models import Connection, Customer
+from app.models import Connection, Customer, OutageBroadcast
 from app import db
 from app.utils.decorators import role_required
+from app.utils.db_routing import replica_reads
+from app.utils.http_cache import cache_policy
+from app.utils.broadcasts import create_broadcast
 from datetime import datetime
 
 connections_bp = Blueprint('connections', __name__)
@@ -13,6 +16,7 @@ connections_bp = Blueprint('connections', __name__)
 
 @connections_bp.route('/')
 @login_required
+@replica_reads
 def list_connections():
     """List all connections"""
     page = request.args.get('page', 1, type=int)
@@ -107,4 +111,47 @@ def update_status(connection_id):
     return redirect(url_for('connections.view_connection', connection_id=connection_id))
 
 
+@connections_bp.route('/broadcasts', methods=['GET', 'POST'])
+@login_required
+@role_required('admin', 'manager')
+def broadcasts():
+    """Send an outage notice to every customer behind a feeder or transformer"""
+    if request.method == 'POST':
+        try:
+            broadcast = create_broadcast(
+                request.form.get('scope_type', ''),
+                request.form.get('scope_value', '').strip(),
+                request.form.get('title', '').strip(),
+                request.form.get('message', '').strip(),
+                request.form.get('notification_type', 'alert'),
+                current_user.user_id
+            )
+        except ValueError as e:
+            flash(str(e), 'danger')
+        else:
+            flash('Outage broadcast queued.', 'success')
+            return redirect(url_for('connections.view_broadcast', broadcast_id=broadcast.broadcast_id))
+
+    recent = OutageBroadcast.query.order_by(OutageBroadcast.broadcast_id.desc()).limit(20).all()
+    return render_template('connections/broadcasts.html', broadcasts=recent)
+
+
+@connections_bp.route('/broadcasts/<int:broadcast_id>')
+@login_required
+@role_required('admin', 'manager')
+def view_broadcast(broadcast_id):
+    """Progress of an outage broadcast"""
+    broadcast = OutageBroadcast.query.get_or_404(broadcast_id)
+    return render_template('connections/broadcast.html', broadcast=broadcast)
+
+
+@connections_bp.route('/broadcasts/<int:broadcast_id>/status')
+@login_required
+@role_required('admin', 'manager')
+@cache_policy(no_store=True)
+def broadcast_status(broadcast_id):
+    """API endpoint for polling a broadcast's progress"""
+    return jsonify(OutageBroadcast.query.get_or_404(broadcast_id).to_dict())
+
+
 from app.models import Fault
\ No newline at end of file
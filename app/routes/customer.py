@@ -3,9 +3,12 @@ Customer Portal Routes
 All routes for the customer-facing portal
 """
 from flask import Blueprint, render_template, redirect, url_for, flash, request, g
-from app.models import Customer, Connection, Fault, FaultUpdate, ServiceRequest, Notification, CustomerMessage, User
+from app.models import (Customer, Connection, Fault, FaultUpdate, ServiceRequest, Notification, CustomerMessage,
+                        MessageThread, User)
 from app import db
 from app.utils.customer_auth import login_customer, logout_customer, customer_login_required, get_current_customer
+from app.utils.passwords import PasswordHashBusy
+from app.utils.rate_limit import rate_limit
 from datetime import datetime
 
 customer_bp = Blueprint('customer', __name__)
@@ -16,6 +19,8 @@ customer_bp = Blueprint('customer', __name__)
 # ============================================
 
 @customer_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('20/minute', by='ip')
+@rate_limit('5/minute', by='form:account_number')
 def login():
     """Customer login page"""
     # If already logged in, redirect to dashboard
@@ -28,7 +33,13 @@ def login():
 
         customer = Customer.query.filter_by(account_number=account_number).first()
 
-        if customer and customer.portal_registered and customer.check_password(password):
+        try:
+            password_ok = customer is not None and customer.portal_registered and customer.check_password(password)
+        except PasswordHashBusy:
+            flash('The portal is busy signing other customers in. Please try again in a moment.', 'warning')
+            return render_template('customer/login.html'), 503
+
+        if password_ok:
             if not customer.is_active:
                 flash('Your account has been deactivated. Please contact support.', 'danger')
                 return render_template('customer/login.html')
@@ -47,6 +58,8 @@ def login():
 
 
 @customer_bp.route('/register', methods=['GET', 'POST'])
+@rate_limit('10/hour', by='ip')
+@rate_limit('5/hour', by='form:account_number')
 def register():
     """Portal registration for existing customers"""
     if get_current_customer():
@@ -77,7 +90,11 @@ def register():
             flash('Password must be at least 6 characters long.', 'danger')
         else:
             # Register the customer
-            customer.set_password(password)
+            try:
+                customer.set_password(password)
+            except PasswordHashBusy:
+                flash('The portal is busy. Please try registering again in a moment.', 'warning')
+                return render_template('customer/register.html'), 503
             customer.portal_registered = True
             try:
                 db.session.commit()
@@ -112,7 +129,7 @@ def dashboard():
     active_connections = customer.connections.filter_by(connection_status='active').count()
     pending_faults = customer.reported_faults.filter(Fault.status.notin_(['resolved', 'closed'])).count()
     pending_requests = customer.service_requests.filter(ServiceRequest.status.notin_(['completed', 'rejected'])).count()
-    unread_notifications = Notification.query.filter_by(customer_id=customer.customer_id, is_read=False).count()
+    unread_notifications = customer.unread_notifications().count()
 
     # Recent faults
     recent_faults = customer.reported_faults.order_by(Fault.reported_date.desc()).limit(5).all()
@@ -187,6 +204,8 @@ def my_faults():
 
 
 @customer_bp.route('/faults/report', methods=['GET', 'POST'])
+@rate_limit('30/hour', by='ip')
+@rate_limit('10/hour', by='customer')
 @customer_login_required
 def report_fault():
     """Report a new fault"""
@@ -363,15 +382,14 @@ def support():
     customer = g.customer
     page = request.args.get('page', 1, type=int)
 
-    # Get top-level messages (threads)
-    messages = CustomerMessage.query.filter_by(
-        customer_id=customer.customer_id,
-        parent_message_id=None
-    ).order_by(CustomerMessage.created_at.desc()).paginate(
+    # Threads come straight off idx_thread_customer_activity, most recent activity first
+    threads = MessageThread.query.filter_by(
+        customer_id=customer.customer_id
+    ).order_by(MessageThread.last_activity_at.desc()).paginate(
         page=page, per_page=10, error_out=False
     )
 
-    return render_template('customer/support.html', messages=messages, customer=customer)
+    return render_template('customer/support.html', threads=threads, customer=customer)
 
 
 @customer_bp.route('/support/new', methods=['GET', 'POST'])
@@ -393,6 +411,8 @@ def new_message():
 
         try:
             db.session.add(message)
+            db.session.flush()
+            db.session.add(MessageThread.start(message))
             db.session.commit()
             flash('Message sent to customer service!', 'success')
             return redirect(url_for('customer.view_message', message_id=message.message_id))
@@ -409,25 +429,21 @@ def view_message(message_id):
     """View message thread"""
     customer = g.customer
 
-    # Get the top-level message
-    message = CustomerMessage.query.filter_by(
-        message_id=message_id,
-        customer_id=customer.customer_id,
-        parent_message_id=None
+    # Thread summary and its top-level message in one query
+    thread = MessageThread.query.filter_by(
+        thread_id=message_id,
+        customer_id=customer.customer_id
     ).first_or_404()
+    message = thread.root
 
-    # Mark unread replies as read
-    unread_replies = CustomerMessage.query.filter_by(
-        parent_message_id=message_id,
-        is_from_customer=False,
-        is_read=False
-    ).all()
-    for reply in unread_replies:
-        reply.is_read = True
-    db.session.commit()
+    replies = CustomerMessage.query.filter_by(
+        parent_message_id=message_id
+    ).order_by(CustomerMessage.created_at.asc()).all()
 
-    # Get all replies
-    replies = message.replies.order_by(CustomerMessage.created_at.asc()).all()
+    # Mark unread replies as read in a single UPDATE, only when there is something to mark
+    if thread.unread_for_customer:
+        thread.mark_read(by_customer=True)
+        db.session.commit()
 
     return render_template('customer/view_message.html', message=message, replies=replies, customer=customer)
 
@@ -439,11 +455,11 @@ def reply_message(message_id):
     customer = g.customer
 
     # Verify original message belongs to customer
-    original = CustomerMessage.query.filter_by(
-        message_id=message_id,
-        customer_id=customer.customer_id,
-        parent_message_id=None
+    thread = MessageThread.query.filter_by(
+        thread_id=message_id,
+        customer_id=customer.customer_id
     ).first_or_404()
+    original = thread.root
 
     message_text = request.form.get('message')
 
@@ -456,7 +472,9 @@ def reply_message(message_id):
     )
 
     try:
+        reply.created_at = datetime.utcnow()
         db.session.add(reply)
+        MessageThread.record_reply(reply)
         db.session.commit()
         flash('Reply sent!', 'success')
     except Exception as e:
@@ -477,20 +495,42 @@ def notifications():
     customer = g.customer
     page = request.args.get('page', 1, type=int)
 
+    # Watermark as it was before this view, so the page still highlights what was new
+    read_through = customer.notifications_watermark
+
     notifications_list = Notification.query.filter_by(
         customer_id=customer.customer_id
     ).order_by(Notification.created_at.desc()).paginate(
         page=page, per_page=20, error_out=False
     )
 
-    # Mark all as read
-    Notification.query.filter_by(
-        customer_id=customer.customer_id,
-        is_read=False
-    ).update({'is_read': True})
-    db.session.commit()
+    # Advance the read watermark (one row, at most one write) instead of rewriting every unread notification
+    if customer.advance_notifications_watermark():
+        db.session.commit()
+
+    return render_template('customer/notifications.html', notifications=notifications_list, customer=customer,
+                           read_through=read_through)
+
+
+@customer_bp.route('/notifications/<int:notification_id>/read', methods=['POST'])
+@customer_login_required
+def mark_notification_read(notification_id):
+    """Explicitly mark a single notification as read"""
+    customer = g.customer
+    notification = Notification.query.filter_by(
+        notification_id=notification_id,
+        customer_id=customer.customer_id
+    ).first_or_404()
 
-    return render_template('customer/notifications.html', notifications=notifications_list, customer=customer)
+    if not notification.is_read:
+        notification.is_read = True
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error updating notification: {str(e)}', 'danger')
+
+    return redirect(request.referrer or url_for('customer.notifications'))
 
 
 # ============================================
@@ -539,19 +579,22 @@ def change_password():
     new_password = request.form.get('new_password')
     confirm_password = request.form.get('confirm_password')
 
-    if not customer.check_password(current_password):
-        flash('Current password is incorrect.', 'danger')
-    elif new_password != confirm_password:
-        flash('New passwords do not match.', 'danger')
-    elif len(new_password) < 6:
-        flash('New password must be at least 6 characters long.', 'danger')
-    else:
-        customer.set_password(new_password)
-        try:
-            db.session.commit()
-            flash('Password changed successfully!', 'success')
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error changing password: {str(e)}', 'danger')
+    try:
+        if not customer.check_password(current_password):
+            flash('Current password is incorrect.', 'danger')
+        elif new_password != confirm_password:
+            flash('New passwords do not match.', 'danger')
+        elif len(new_password) < 6:
+            flash('New password must be at least 6 characters long.', 'danger')
+        else:
+            customer.set_password(new_password)
+            try:
+                db.session.commit()
+                flash('Password changed successfully!', 'success')
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error changing password: {str(e)}', 'danger')
+    except PasswordHashBusy:
+        flash('The portal is busy. Please try changing your password again in a moment.', 'warning')
 
     return redirect(url_for('customer.profile'))
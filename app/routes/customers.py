@@ -6,12 +6,14 @@ from flask_login import login_required, current_user
 from app.models import Customer, Connection
 from app import db
 from app.utils.decorators import role_required
+from app.utils.db_routing import replica_reads
 
 customers_bp = Blueprint('customers', __name__)
 
 
 @customers_bp.route('/')
 @login_required
+@replica_reads
 def list_customers():
     """List all customers"""
     page = request.args.get('page', 1, type=int)
@@ -6,6 +6,13 @@ from flask_login import login_required, current_user
 from app.models import Fault, FaultUpdate, Connection, Customer, User, Notification
 from app import db
 from app.utils.decorators import role_required
+from app.utils.db_routing import replica_reads
+from app.utils.http_cache import cache_policy
+from app.utils.fault_timeline import status_periods, get_timeline_engine
+from app.utils.bulk_faults import resolve_faults, BulkSelectionError
+from app.utils.fault_facets import fault_facets, technician_scope
+from app.utils.technician_stats import technician_stats
+from app.utils.topology import locate_failures, reporting_connections
 from datetime import datetime
 
 faults_bp = Blueprint('faults', __name__)
@@ -13,6 +20,7 @@ faults_bp = Blueprint('faults', __name__)
 
 @faults_bp.route('/')
 @login_required
+@replica_reads
 def list_faults():
     """List all faults"""
     page = request.args.get('page', 1, type=int)
@@ -30,17 +38,16 @@ def list_faults():
         query = query.filter_by(fault_type=fault_type)
 
     # For technicians, show only assigned faults
-    if current_user.role == 'technician':
-        query = query.filter(
-            (Fault.assigned_to == current_user.user_id) |
-            (Fault.status == 'reported')
-        )
+    technician_id = current_user.user_id if current_user.role == 'technician' else None
+    if technician_id is not None:
+        query = query.filter(technician_scope(technician_id))
 
     faults = query.order_by(Fault.reported_date.desc()).paginate(
         page=page, per_page=10, error_out=False
     )
+    facets = fault_facets({'status': status, 'severity': severity, 'fault_type': fault_type}, technician_id)
 
-    return render_template('faults/list.html', faults=faults,
+    return render_template('faults/list.html', faults=faults, facets=facets,
                            status=status, severity=severity, fault_type=fault_type)
 
 
@@ -95,8 +102,63 @@ def view_fault(fault_id):
     fault = Fault.query.get_or_404(fault_id)
     updates = fault.updates.order_by(FaultUpdate.update_date.desc()).all()
     technicians = User.query.filter_by(role='technician', is_active=True).all()
+    workload = technician_stats([tech.user_id for tech in technicians])
+
+    # Time spent in each status, derived from the already loaded updates
+    periods = status_periods(fault.reported_date, updates)
+
+    return render_template('faults/view.html', fault=fault, updates=updates, technicians=technicians,
+                           periods=periods, workload=workload)
+
+
+@faults_bp.route('/api/status-as-of')
+@login_required
+@role_required('admin', 'manager')
+@cache_policy(max_age=30)
+def status_as_of():
+    """API endpoint for fleet-wide fault status counts at a point in time"""
+    try:
+        at = datetime.fromisoformat(request.args['at'].replace('Z', '+00:00')) if request.args.get('at') \
+            else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'Invalid timestamp, expected ISO format (YYYY-MM-DDTHH:MM)'}), 400
+    if at.tzinfo is not None:
+        at = (at - at.utcoffset()).replace(tzinfo=None)  # the timeline holds naive UTC times
+
+    counts = get_timeline_engine().status_counts_as_of(at)
+    open_faults = sum(n for status, n in counts.items() if status not in ('resolved', 'closed'))
+
+    return jsonify({'at': at.isoformat(), 'counts': counts, 'open': open_faults})
+
 
-    return render_template('faults/view.html', fault=fault, updates=updates, technicians=technicians)
+@faults_bp.route('/api/localize', methods=['GET', 'POST'])
+@login_required
+@role_required('admin', 'manager')
+def localize_faults():
+    """
+    API endpoint ranking the feeders and transformers most likely behind current reports
+
+    POST {"connection_ids": [...]} ranks those connections; GET uses the connections of
+    open faults reported in the last `hours` (TOPOLOGY_WINDOW_HOURS).
+    """
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        connection_ids = data.get('connection_ids')
+        if not isinstance(connection_ids, list) or not all(isinstance(c, int) for c in connection_ids):
+            return jsonify({'error': 'connection_ids must be a list of connection IDs'}), 400
+    else:
+        connection_ids = reporting_connections(request.args.get('hours', type=int))
+
+    return jsonify(locate_failures(connection_ids, limit))
+
+
+@faults_bp.route('/<int:fault_id>/timeline')
+@login_required
+def fault_timeline(fault_id):
+    """API endpoint for a single fault's replayed status timeline"""
+    Fault.query.get_or_404(fault_id)
+    return jsonify({'fault_id': fault_id, 'events': get_timeline_engine().timeline(fault_id)})
 
 
 @faults_bp.route('/<int:fault_id>/assign', methods=['POST'])
@@ -156,8 +218,11 @@ def update_fault_status(fault_id):
     fault.status = new_status
 
     if new_status in ['resolved', 'closed']:
-        fault.resolution_date = datetime.utcnow()
+        # Keep the original resolution time when a resolved fault is later closed
+        fault.resolution_date = fault.resolution_date or datetime.utcnow()
         fault.resolution_notes = notes
+    else:
+        fault.resolution_date = None  # reopened: the next resolution is timed afresh
 
     # Log the update
     update = FaultUpdate(
@@ -180,6 +245,37 @@ def update_fault_status(fault_id):
     return redirect(url_for('faults.view_fault', fault_id=fault_id))
 
 
+@faults_bp.route('/bulk-resolve', methods=['POST'])
+@login_required
+@role_required('admin', 'manager')
+def bulk_resolve():
+    """Resolve every open fault behind restored equipment (transformer, feeder, incident or ID list)"""
+    selector = request.form.get('selector', '')
+    value = request.form.get('value', '').strip()
+    status = request.form.get('status', 'resolved')
+    notes = request.form.get('notes', '')
+
+    try:
+        if not value:
+            raise BulkSelectionError('Enter the equipment, incident or fault IDs to resolve')
+        if selector == 'ids':
+            value = [int(part) for part in value.replace(',', ' ').split()]
+        elif selector == 'incident':
+            value = int(value)
+        summary = resolve_faults(selector, value, current_user.user_id, status=status, notes=notes)
+    except ValueError as e:
+        # BulkSelectionError, or an ID that is not a number
+        flash(str(e) if isinstance(e, BulkSelectionError) else 'IDs must be numbers', 'danger')
+        return redirect(url_for('faults.list_faults'))
+    except Exception as e:
+        flash(f'Error resolving faults: {str(e)}', 'danger')
+        return redirect(url_for('faults.list_faults'))
+
+    flash(f"{summary['resolved']} of {summary['matched']} faults marked {status}; "
+          f"{summary['notified']} customers notified.", 'success')
+    return redirect(url_for('faults.list_faults'))
+
+
 @faults_bp.route('/<int:fault_id>/add-note', methods=['POST'])
 @login_required
 def add_fault_note(fault_id):
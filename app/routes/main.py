@@ -1,9 +1,11 @@
 """
 Main routes for Kenya Power Management System
 """
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, jsonify, current_app
 from flask_login import login_required, current_user
 from app.models import Customer, Connection, Fault, MaintenanceSchedule, ServiceRequest
+from app.utils.decorators import role_required
+from app.utils.http_cache import cache_policy
 from sqlalchemy import func
 from datetime import datetime, timedelta
 
@@ -46,4 +48,13 @@ def dashboard():
     return render_template('dashboard.html',
                            stats=stats,
                            recent_faults=recent_faults,
-                           upcoming_maintenance=upcoming_maintenance)
\ No newline at end of file
+                           upcoming_maintenance=upcoming_maintenance)
+
+
+@main_bp.route('/api/audit/stats')
+@login_required
+@role_required('admin')
+@cache_policy(no_store=True)
+def audit_stats():
+    """Audit writer queue depth and batch latency metrics"""
+    return jsonify(current_app.extensions['audit_writer'].stats())
@@ -1,18 +1,49 @@
 """
 Maintenance scheduling and management routes
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import csv
+import heapq
+import io
+from itertools import islice
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort
 from flask_login import login_required, current_user
-from app.models import MaintenanceSchedule, MaintenanceLog, User, Notification
+from flask_sqlalchemy.pagination import Pagination
+from app.models import MaintenanceSchedule, MaintenanceSeries, MaintenanceLog, User, Notification
 from app import db
 from app.utils.decorators import role_required
-from datetime import datetime, timedelta
+from app.utils.db_routing import replica_reads
+from app.utils.http_cache import cache_policy
+from app.utils.crew_calendar import describe, get_crew_calendar, maintenance_slot, slot_hours
+from app.utils.technician_stats import technician_stats
+from app.utils.recurrence import (Occurrence, create_series, is_occurrence, materialize_occurrence,
+                                  occurrences_between, parse_rule)
+from datetime import date, datetime, timedelta
 
 maintenance_bp = Blueprint('maintenance', __name__)
 
 
+class _MergedPagination(Pagination):
+    """Pages through date-ordered schedule rows merged with generated occurrences"""
+
+    def __init__(self, query, occurrences, page, per_page):
+        self._query = query
+        self._occurrences = occurrences
+        super().__init__(page=page, per_page=per_page, error_out=False)
+
+    def _query_items(self):
+        # Only the rows up to the end of this page can land on it
+        end = self.page * self.per_page
+        merged = heapq.merge(self._query.limit(end).all(), self._occurrences, key=lambda s: s.scheduled_date)
+        return list(islice(merged, end - self.per_page, end))
+
+    def _query_count(self):
+        return self._query.order_by(None).count() + len(self._occurrences)
+
+
 @maintenance_bp.route('/')
 @login_required
+@replica_reads
 def list_maintenance():
     """List all maintenance schedules"""
     page = request.args.get('page', 1, type=int)
@@ -27,11 +58,20 @@ def list_maintenance():
         query = query.filter_by(maintenance_type=maintenance_type)
 
     # For technicians, show only assigned maintenance
-    if current_user.role == 'technician':
-        query = query.filter_by(assigned_to=current_user.user_id)
-
-    schedules = query.order_by(MaintenanceSchedule.scheduled_date.asc()).paginate(
-        page=page, per_page=10, error_out=False
+    assigned_to = current_user.user_id if current_user.role == 'technician' else None
+    if assigned_to:
+        query = query.filter_by(assigned_to=assigned_to)
+
+    # Upcoming visits of recurring series are generated for the list window, not stored
+    occurrences = []
+    if status in ('', 'scheduled'):
+        today = date.today()
+        horizon = today + timedelta(days=current_app.config.get('RECURRENCE_LIST_DAYS', 90))
+        occurrences = occurrences_between(today, horizon, assigned_to=assigned_to, maintenance_type=maintenance_type)
+
+    schedules = _MergedPagination(
+        query.order_by(MaintenanceSchedule.scheduled_date.asc(), MaintenanceSchedule.maintenance_id),
+        occurrences, page=page, per_page=10
     )
 
     return render_template('maintenance/list.html', schedules=schedules,
@@ -47,6 +87,8 @@ def calendar():
 
 @maintenance_bp.route('/api/events')
 @login_required
+@replica_reads
+@cache_policy(max_age=60)
 def get_events():
     """API endpoint for calendar events"""
     start = request.args.get('start')
@@ -57,8 +99,9 @@ def get_events():
         MaintenanceSchedule.scheduled_date <= end
     )
 
-    if current_user.role == 'technician':
-        query = query.filter_by(assigned_to=current_user.user_id)
+    assigned_to = current_user.user_id if current_user.role == 'technician' else None
+    if assigned_to:
+        query = query.filter_by(assigned_to=assigned_to)
 
     schedules = query.all()
 
@@ -80,6 +123,22 @@ def get_events():
             'url': url_for('maintenance.view_maintenance', maintenance_id=schedule.maintenance_id)
         })
 
+    # Recurring series are expanded for the requested window only
+    try:
+        window = date.fromisoformat(start[:10]), date.fromisoformat(end[:10])
+    except (TypeError, ValueError):
+        window = None
+    if window:
+        for occurrence in occurrences_between(*window, assigned_to=assigned_to):
+            day = occurrence.occurrence_date.isoformat()
+            events.append({
+                'id': f's{occurrence.series_id}-{day}',
+                'title': occurrence.title,
+                'start': day,
+                'backgroundColor': colors['scheduled'],
+                'url': url_for('maintenance.view_occurrence', series_id=occurrence.series_id, occurrence_date=day)
+            })
+
     return jsonify(events)
 
 
@@ -87,8 +146,12 @@ def get_events():
 @login_required
 @role_required('admin', 'manager')
 def schedule_maintenance():
-    """Schedule new maintenance"""
+    """Schedule new maintenance (one visit, or a recurring series)"""
+    if request.method == 'POST' and _recurrence_rule():
+        return _schedule_series()
+
     if request.method == 'POST':
+        scheduled_date, scheduled_time = _requested_slot()
         schedule = MaintenanceSchedule(
             title=request.form.get('title'),
             description=request.form.get('description'),
@@ -97,9 +160,8 @@ def schedule_maintenance():
             equipment_id=request.form.get('equipment_id'),
             location_description=request.form.get('location_description'),
             location_coordinates=request.form.get('location_coordinates'),
-            scheduled_date=datetime.strptime(request.form.get('scheduled_date'), '%Y-%m-%d').date(),
-            scheduled_time=datetime.strptime(request.form.get('scheduled_time'), '%H:%M').time() if request.form.get(
-                'scheduled_time') else None,
+            scheduled_date=scheduled_date,
+            scheduled_time=scheduled_time,
             estimated_duration=request.form.get('estimated_duration'),
             assigned_team=request.form.get('assigned_team'),
             assigned_to=request.form.get('assigned_to') or None,
@@ -107,6 +169,11 @@ def schedule_maintenance():
             created_by=current_user.user_id
         )
 
+        clash = _double_booking(schedule.assigned_to, [
+            maintenance_slot(schedule.scheduled_date, schedule.scheduled_time, schedule.estimated_duration)])
+        if clash:
+            return clash
+
         try:
             db.session.add(schedule)
             db.session.commit()
@@ -130,8 +197,233 @@ def schedule_maintenance():
             db.session.rollback()
             flash(f'Error scheduling maintenance: {str(e)}', 'danger')
 
+    return _schedule_form()
+
+
+def _schedule_form(**context):
+    """The schedule form, with each technician's current workload beside their name"""
     technicians = User.query.filter_by(role='technician', is_active=True).all()
-    return render_template('maintenance/schedule.html', technicians=technicians)
+    return render_template('maintenance/schedule.html', technicians=technicians,
+                           workload=technician_stats([tech.user_id for tech in technicians]), **context)
+
+
+def _requested_slot():
+    """(date, time) from the schedule form, or the suggested free slot the user picked instead"""
+    if request.form.get('suggested_slot'):
+        suggested = datetime.fromisoformat(request.form['suggested_slot'])
+        return suggested.date(), suggested.time()
+    return (datetime.strptime(request.form.get('scheduled_date'), '%Y-%m-%d').date(),
+            datetime.strptime(request.form.get('scheduled_time'), '%H:%M').time() if request.form.get(
+                'scheduled_time') else None)
+
+
+def _double_booking(technician_id, slots):
+    """
+    Re-show the schedule form if the technician is already booked during any of the
+    (start, end) slots, with the clashes and the next free slot; None when clear or
+    when the user chose to book anyway
+    """
+    if not technician_id or request.form.get('allow_overlap'):
+        return None
+    crew = get_crew_calendar()
+    for start, end in slots:
+        conflicts = crew.conflicts(int(technician_id), start, end)
+        if conflicts:
+            flash(f"The technician is already booked: {', '.join(describe(b) for b in conflicts)}", 'warning')
+            return _schedule_form(conflicts=conflicts,
+                                  suggestion=crew.next_free_slot(int(technician_id), start, slot_hours(start, end)))
+    return None
+
+
+def _recurrence_rule():
+    """RRULE text from the schedule form: the advanced rule field, or built from the repeat fields"""
+    rule = (request.form.get('rrule') or '').strip()
+    repeat = request.form.get('repeat', '')
+    if rule or not repeat:
+        return rule
+    rule = f"FREQ={repeat};INTERVAL={request.form.get('repeat_interval') or 1}"
+    if request.form.get('repeat_count'):
+        rule += f";COUNT={request.form['repeat_count']}"
+    elif request.form.get('repeat_until'):
+        rule += f";UNTIL={request.form['repeat_until'].replace('-', '')}"
+    return rule
+
+
+def _schedule_series():
+    """Create a recurring series; its visits are generated on demand, not inserted"""
+    dtstart, scheduled_time = _requested_slot()
+    try:
+        series = create_series(
+            _recurrence_rule(),
+            dtstart,
+            title=request.form.get('title'),
+            description=request.form.get('description'),
+            maintenance_type=request.form.get('maintenance_type'),
+            equipment_type=request.form.get('equipment_type'),
+            equipment_id=request.form.get('equipment_id'),
+            location_description=request.form.get('location_description'),
+            location_coordinates=request.form.get('location_coordinates'),
+            scheduled_time=scheduled_time,
+            estimated_duration=request.form.get('estimated_duration'),
+            assigned_team=request.form.get('assigned_team'),
+            assigned_to=request.form.get('assigned_to') or None,
+            priority=request.form.get('priority', 'medium'),
+            created_by=current_user.user_id
+        )
+        # Check the visits in the list window; the pending series itself must not be flushed into the check
+        horizon = series.dtstart + timedelta(days=current_app.config.get('RECURRENCE_LIST_DAYS', 90))
+        with db.session.no_autoflush:
+            clash = _double_booking(series.assigned_to, [
+                maintenance_slot(day, series.scheduled_time, series.estimated_duration)
+                for day in parse_rule(series.rrule).occurrences(series.dtstart, series.dtstart, horizon, series.until)
+            ])
+        if clash:
+            db.session.rollback()
+            return clash
+        db.session.flush()
+        if series.assigned_to:
+            db.session.add(Notification(
+                user_id=series.assigned_to,
+                title='New Recurring Maintenance',
+                message=f'You have been assigned recurring maintenance: {series.title} ({series.rrule}) '
+                        f'starting {series.dtstart}',
+                notification_type='maintenance_reminder',
+                reference_type='maintenance_series',
+                reference_id=series.series_id
+            ))
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(f'Invalid repeat rule: {str(e)}', 'danger')
+        return redirect(url_for('maintenance.schedule_maintenance'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error scheduling maintenance: {str(e)}', 'danger')
+        return redirect(url_for('maintenance.schedule_maintenance'))
+
+    flash('Recurring maintenance scheduled successfully!', 'success')
+    return redirect(url_for('maintenance.calendar'))
+
+
+def _read_plan(upload):
+    """
+    Rows of an uploaded plan CSV as schedule fields (with their 'row' number), and
+    {row number: message} for rows that could not be read
+    """
+    technicians = {user.username: user.user_id for user in User.query.filter_by(role='technician', is_active=True)}
+    rows, errors = [], {}
+    reader = csv.DictReader(io.StringIO(upload.read().decode('utf-8-sig')))
+    for number, line in enumerate(reader, start=1):
+        line = {key.strip(): (value or '').strip() for key, value in line.items() if key}
+        try:
+            if not line.get('title') or not line.get('location_description'):
+                raise ValueError('title and location_description are required')
+            if line.get('technician') and line['technician'] not in technicians:
+                raise ValueError(f"unknown technician {line['technician']}")
+            rows.append({
+                'row': number,
+                'title': line['title'],
+                'description': line.get('description') or None,
+                'maintenance_type': line.get('maintenance_type') or 'preventive',
+                'equipment_type': line.get('equipment_type') or 'other',
+                'equipment_id': line.get('equipment_id') or None,
+                'location_description': line['location_description'],
+                'scheduled_date': date.fromisoformat(line.get('scheduled_date', '')),
+                'scheduled_time': datetime.strptime(line['scheduled_time'], '%H:%M').time() if line.get(
+                    'scheduled_time') else None,
+                'estimated_duration': int(line['estimated_duration']) if line.get('estimated_duration') else None,
+                'assigned_to': technicians.get(line.get('technician')),
+                'priority': line.get('priority') or 'medium',
+            })
+        except ValueError as e:
+            errors[number] = str(e)
+    return rows, errors
+
+
+@maintenance_bp.route('/import-plan', methods=['GET', 'POST'])
+@login_required
+@role_required('admin', 'manager')
+def import_plan():
+    """Check an uploaded maintenance plan against the crew calendar; import it only if every row is clear"""
+    if request.method == 'GET':
+        return render_template('maintenance/import_plan.html', report=None)
+
+    upload = request.files.get('plan')
+    if not upload or not upload.filename:
+        flash('Choose a plan CSV file to upload', 'danger')
+        return redirect(url_for('maintenance.import_plan'))
+
+    rows, errors = _read_plan(upload)
+    checks = {check['row']: check for check in get_crew_calendar().validate_plan(rows)}
+    report = sorted([{'row': number, 'error': message} for number, message in errors.items()] + [
+        dict(checks[row['row']], title=row['title'], conflicts=[describe(b) for b in checks[row['row']]['conflicts']])
+        for row in rows
+    ], key=lambda entry: entry['row'])
+    clear = bool(rows) and not errors and not any(entry['conflicts'] for entry in report)
+
+    if clear and request.form.get('import'):
+        try:
+            schedules = [MaintenanceSchedule(created_by=current_user.user_id,
+                                             **{k: v for k, v in row.items() if k != 'row'}) for row in rows]
+            db.session.add_all(schedules)
+            db.session.flush()
+            db.session.add_all([Notification(
+                user_id=schedule.assigned_to,
+                title='New Maintenance Assignment',
+                message=f'You have been assigned maintenance: {schedule.title} scheduled for {schedule.scheduled_date}',
+                notification_type='maintenance_reminder',
+                reference_type='maintenance',
+                reference_id=schedule.maintenance_id
+            ) for schedule in schedules if schedule.assigned_to])
+            db.session.commit()
+            flash(f'Imported {len(schedules)} maintenance visits', 'success')
+            return redirect(url_for('maintenance.list_maintenance'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error importing plan: {str(e)}', 'danger')
+    elif request.form.get('import'):
+        flash('Nothing was imported: fix the rows marked below and upload the plan again', 'warning')
+
+    return render_template('maintenance/import_plan.html', report=report, clear=clear)
+
+
+def _occurrence_or_404(series_id, occurrence_date):
+    series = MaintenanceSeries.query.get_or_404(series_id)
+    try:
+        day = date.fromisoformat(occurrence_date)
+    except ValueError:
+        abort(404)
+    if not is_occurrence(series, day):
+        abort(404)
+    return series, day
+
+
+@maintenance_bp.route('/series/<int:series_id>/<occurrence_date>')
+@login_required
+def view_occurrence(series_id, occurrence_date):
+    """View one visit of a recurring series (the stored row, once it has one)"""
+    series, day = _occurrence_or_404(series_id, occurrence_date)
+    schedule = MaintenanceSchedule.query.filter_by(series_id=series_id, occurrence_date=day).first()
+    if schedule is not None:
+        return redirect(url_for('maintenance.view_maintenance', maintenance_id=schedule.maintenance_id))
+    return render_template('maintenance/view.html', schedule=Occurrence(series, day), logs=[])
+
+
+@maintenance_bp.route('/series/<int:series_id>/<occurrence_date>/update-status', methods=['POST'])
+@login_required
+def update_occurrence_status(series_id, occurrence_date):
+    """Start, complete, cancel or postpone one visit of a series, storing it as a schedule row"""
+    schedule = materialize_occurrence(*_occurrence_or_404(series_id, occurrence_date))
+    return _update_status(schedule)
+
+
+@maintenance_bp.route('/series/<int:series_id>/<occurrence_date>/log', methods=['POST'])
+@login_required
+@role_required('admin', 'manager', 'technician')
+def add_occurrence_log(series_id, occurrence_date):
+    """Log work on one visit of a series, storing it as a schedule row"""
+    schedule = materialize_occurrence(*_occurrence_or_404(series_id, occurrence_date))
+    return _add_log(schedule)
 
 
 @maintenance_bp.route('/<int:maintenance_id>')
@@ -148,7 +440,10 @@ def view_maintenance(maintenance_id):
 @login_required
 def update_maintenance_status(maintenance_id):
     """Update maintenance status"""
-    schedule = MaintenanceSchedule.query.get_or_404(maintenance_id)
+    return _update_status(MaintenanceSchedule.query.get_or_404(maintenance_id))
+
+
+def _update_status(schedule):
     new_status = request.form.get('status')
 
     schedule.status = new_status
@@ -163,8 +458,17 @@ def update_maintenance_status(maintenance_id):
     except Exception as e:
         db.session.rollback()
         flash(f'Error updating status: {str(e)}', 'danger')
+        return _back_to(schedule)
+
+    return redirect(url_for('maintenance.view_maintenance', maintenance_id=schedule.maintenance_id))
 
-    return redirect(url_for('maintenance.view_maintenance', maintenance_id=maintenance_id))
+
+def _back_to(schedule):
+    """After a failed write: the stored row if it survived the rollback, else the generated occurrence"""
+    if schedule.series_id and db.inspect(schedule).transient:
+        return redirect(url_for('maintenance.view_occurrence', series_id=schedule.series_id,
+                                occurrence_date=schedule.occurrence_date.isoformat()))
+    return redirect(url_for('maintenance.view_maintenance', maintenance_id=schedule.maintenance_id))
 
 
 @maintenance_bp.route('/<int:maintenance_id>/log', methods=['POST'])
@@ -172,10 +476,12 @@ def update_maintenance_status(maintenance_id):
 @role_required('admin', 'manager', 'technician')
 def add_maintenance_log(maintenance_id):
     """Add maintenance log entry"""
-    schedule = MaintenanceSchedule.query.get_or_404(maintenance_id)
+    return _add_log(MaintenanceSchedule.query.get_or_404(maintenance_id))
+
 
+def _add_log(schedule):
     log = MaintenanceLog(
-        maintenance_id=maintenance_id,
+        maintenance_id=schedule.maintenance_id,
         logged_by=current_user.user_id,
         work_performed=request.form.get('work_performed'),
         parts_used=request.form.get('parts_used'),
@@ -191,8 +497,9 @@ def add_maintenance_log(maintenance_id):
     except Exception as e:
         db.session.rollback()
         flash(f'Error adding log: {str(e)}', 'danger')
+        return _back_to(schedule)
 
-    return redirect(url_for('maintenance.view_maintenance', maintenance_id=maintenance_id))
+    return redirect(url_for('maintenance.view_maintenance', maintenance_id=schedule.maintenance_id))
 
 
 from flask import jsonify
\ No newline at end of file
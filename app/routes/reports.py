@@ -2,17 +2,29 @@
 """
 Performance reporting routes
 """
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, g
 from flask_login import login_required, current_user
-from app.models import Fault, MaintenanceSchedule, Customer, Connection, ServiceRequest
+from app.models import Fault, MaintenanceSchedule, Customer, Connection, ServiceRequest, MttrStat, ReportJob
 from app import db
 from app.utils.decorators import role_required
+from app.utils.http_cache import cache_policy
+from app.utils.report_cache import get_report_cache, normalize_range, range_bounds
+from app.utils.report_jobs import enqueue_report
+from app.utils.mttr import load_resolution_columns, group_summary, coarse_histogram
+from app.utils.timeseries import SERIES, RESOLUTIONS, choose_resolution, fit_resolution, time_series
 from sqlalchemy import func
 from datetime import datetime, timedelta
 
 reports_bp = Blueprint('reports', __name__)
 
 
+@reports_bp.before_request
+def read_from_replica():
+    """Report pages and chart APIs only read, so GETs may use the replica"""
+    if request.method == 'GET':
+        g.db_read_replica = True
+
+
 @reports_bp.route('/')
 @login_required
 @role_required('admin', 'manager')
@@ -21,25 +33,42 @@ def index():
     return render_template('reports/index.html')
 
 
-@reports_bp.route('/faults')
-@login_required
-@role_required('admin', 'manager')
-def fault_reports():
-    """Fault resolution reports"""
-    # Date range
+def _report_range(default_days=30):
+    """Read start_date/end_date query args (YYYY-MM-DD), defaulting to the last `default_days` days"""
     end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)
+    start_date = end_date - timedelta(days=default_days)
 
     if request.args.get('start_date'):
         start_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d')
     if request.args.get('end_date'):
         end_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d')
 
+    return normalize_range(start_date, end_date)
+
+
+def _is_long_range(start_date, end_date):
+    """Ranges longer than REPORT_JOB_THRESHOLD_DAYS are computed as background jobs"""
+    return (end_date - start_date).days > current_app.config.get('REPORT_JOB_THRESHOLD_DAYS', 366)
+
+
+def _queue_report(report_name, start_date, end_date):
+    """Enqueue a background job for the range and send the user to its status page"""
+    job = enqueue_report(report_name, start_date, end_date, current_user.user_id)
+    if job is None:
+        flash('Too many reports are being generated right now. Please try again shortly.', 'warning')
+        return redirect(url_for('reports.index'))
+    return redirect(url_for('reports.view_job', job_id=job.job_id))
+
+
+def compute_fault_report(start, end, progress=None):
+    """Fault statistics for whole days start..end; `progress` is called with a percent"""
+    range_start, range_end = range_bounds(start, end)
+    in_range = (Fault.reported_date >= range_start, Fault.reported_date < range_end)
+
     # Fault statistics
-    faults = Fault.query.filter(
-        Fault.reported_date >= start_date,
-        Fault.reported_date <= end_date
-    ).all()
+    faults = Fault.query.filter(*in_range).all()
+    if progress:
+        progress(30)
 
     total_faults = len(faults)
     resolved_faults = len([f for f in faults if f.status in ['resolved', 'closed']])
@@ -48,60 +77,74 @@ def fault_reports():
     resolution_times = [f.resolution_time_hours for f in faults if f.resolution_time_hours]
     avg_resolution_time = sum(resolution_times) / len(resolution_times) if resolution_times else 0
 
+    # Resolution-time percentiles (means hide the long tail that SLAs care about)
+    columns = load_resolution_columns(*in_range)
+    overall = group_summary(columns, 'overall')
+    if progress:
+        progress(70)
+
     # Faults by type
     faults_by_type = db.session.query(
         Fault.fault_type, func.count(Fault.fault_id)
-    ).filter(
-        Fault.reported_date >= start_date,
-        Fault.reported_date <= end_date
-    ).group_by(Fault.fault_type).all()
+    ).filter(*in_range).group_by(Fault.fault_type).all()
 
     # Faults by severity
     faults_by_severity = db.session.query(
         Fault.severity, func.count(Fault.fault_id)
-    ).filter(
-        Fault.reported_date >= start_date,
-        Fault.reported_date <= end_date
-    ).group_by(Fault.severity).all()
+    ).filter(*in_range).group_by(Fault.severity).all()
 
     # Daily fault trend
     daily_faults = db.session.query(
         func.date(Fault.reported_date), func.count(Fault.fault_id)
-    ).filter(
-        Fault.reported_date >= start_date,
-        Fault.reported_date <= end_date
-    ).group_by(func.date(Fault.reported_date)).all()
+    ).filter(*in_range).group_by(func.date(Fault.reported_date)).all()
+
+    return {
+        'total_faults': total_faults,
+        'resolved_faults': resolved_faults,
+        'avg_resolution_time': round(avg_resolution_time, 2),
+        'resolution_overall': overall[0] if overall else None,
+        'resolution_by_type': group_summary(columns, 'fault_type'),
+        'resolution_by_severity': group_summary(columns, 'severity'),
+        'faults_by_type': [tuple(row) for row in faults_by_type],
+        'faults_by_severity': [tuple(row) for row in faults_by_severity],
+        'daily_faults': [tuple(row) for row in daily_faults]
+    }
+
+
+@reports_bp.route('/faults')
+@login_required
+@role_required('admin', 'manager')
+def fault_reports():
+    """Fault resolution reports"""
+    start_date, end_date = _report_range()
+    if _is_long_range(start_date, end_date):
+        return _queue_report('faults', start_date, end_date)
+
+    report = get_report_cache().get_or_compute('faults', start_date, end_date, ['faults'], compute_fault_report)
+    return _render_fault_report(start_date, end_date, report)
+
+
+def _render_fault_report(start_date, end_date, report):
+    # All-time percentiles by county from the precomputed mttr_stats table
+    county_stats = MttrStat.query.filter_by(group_type='county').order_by(MttrStat.sample_count.desc()).all()
+    overall_stat = MttrStat.query.filter_by(group_type='overall').first()
 
     return render_template('reports/faults.html',
                            start_date=start_date,
                            end_date=end_date,
-                           total_faults=total_faults,
-                           resolved_faults=resolved_faults,
-                           avg_resolution_time=round(avg_resolution_time, 2),
-                           faults_by_type=faults_by_type,
-                           faults_by_severity=faults_by_severity,
-                           daily_faults=daily_faults)
-
+                           county_stats=county_stats,
+                           overall_histogram=coarse_histogram(overall_stat.histogram) if overall_stat else [],
+                           **report)
 
-@reports_bp.route('/maintenance')
-@login_required
-@role_required('admin', 'manager')
-def maintenance_reports():
-    """Maintenance activity reports"""
-    # Date range
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)
 
-    if request.args.get('start_date'):
-        start_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d')
-    if request.args.get('end_date'):
-        end_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d')
+def compute_maintenance_report(start, end, progress=None):
+    """Maintenance statistics for schedules dated start..end; `progress` is called with a percent"""
+    in_range = (MaintenanceSchedule.scheduled_date >= start, MaintenanceSchedule.scheduled_date <= end)
 
     # Maintenance statistics
-    schedules = MaintenanceSchedule.query.filter(
-        MaintenanceSchedule.scheduled_date >= start_date.date(),
-        MaintenanceSchedule.scheduled_date <= end_date.date()
-    ).all()
+    schedules = MaintenanceSchedule.query.filter(*in_range).all()
+    if progress:
+        progress(50)
 
     total_scheduled = len(schedules)
     completed = len([s for s in schedules if s.status == 'completed'])
@@ -111,49 +154,58 @@ def maintenance_reports():
     # By type
     by_type = db.session.query(
         MaintenanceSchedule.maintenance_type, func.count(MaintenanceSchedule.maintenance_id)
-    ).filter(
-        MaintenanceSchedule.scheduled_date >= start_date.date(),
-        MaintenanceSchedule.scheduled_date <= end_date.date()
-    ).group_by(MaintenanceSchedule.maintenance_type).all()
+    ).filter(*in_range).group_by(MaintenanceSchedule.maintenance_type).all()
 
     # By equipment
     by_equipment = db.session.query(
         MaintenanceSchedule.equipment_type, func.count(MaintenanceSchedule.maintenance_id)
-    ).filter(
-        MaintenanceSchedule.scheduled_date >= start_date.date(),
-        MaintenanceSchedule.scheduled_date <= end_date.date()
-    ).group_by(MaintenanceSchedule.equipment_type).all()
+    ).filter(*in_range).group_by(MaintenanceSchedule.equipment_type).all()
+
+    return {
+        'total_scheduled': total_scheduled,
+        'completed': completed,
+        'in_progress': in_progress,
+        'cancelled': cancelled,
+        'by_type': [tuple(row) for row in by_type],
+        'by_equipment': [tuple(row) for row in by_equipment]
+    }
+
+
+@reports_bp.route('/maintenance')
+@login_required
+@role_required('admin', 'manager')
+def maintenance_reports():
+    """Maintenance activity reports"""
+    start_date, end_date = _report_range()
+    if _is_long_range(start_date, end_date):
+        return _queue_report('maintenance', start_date, end_date)
+
+    report = get_report_cache().get_or_compute('maintenance', start_date, end_date, ['maintenance_schedules'],
+                                               compute_maintenance_report)
 
     return render_template('reports/maintenance.html',
                            start_date=start_date,
                            end_date=end_date,
-                           total_scheduled=total_scheduled,
-                           completed=completed,
-                           in_progress=in_progress,
-                           cancelled=cancelled,
-                           by_type=by_type,
-                           by_equipment=by_equipment)
+                           **report)
 
 
-@reports_bp.route('/performance')
-@login_required
-@role_required('admin', 'manager')
-def performance_dashboard():
-    """Overall performance dashboard"""
-    # Current statistics
+def compute_performance_stats(start, end):
+    """Overall performance figures; fault and maintenance counts cover start..end"""
+    range_start, range_end = range_bounds(start, end)
+
     stats = {
         'total_customers': Customer.query.filter_by(is_active=True).count(),
         'active_connections': Connection.query.filter_by(connection_status='active').count(),
         'suspended_connections': Connection.query.filter_by(connection_status='suspended').count(),
         'total_faults_month': Fault.query.filter(
-            Fault.reported_date >= datetime.now() - timedelta(days=30)
+            Fault.reported_date >= range_start, Fault.reported_date < range_end
         ).count(),
         'resolved_faults_month': Fault.query.filter(
-            Fault.reported_date >= datetime.now() - timedelta(days=30),
+            Fault.reported_date >= range_start, Fault.reported_date < range_end,
             Fault.status.in_(['resolved', 'closed'])
         ).count(),
         'maintenance_completed_month': MaintenanceSchedule.query.filter(
-            MaintenanceSchedule.completion_date >= datetime.now() - timedelta(days=30)
+            MaintenanceSchedule.completion_date >= range_start, MaintenanceSchedule.completion_date < range_end
         ).count(),
         'pending_requests': ServiceRequest.query.filter(
             ServiceRequest.status.in_(['submitted', 'under_review'])
@@ -168,37 +220,135 @@ def performance_dashboard():
     else:
         stats['resolution_rate'] = 100
 
+    return stats
+
+
+@reports_bp.route('/performance')
+@login_required
+@role_required('admin', 'manager')
+def performance_dashboard():
+    """Overall performance dashboard"""
+    end_date = datetime.now()
+    stats = get_report_cache().get_or_compute(
+        'performance', end_date - timedelta(days=30), end_date,
+        ['faults', 'maintenance_schedules', 'service_requests'],
+        compute_performance_stats
+    )
+
     return render_template('reports/performance.html', stats=stats)
 
 
-@reports_bp.route('/api/chart-data/<chart_type>')
+@reports_bp.route('/api/cache-stats')
 @login_required
 @role_required('admin', 'manager')
-def get_chart_data(chart_type):
-    """API endpoint for chart data"""
-    days = int(request.args.get('days', 30))
-    start_date = datetime.now() - timedelta(days=days)
+@cache_policy(no_store=True)
+def cache_stats():
+    """Report cache hit-rate statistics"""
+    return jsonify(get_report_cache().stats())
 
-    if chart_type == 'faults_trend':
-        data = db.session.query(
-            func.date(Fault.reported_date), func.count(Fault.fault_id)
-        ).filter(Fault.reported_date >= start_date).group_by(
-            func.date(Fault.reported_date)
-        ).all()
 
-        return jsonify({
-            'labels': [str(d[0]) for d in data],
-            'values': [d[1] for d in data]
-        })
+@reports_bp.route('/jobs/<int:job_id>')
+@login_required
+@role_required('admin', 'manager')
+@cache_policy(no_store=True)
+def view_job(job_id):
+    """Progress page for a background report; renders the report once it is complete"""
+    job = ReportJob.query.get_or_404(job_id)
+    if job.status != 'completed':
+        return render_template('reports/job.html', job=job)
+
+    if job.report_name == 'faults':
+        return _render_fault_report(job.start_date, job.end_date, job.result)
+    return render_template('reports/maintenance.html', start_date=job.start_date, end_date=job.end_date,
+                           **job.result)
+
+
+@reports_bp.route('/jobs/<int:job_id>/download')
+@login_required
+@role_required('admin', 'manager')
+def download_job(job_id):
+    """Completed report result as a JSON file"""
+    job = ReportJob.query.get_or_404(job_id)
+    if job.status != 'completed':
+        return jsonify({'error': 'Report is not ready', **job.to_dict()}), 409
+
+    response = jsonify({**job.to_dict(), 'result': job.result})
+    filename = f'{job.report_name}-report-{job.start_date}-{job.end_date}.json'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+@reports_bp.route('/api/jobs', methods=['POST'])
+@login_required
+@role_required('admin', 'manager')
+def create_job():
+    """Queue a report job; responds 202 with the job ID"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        start_date = datetime.strptime(data.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(data.get('end_date', ''), '%Y-%m-%d').date()
+        job = enqueue_report(data.get('report', ''), start_date, end_date, current_user.user_id)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if job is None:
+        return jsonify({'error': 'Too many report jobs in progress'}), 429
+    return jsonify({**job.to_dict(), 'status_url': url_for('reports.job_status', job_id=job.job_id)}), 202
+
+
+@reports_bp.route('/api/jobs/<int:job_id>')
+@login_required
+@role_required('admin', 'manager')
+@cache_policy(no_store=True)
+def job_status(job_id):
+    """Status and progress of a report job"""
+    return jsonify(ReportJob.query.get_or_404(job_id).to_dict())
+
+
+@reports_bp.route('/api/chart-data/<chart_type>')
+@login_required
+@role_required('admin', 'manager')
+@cache_policy(max_age=300)
+def get_chart_data(chart_type):
+    """
+    API endpoint for chart data
+
+    Query args:
+        days: Range length ending today (1..CHART_MAX_DAYS, default 30)
+        resolution: hour, day, week or month (default: chosen from the range; coarsened for long
+            ranges, see RESOLUTION_MAX_DAYS)
+        max_points: Upper bound on returned points (default and cap CHART_MAX_POINTS)
+    """
+    max_days = current_app.config.get('CHART_MAX_DAYS', 1830)
+    max_points = current_app.config.get('CHART_MAX_POINTS', 200)
+    days = min(max(request.args.get('days', 30, type=int), 1), max_days)
+    points = min(max(request.args.get('max_points', max_points, type=int), 2), max_points)
+    resolution = request.args.get('resolution') or choose_resolution(days)
+    if resolution not in RESOLUTIONS:
+        return jsonify({'error': 'Invalid resolution'}), 400
+    resolution = fit_resolution(resolution, days)  # e.g. no hourly buckets over five years
+
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+
+    if chart_type in SERIES:
+        def compute(start, end):
+            range_start, range_end = range_bounds(start, end)
+            return time_series(chart_type, range_start, range_end, resolution, points)
+
+        data = get_report_cache().get_or_compute(f'chart:{chart_type}:{resolution}:{points}', start_date, end_date,
+                                                 [SERIES[chart_type][1]], compute)
+        return jsonify(data)
 
     elif chart_type == 'faults_by_type':
+        range_start, range_end = range_bounds(start_date, end_date)
         data = db.session.query(
             Fault.fault_type, func.count(Fault.fault_id)
-        ).filter(Fault.reported_date >= start_date).group_by(Fault.fault_type).all()
+        ).filter(Fault.reported_date >= range_start, Fault.reported_date < range_end).group_by(Fault.fault_type).all()
 
         return jsonify({
             'labels': [d[0].replace('_', ' ').title() for d in data],
             'values': [d[1] for d in data]
         })
 
-    return jsonify({'error': 'Invalid chart type'})
\ No newline at end of file
+    return jsonify({'error': 'Invalid chart type'}), 400
@@ -6,6 +6,9 @@ from flask_login import login_required, current_user
 from app.models import User
 from app import db
 from app.utils.decorators import role_required
+from app.utils.db_routing import replica_reads
+from app.utils.passwords import PasswordHashBusy
+from app.utils.technician_stats import technician_stats
 
 staff_bp = Blueprint('staff', __name__)
 
@@ -13,6 +16,7 @@ staff_bp = Blueprint('staff', __name__)
 @staff_bp.route('/')
 @login_required
 @role_required('admin')
+@replica_reads
 def list_staff():
     """List all staff members (customer care agents and technicians)"""
     page = request.args.get('page', 1, type=int)
@@ -35,7 +39,9 @@ def list_staff():
         page=page, per_page=10, error_out=False
     )
 
-    return render_template('staff/list.html', staff=staff, search=search, role_filter=role_filter)
+    stats = technician_stats([user.user_id for user in staff.items if user.role == 'technician'])
+
+    return render_template('staff/list.html', staff=staff, search=search, role_filter=role_filter, stats=stats)
 
 
 @staff_bp.route('/add', methods=['GET', 'POST'])
@@ -88,7 +94,11 @@ def add_staff():
             role=role,
             is_active=True
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHashBusy:
+            flash('The system is busy. Please try again in a moment.', 'warning')
+            return render_template('staff/add.html'), 503
 
         try:
             db.session.add(user)
@@ -112,7 +122,8 @@ def view_staff(user_id):
         flash('Staff member not found.', 'danger')
         return redirect(url_for('staff.list_staff'))
 
-    return render_template('staff/view.html', user=user)
+    stats = technician_stats([user.user_id]).get(user.user_id) if user.role == 'technician' else None
+    return render_template('staff/view.html', user=user, stats=stats)
 
 
 @staff_bp.route('/<int:user_id>/edit', methods=['GET', 'POST'])
@@ -143,7 +154,11 @@ def edit_staff(user_id):
             if len(new_password) < 6:
                 flash('Password must be at least 6 characters long.', 'danger')
                 return render_template('staff/edit.html', user=user)
-            user.set_password(new_password)
+            try:
+                user.set_password(new_password)
+            except PasswordHashBusy:
+                flash('The system is busy. Please try again in a moment.', 'warning')
+                return render_template('staff/edit.html', user=user), 503
 
         try:
             db.session.commit()
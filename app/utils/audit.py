@@ -0,0 +1,342 @@
+"""
+Asynchronous, batched audit logging
+Session hooks capture attribute diffs for audited models; a background writer
+drains them from a bounded queue into audit_log using multi-row INSERTs.
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, attributes
+
+# Tables whose changes are written to audit_log
+AUDITED_TABLES = {'customers', 'connections', 'faults', 'users', 'maintenance_schedules', 'maintenance_series'}
+
+# Columns whose values are never copied into the audit trail
+REDACTED_COLUMNS = {'password'}
+
+# Bookkeeping columns left out of UPDATE diffs (sync sequence numbers change on every write)
+UNTRACKED_COLUMNS = {'change_seq'}
+
+_PENDING_KEY = 'audit_pending'
+_STOP = object()
+
+
+def _json_value(value):
+    """Convert a column value into something the JSON column can store"""
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _column_value(column_key, value):
+    return '***' if column_key in REDACTED_COLUMNS else _json_value(value)
+
+
+def _record_id(obj):
+    # The identity key isn't assigned until after this hook, so read the primary key directly
+    primary_key = inspect(obj).mapper.primary_key_from_instance(obj)
+    return primary_key[0] if len(primary_key) == 1 else None
+
+
+def _actor():
+    """Return (user_id, ip_address) for the current request, if any"""
+    if not has_request_context():
+        return None, None
+    from flask_login import current_user
+    user_id = current_user.user_id if current_user and current_user.is_authenticated else None
+    return user_id, request.remote_addr
+
+
+def _snapshot(obj):
+    mapper = inspect(obj).mapper
+    return {attr.key: _column_value(attr.key, getattr(obj, attr.key)) for attr in mapper.column_attrs}
+
+
+def _diff(obj):
+    """Return (old_values, new_values) for the changed columns of a dirty object"""
+    old_values, new_values = {}, {}
+    for attr in inspect(obj).mapper.column_attrs:
+        if attr.key in UNTRACKED_COLUMNS:
+            continue
+        history = attributes.get_history(obj, attr.key)
+        if not history.has_changes():
+            continue
+        old_values[attr.key] = _column_value(attr.key, history.deleted[0] if history.deleted else None)
+        new_values[attr.key] = _column_value(attr.key, history.added[0] if history.added else None)
+    return old_values, new_values
+
+
+def _is_audited(obj):
+    return getattr(obj, '__tablename__', None) in AUDITED_TABLES
+
+
+def _after_flush(session, flush_context):
+    """Capture diffs while the pre-flush history is still available"""
+    if not has_app_context() or not current_app.config.get('AUDIT_ENABLED', False):
+        return
+
+    user_id, ip_address = _actor()
+    now = datetime.utcnow()
+    rows = session.info.setdefault(_PENDING_KEY, [])
+
+    def add(obj, action, old_values, new_values):
+        rows.append({
+            'user_id': user_id,
+            'action': action,
+            'table_name': obj.__tablename__,
+            'record_id': _record_id(obj),
+            'old_values': old_values,
+            'new_values': new_values,
+            'ip_address': ip_address,
+            'action_date': now
+        })
+
+    for obj in session.new:
+        if _is_audited(obj):
+            add(obj, 'INSERT', None, _snapshot(obj))
+    for obj in session.dirty:
+        if _is_audited(obj) and session.is_modified(obj, include_collections=False):
+            old_values, new_values = _diff(obj)
+            if new_values:
+                add(obj, 'UPDATE', old_values, new_values)
+    for obj in session.deleted:
+        if _is_audited(obj):
+            add(obj, 'DELETE', _snapshot(obj), None)
+
+
+def record_bulk_update(session, table_name, changes):
+    """
+    Queue audit rows for an UPDATE executed outside the ORM (no attribute history to diff)
+
+    Args:
+        changes: [(record_id, old_values, new_values)]; written when the session commits
+    """
+    if not has_app_context() or not current_app.config.get('AUDIT_ENABLED', False):
+        return
+    user_id, ip_address = _actor()
+    now = datetime.utcnow()
+    session.info.setdefault(_PENDING_KEY, []).extend({
+        'user_id': user_id,
+        'action': 'UPDATE',
+        'table_name': table_name,
+        'record_id': record_id,
+        'old_values': {key: _column_value(key, value) for key, value in old_values.items()},
+        'new_values': {key: _column_value(key, value) for key, value in new_values.items()},
+        'ip_address': ip_address,
+        'action_date': now
+    } for record_id, old_values, new_values in changes)
+
+
+def _track_old_values(model):
+    """Make column sets load the previous value, so diffs of expired objects still have old values"""
+    for attr in inspect(model).column_attrs:
+        event.listen(getattr(model, attr.key), 'set', lambda target, value, oldvalue, initiator: None,
+                     active_history=True)
+
+
+def _after_commit(session):
+    rows = session.info.pop(_PENDING_KEY, None)
+    if rows and has_app_context():
+        writer = current_app.extensions.get('audit_writer')
+        if writer:
+            writer.submit(rows)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class AuditWriter:
+    """Bounded in-process queue drained by a background thread using multi-row INSERTs"""
+
+    def __init__(self, app):
+        self.app = app
+        self.queue_size = app.config.get('AUDIT_QUEUE_SIZE', 10000)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', 1.0)
+        self.enqueue_timeout = app.config.get('AUDIT_ENQUEUE_TIMEOUT', 0.5)
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = None
+        self._exit_registered = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'rows_enqueued': 0,
+            'rows_written': 0,
+            'rows_failed': 0,
+            'rows_written_inline': 0,
+            'batches_written': 0,
+            'max_queue_depth': 0,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0,
+            'max_batch_ms': 0.0,
+            'total_batch_ms': 0.0
+        }
+
+    # ---- producer side ----
+
+    def submit(self, rows):
+        """Queue audit rows; falls back to an inline write when the queue stays full"""
+        if not self.app.config.get('AUDIT_ASYNC', True):
+            self._write(rows)
+            return
+
+        self._ensure_started()
+        overflow = []
+        # Backpressure: block the producer briefly rather than growing without bound; one deadline
+        # covers the whole batch, so a full queue delays a commit by at most enqueue_timeout
+        deadline = time.monotonic() + self.enqueue_timeout
+        for index, row in enumerate(rows):
+            try:
+                self._queue.put(row, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                overflow = rows[index:]
+                break
+
+        with self._stats_lock:
+            self._stats['rows_enqueued'] += len(rows) - len(overflow)
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+
+        if overflow:
+            self._write(overflow, inline=True)
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far has been written; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=5.0):
+        """Drain the queue and stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self.queue_size
+        batches = stats['batches_written']
+        stats['avg_batch_ms'] = round(stats.pop('total_batch_ms') / batches, 2) if batches else 0.0
+        return stats
+
+    # ---- consumer side ----
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+                if not self._exit_registered:
+                    atexit.register(self.shutdown)
+                    self._exit_registered = True
+
+    def _next_batch(self):
+        """Block for the first row, then collect up to batch_size rows or until flush_interval passes"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if row is _STOP:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if stopping:
+                # Flush-on-shutdown: take whatever is still queued
+                while True:
+                    try:
+                        row = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if row is not _STOP:
+                        batch.append(row)
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stopping else 0)):
+                    self._queue.task_done()
+
+    def _write(self, rows, inline=False):
+        from app import db
+        from app.models import AuditLog
+
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    # One INSERT ... VALUES (...), (...), ... per batch
+                    conn.execute(AuditLog.__table__.insert().values(rows))
+        except Exception:
+            self.app.logger.exception('Failed to write %d audit row(s)', len(rows))
+            with self._stats_lock:
+                self._stats['rows_failed'] += len(rows)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats['rows_written'] += len(rows)
+            self._stats['batches_written'] += 1
+            self._stats['last_batch_size'] = len(rows)
+            self._stats['last_batch_ms'] = round(elapsed_ms, 2)
+            self._stats['max_batch_ms'] = round(max(self._stats['max_batch_ms'], elapsed_ms), 2)
+            self._stats['total_batch_ms'] += elapsed_ms
+            if inline:
+                self._stats['rows_written_inline'] += len(rows)
+
+
+_listeners_registered = False
+
+
+def init_audit(app):
+    """Attach an audit writer to the app and register the session hooks once per process"""
+    global _listeners_registered
+
+    app.extensions['audit_writer'] = AuditWriter(app)
+
+    if not _listeners_registered:
+        from app import db
+        from app.models import AuditLog  # noqa: F401 - make sure every model is mapped
+        for mapper in db.Model.registry.mappers:
+            if mapper.local_table.name in AUDITED_TABLES:
+                _track_old_values(mapper.class_)
+
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_registered = True
+
+    return app.extensions['audit_writer']
@@ -0,0 +1,195 @@
+"""
+Audit log archival
+Rolls old audit_log rows into gzip-compressed, date-partitioned NDJSON segments
+(each with a small JSON index) and queries hot and archived rows together.
+
+Layout: <AUDIT_ARCHIVE_DIR>/YYYY/MM/audit-YYYY-MM-DD-<first_id>-<last_id>.ndjson.gz
+        plus a matching .idx.json holding the date, id range, row count and user ids.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+from flask import current_app
+
+from app import db
+from app.models import AuditLog
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+INDEX_SUFFIX = '.idx.json'
+
+
+def _row_to_dict(row):
+    return {
+        'log_id': row.log_id,
+        'user_id': row.user_id,
+        'action': row.action,
+        'table_name': row.table_name,
+        'record_id': row.record_id,
+        'old_values': row.old_values,
+        'new_values': row.new_values,
+        'ip_address': row.ip_address,
+        'action_date': row.action_date.isoformat() if row.action_date else None
+    }
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value)
+
+
+class AuditArchive:
+    """Archive writer and hot+cold query API for audit_log"""
+
+    def __init__(self, directory, retention_days=90, batch_size=5000):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_app(cls, app=None):
+        app = app or current_app
+        directory = app.config.get('AUDIT_ARCHIVE_DIR') or os.path.join(app.instance_path, 'audit_archive')
+        return cls(directory,
+                   retention_days=app.config.get('AUDIT_RETENTION_DAYS', 90),
+                   batch_size=app.config.get('AUDIT_ARCHIVE_BATCH_SIZE', 5000))
+
+    # ---- archiving ----
+
+    def archive(self, older_than=None, max_batches=None):
+        """
+        Move rows older than the cutoff into segment files, one bounded batch at a time
+
+        Each batch is written and fsynced before its rows are deleted, so a crash can at
+        worst leave rows both archived and hot; query() de-duplicates on log_id.
+
+        Returns:
+            dict with rows archived, batches and segments written
+        """
+        cutoff = older_than or (datetime.utcnow() - timedelta(days=self.retention_days))
+        result = {'rows': 0, 'batches': 0, 'segments': 0, 'cutoff': cutoff.isoformat()}
+
+        last_id = 0
+        while max_batches is None or result['batches'] < max_batches:
+            # Keyset pagination on the primary key keeps each batch an index range scan
+            rows = AuditLog.query.filter(
+                AuditLog.action_date < cutoff,
+                AuditLog.log_id > last_id
+            ).order_by(AuditLog.log_id).limit(self.batch_size).all()
+            if not rows:
+                break
+
+            ordered = sorted(rows, key=lambda r: (r.action_date.date(), r.log_id))
+            for day, day_rows in groupby(ordered, key=lambda r: r.action_date.date()):
+                self._write_segment(day, [_row_to_dict(r) for r in day_rows])
+                result['segments'] += 1
+
+            ids = [r.log_id for r in rows]
+            last_id = ids[-1]
+            AuditLog.query.filter(AuditLog.log_id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            for row in rows:
+                db.session.expunge(row)
+
+            result['rows'] += len(ids)
+            result['batches'] += 1
+
+        return result
+
+    def _segment_path(self, day, first_id, last_id):
+        folder = os.path.join(self.directory, f'{day.year:04d}', f'{day.month:02d}')
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f'audit-{day.isoformat()}-{first_id}-{last_id}')
+
+    def _write_segment(self, day, rows):
+        base = self._segment_path(day, rows[0]['log_id'], rows[-1]['log_id'])
+        segment_tmp = base + SEGMENT_SUFFIX + '.tmp'
+
+        with gzip.open(segment_tmp, 'wt', encoding='utf-8') as fh:
+            for row in rows:
+                fh.write(json.dumps(row, separators=(',', ':')) + '\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(segment_tmp, base + SEGMENT_SUFFIX)
+
+        index = {
+            'date': day.isoformat(),
+            'first_log_id': rows[0]['log_id'],
+            'last_log_id': rows[-1]['log_id'],
+            'row_count': len(rows),
+            'min_action_date': min(r['action_date'] for r in rows),
+            'max_action_date': max(r['action_date'] for r in rows),
+            'user_ids': sorted({r['user_id'] for r in rows if r['user_id'] is not None}),
+            'tables': sorted({r['table_name'] for r in rows if r['table_name']})
+        }
+        with open(base + INDEX_SUFFIX + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump(index, fh)
+        os.replace(base + INDEX_SUFFIX + '.tmp', base + INDEX_SUFFIX)
+
+    # ---- querying ----
+
+    def segments(self, start, end, user_id=None):
+        """Yield (segment_path, index) for segments overlapping the date range (and holding the user)"""
+        if not os.path.isdir(self.directory):
+            return
+
+        day = start.date()
+        months = set()
+        while day <= end.date():
+            months.add((day.year, day.month))
+            day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+        for year, month in sorted(months):
+            folder = os.path.join(self.directory, f'{year:04d}', f'{month:02d}')
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if not name.endswith(INDEX_SUFFIX):
+                    continue
+                with open(os.path.join(folder, name), encoding='utf-8') as fh:
+                    index = json.load(fh)
+                if index['max_action_date'] < start.isoformat() or index['min_action_date'] > end.isoformat():
+                    continue
+                if user_id is not None and user_id not in index['user_ids']:
+                    continue
+                yield os.path.join(folder, name[:-len(INDEX_SUFFIX)] + SEGMENT_SUFFIX), index
+
+    def query(self, start, end, user_id=None, table_name=None):
+        """
+        Audit rows between start and end (inclusive) from audit_log and any archived segments
+
+        Returns:
+            List of row dicts ordered by action_date, log_id
+        """
+        start, end = _as_datetime(start), _as_datetime(end)
+        results = {}
+
+        hot = AuditLog.query.filter(AuditLog.action_date >= start, AuditLog.action_date <= end)
+        if user_id is not None:
+            hot = hot.filter(AuditLog.user_id == user_id)
+        if table_name:
+            hot = hot.filter(AuditLog.table_name == table_name)
+        for row in hot:
+            results[row.log_id] = _row_to_dict(row)
+
+        start_iso, end_iso = start.isoformat(), end.isoformat()
+        for path, index in self.segments(start, end, user_id):
+            if table_name and table_name not in index['tables']:
+                continue
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                for line in fh:
+                    row = json.loads(line)
+                    if not start_iso <= row['action_date'] <= end_iso:
+                        continue
+                    if user_id is not None and row['user_id'] != user_id:
+                        continue
+                    if table_name and row['table_name'] != table_name:
+                        continue
+                    results.setdefault(row['log_id'], row)
+
+        return sorted(results.values(), key=lambda r: (r['action_date'], r['log_id']))
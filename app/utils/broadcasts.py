@@ -0,0 +1,256 @@
+"""
+Outage broadcasts
+Tells every customer behind a feeder or transformer about an outage, however many
+there are:
+- recipients are the distinct customer_ids of the connections on the feeder or
+  transformer, read in keyset order (customer_id > cursor ... LIMIT chunk) off the
+  (feeder_line, customer_id) and (transformer_id, customer_id) indexes, so a customer
+  with several connections is notified once and no read holds a long snapshot,
+- each chunk of up to BROADCAST_CHUNK_SIZE notifications is one multi-row INSERT,
+  committed together with the broadcast's cursor and sent count, so a crashed worker
+  resumes exactly where its last commit left off and nobody is notified twice. The
+  cursor only moves from the value the worker started the chunk at, so when a stalled
+  broadcast is handed to a second worker and the first one wakes up, whichever commits
+  second rolls its chunk back and stops,
+- sending runs on one background thread per process; a worker that stops mid-way
+  hands the broadcast back to the queue, and every process polls the queue
+  (resume_broadcasts() every BROADCAST_POLL_SECONDS) so handed-back and stalled
+  broadcasts are picked up without an operator.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+
+from app import db
+from app.models import Connection, Notification, OutageBroadcast
+
+logger = logging.getLogger(__name__)
+
+SCOPE_TYPES = ('feeder', 'transformer')
+NOTIFICATION_TYPES = ('alert', 'maintenance_reminder')
+
+
+def _scope_column(scope_type):
+    return Connection.transformer_id if scope_type == 'transformer' else Connection.feeder_line
+
+
+def count_recipients(scope_type, scope_value):
+    """Distinct customers with a connection on the feeder or transformer"""
+    column = _scope_column(scope_type)
+    return db.session.execute(
+        select(func.count(func.distinct(Connection.customer_id))).where(column == scope_value)
+    ).scalar_one()
+
+
+def recipient_chunks(scope_type, scope_value, after_customer_id=0, chunk_size=5000):
+    """Yield ascending lists of distinct customer_ids, each read with its own short query"""
+    column = _scope_column(scope_type)
+    cursor = after_customer_id
+    while True:
+        customer_ids = list(db.session.scalars(
+            select(Connection.customer_id).distinct()
+            .where(column == scope_value, Connection.customer_id > cursor)
+            .order_by(Connection.customer_id).limit(chunk_size)
+        ))
+        if not customer_ids:
+            return
+        yield customer_ids
+        cursor = customer_ids[-1]
+
+
+def run_broadcast(broadcast_id, should_stop=None):
+    """
+    Claim a queued broadcast and send it from its cursor onwards
+
+    The claim is a conditional UPDATE, so a broadcast submitted twice only runs once.
+    If `should_stop()` turns true between chunks, the broadcast goes back to 'queued'.
+
+    Returns:
+        Final status, or None if the broadcast was not queued or another worker took it over
+    """
+    table = OutageBroadcast.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        claimed = connection.execute(update(table).where(
+            table.c.broadcast_id == broadcast_id, table.c.status == 'queued'
+        ).values(status='running', started_at=func.coalesce(table.c.started_at, now), heartbeat_at=now)).rowcount
+    if not claimed:
+        return None
+
+    broadcast = db.session.get(OutageBroadcast, broadcast_id, populate_existing=True)
+    cursor = broadcast.last_customer_id
+    try:
+        if broadcast.total_recipients is None:
+            broadcast.total_recipients = count_recipients(broadcast.scope_type, broadcast.scope_value)
+            db.session.commit()
+
+        chunks = recipient_chunks(broadcast.scope_type, broadcast.scope_value, cursor,
+                                  current_app.config.get('BROADCAST_CHUNK_SIZE', 5000))
+        for customer_ids in chunks:
+            now = datetime.utcnow()
+            db.session.execute(insert(Notification), [{
+                'customer_id': customer_id, 'title': broadcast.title, 'message': broadcast.message,
+                'notification_type': broadcast.notification_type, 'reference_type': 'outage_broadcast',
+                'reference_id': broadcast_id, 'is_read': False, 'created_at': now
+            } for customer_id in customer_ids])
+            # The cursor moves in the same transaction as the rows it covers, and only from where this worker left it
+            if not _move(broadcast_id, cursor, last_customer_id=customer_ids[-1],
+                         sent_count=table.c.sent_count + len(customer_ids), heartbeat_at=now):
+                db.session.rollback()
+                logger.warning('Outage broadcast %s was taken over by another worker', broadcast_id)
+                return None
+            db.session.commit()
+            cursor = customer_ids[-1]
+            if should_stop is not None and should_stop():
+                status = 'queued' if _move(broadcast_id, cursor, status='queued') else None
+                db.session.commit()
+                return status
+
+        status = 'completed'
+        values = {}
+    except Exception as exc:
+        logger.exception('Outage broadcast %s failed', broadcast_id)
+        db.session.rollback()
+        status = 'failed'
+        values = {'error': str(exc)[:2000]}
+
+    finished = _move(broadcast_id, cursor, status=status, finished_at=datetime.utcnow(), **values)
+    db.session.commit()
+    return status if finished else None
+
+
+def _move(broadcast_id, cursor, **values):
+    """Update a running broadcast whose cursor is still `cursor`; returns whether it matched"""
+    table = OutageBroadcast.__table__
+    return db.session.execute(update(table).where(
+        table.c.broadcast_id == broadcast_id, table.c.status == 'running', table.c.last_customer_id == cursor
+    ).values(**values)).rowcount == 1
+
+
+class BroadcastWorker:
+    """Sends broadcasts one at a time on a lazily started background thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._executor = None
+        self._pending = set()  # broadcast_ids submitted and not yet finished
+        self._lock = threading.Lock()
+        self._poller = None
+        self._stopping = threading.Event()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outage-broadcast')
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def submit(self, broadcast_id):
+        """Send in the background, or inline when BROADCAST_ASYNC is off (tests, CLI)"""
+        if not self.app.config.get('BROADCAST_ASYNC', True):
+            return run_broadcast(broadcast_id)
+        executor = self._pool()
+        with self._lock:
+            if broadcast_id in self._pending:
+                return None  # already waiting for the thread; a poll must not queue it twice
+            self._pending.add(broadcast_id)
+        executor.submit(self._run, broadcast_id).add_done_callback(self._log_failure)
+        return None
+
+    def _run(self, broadcast_id):
+        with self.app.app_context():
+            try:
+                return run_broadcast(broadcast_id, should_stop=self._stopping.is_set)
+            finally:
+                with self._lock:
+                    self._pending.discard(broadcast_id)
+                db.session.remove()
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Outage broadcast worker crashed: %s', future.exception())
+
+    def start_polling(self):
+        """Resume queued and stalled broadcasts now, then every BROADCAST_POLL_SECONDS"""
+        interval = self.app.config.get('BROADCAST_POLL_SECONDS', 30)
+        if not self.app.config.get('BROADCAST_ASYNC', True) or not interval:
+            return  # inline broadcasts never wait in the queue
+        if self._poller is not None and self._poller.is_alive():
+            return
+        self._poller = threading.Thread(target=self._poll, args=(interval,), name='outage-broadcast-poller',
+                                        daemon=True)
+        self._poller.start()
+
+    def _poll(self, interval):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    resume_broadcasts()
+                except Exception:
+                    logger.exception('Resuming outage broadcasts failed')
+                finally:
+                    db.session.remove()
+            self._stopping.wait(interval)
+
+    def shutdown(self, timeout=None):
+        """Stop polling, and sending after the chunk in progress; unfinished broadcasts are left queued"""
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def create_broadcast(scope_type, scope_value, title, message, notification_type='alert', user_id=None):
+    """Queue a broadcast and hand it to this process's worker"""
+    if scope_type not in SCOPE_TYPES:
+        raise ValueError(f"scope_type must be one of {', '.join(SCOPE_TYPES)}")
+    if notification_type not in NOTIFICATION_TYPES:
+        raise ValueError(f"notification_type must be one of {', '.join(NOTIFICATION_TYPES)}")
+    if not scope_value or not title or not message:
+        raise ValueError('Feeder or transformer, title and message are required')
+
+    broadcast = OutageBroadcast(scope_type=scope_type, scope_value=scope_value, title=title, message=message,
+                                notification_type=notification_type, created_by=user_id, status='queued')
+    db.session.add(broadcast)
+    db.session.commit()
+    get_broadcast_worker().submit(broadcast.broadcast_id)
+    return broadcast
+
+
+def resume_broadcasts():
+    """
+    Resubmit broadcasts left behind by a restart: queued ones, and running ones whose
+    worker has not committed a chunk for BROADCAST_STALL_TIMEOUT seconds
+
+    Returns:
+        Number of broadcasts submitted
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get('BROADCAST_STALL_TIMEOUT', 300))
+    OutageBroadcast.query.filter(
+        OutageBroadcast.status == 'running', OutageBroadcast.heartbeat_at < cutoff
+    ).update({OutageBroadcast.status: 'queued'}, synchronize_session=False)
+    db.session.commit()
+
+    broadcast_ids = [broadcast_id for (broadcast_id,) in db.session.query(OutageBroadcast.broadcast_id).filter(
+        OutageBroadcast.status == 'queued').order_by(OutageBroadcast.broadcast_id)]
+    worker = get_broadcast_worker()
+    for broadcast_id in broadcast_ids:
+        worker.submit(broadcast_id)
+    return len(broadcast_ids)
+
+
+def init_broadcasts(app):
+    """Attach a broadcast worker to the app; its thread starts on first submit"""
+    app.extensions['broadcast_worker'] = BroadcastWorker(app)
+    return app.extensions['broadcast_worker']
+
+
+def get_broadcast_worker():
+    return current_app.extensions['broadcast_worker']
@@ -0,0 +1,141 @@
+"""
+Bulk fault resolution
+When a transformer or feeder comes back, every open fault behind it is closed in one
+operation instead of one status update (and one commit) per fault:
+- the faults are selected by transformer, feeder, incident (a maintenance job on a
+  transformer or feeder) or an explicit list of fault IDs,
+- each chunk of up to BULK_RESOLVE_CHUNK_SIZE faults is locked, closed with one
+  UPDATE, logged with one multi-row INSERT into fault_updates and one into
+  notifications, and committed. Locks are held for one chunk at a time and a failure
+  loses at most the chunk in progress.
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+
+from app import db
+from app.models import Fault, FaultUpdate, Connection, MaintenanceSchedule, Notification
+from app.utils.audit import record_bulk_update
+from app.utils.report_cache import touch
+from app.utils.sync import transaction_change_seq
+from app.utils.technician_stats import mark_technicians
+
+SELECTORS = ('transformer', 'feeder', 'incident', 'ids')
+RESOLVED_STATUSES = ('resolved', 'closed')
+
+
+class BulkSelectionError(ValueError):
+    """The selector does not identify any equipment"""
+
+
+def _equipment_filter(selector, value):
+    if selector == 'incident':
+        schedule = db.session.get(MaintenanceSchedule, value)
+        if schedule is None:
+            raise BulkSelectionError('Maintenance job not found')
+        if schedule.equipment_type not in ('transformer', 'feeder_line') or not schedule.equipment_id:
+            raise BulkSelectionError('The maintenance job is not on a transformer or feeder')
+        selector = 'transformer' if schedule.equipment_type == 'transformer' else 'feeder'
+        value = schedule.equipment_id
+    column = Connection.transformer_id if selector == 'transformer' else Connection.feeder_line
+    return column == value
+
+
+def open_fault_ids(selector, value):
+    """IDs of the open faults selected by `selector` ('transformer', 'feeder', 'incident' or 'ids')"""
+    if selector not in SELECTORS:
+        raise BulkSelectionError(f"selector must be one of {', '.join(SELECTORS)}")
+    query = select(Fault.fault_id).where(Fault.status.notin_(RESOLVED_STATUSES))
+    if selector == 'ids':
+        query = query.where(Fault.fault_id.in_(list(value)))
+    else:
+        query = query.join(Connection, Connection.connection_id == Fault.connection_id).where(
+            _equipment_filter(selector, value))
+    return list(db.session.scalars(query.order_by(Fault.fault_id)))
+
+
+def _resolve_chunk(fault_ids, status, notes, user_id, now, notified):
+    """Close one chunk of faults in the current transaction; returns (resolved, notifications)"""
+    # Lock the rows and re-check them: a fault closed since selection is left alone
+    rows = db.session.execute(
+        select(Fault.fault_id, Fault.status, Fault.fault_type, Fault.reported_date, Fault.assigned_to,
+               func.coalesce(Fault.reported_by_customer, Connection.customer_id).label('customer_id'))
+        .outerjoin(Connection, Connection.connection_id == Fault.connection_id)
+        .where(Fault.fault_id.in_(fault_ids), Fault.status.notin_(RESOLVED_STATUSES))
+        .with_for_update(of=Fault)
+    ).all()
+    if not rows:
+        return 0, 0
+
+    change_seq = transaction_change_seq(db.session)
+    ids = [row.fault_id for row in rows]
+    db.session.execute(
+        update(Fault).where(Fault.fault_id.in_(ids)).values(
+            status=status, resolution_date=func.coalesce(Fault.resolution_date, now), resolution_notes=notes,
+            updated_at=now, change_seq=change_seq, mttr_dirty=True
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.execute(insert(FaultUpdate), [{
+        'fault_id': row.fault_id, 'updated_by': user_id, 'update_type': 'resolution',
+        'previous_status': row.status, 'new_status': status, 'notes': notes, 'update_date': now,
+        'change_seq': change_seq
+    } for row in rows])
+
+    # One notification per customer for the whole operation, however many faults they reported
+    notifications = []
+    for row in rows:
+        if row.customer_id is None or row.customer_id in notified:
+            continue
+        notified.add(row.customer_id)
+        notifications.append({
+            'customer_id': row.customer_id, 'title': 'Power Restored',
+            'message': f"Your {row.fault_type.replace('_', ' ')} report #{row.fault_id} has been {status}.",
+            'notification_type': 'fault_update', 'reference_type': 'fault', 'reference_id': row.fault_id,
+            'is_read': False, 'created_at': now
+        })
+    if notifications:
+        db.session.execute(insert(Notification), notifications)
+
+    record_bulk_update(db.session, 'faults', [
+        (row.fault_id, {'status': row.status}, {'status': status, 'resolution_notes': notes}) for row in rows
+    ])
+    touch(db.session, 'faults', [row.reported_date for row in rows] + [now])
+    mark_technicians(db.session, {row.assigned_to for row in rows})
+    return len(rows), len(notifications)
+
+
+def resolve_faults(selector, value, user_id, status='resolved', notes='', chunk_size=None):
+    """
+    Resolve (or close) every open fault selected by `selector`/`value`
+
+    Args:
+        selector: 'transformer' or 'feeder' (value: equipment ID), 'incident' (value:
+            maintenance_id of the restoration job) or 'ids' (value: fault IDs)
+        user_id: Staff member recorded on the fault updates
+        chunk_size: Faults per transaction, defaults to BULK_RESOLVE_CHUNK_SIZE
+
+    Returns:
+        {'matched', 'resolved', 'notified', 'chunks'}
+    """
+    if status not in RESOLVED_STATUSES:
+        raise BulkSelectionError(f"status must be one of {', '.join(RESOLVED_STATUSES)}")
+    chunk_size = chunk_size or current_app.config.get('BULK_RESOLVE_CHUNK_SIZE', 500)
+    fault_ids = open_fault_ids(selector, value)
+    db.session.commit()  # release anything the selection touched before taking row locks
+
+    summary = {'matched': len(fault_ids), 'resolved': 0, 'notified': 0, 'chunks': 0}
+    notified = set()
+    now = datetime.utcnow()
+    for start in range(0, len(fault_ids), chunk_size):
+        try:
+            resolved, notifications = _resolve_chunk(fault_ids[start:start + chunk_size], status, notes, user_id,
+                                                     now, notified)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        summary['resolved'] += resolved
+        summary['notified'] += notifications
+        summary['chunks'] += 1
+    return summary
@@ -0,0 +1,305 @@
+"""
+Crew calendar
+Per-technician index of booked time, used to stop double-booking when maintenance is
+scheduled or a plan is imported:
+- a maintenance slot is scheduled_date + scheduled_time (CREW_DAY_START when unset)
+  for estimated_duration hours (CREW_DEFAULT_DURATION_HOURS when unset),
+- an open fault assignment blocks CREW_FAULT_HOURS from its assigned_date,
+- visits of recurring series are expanded for the window being checked.
+
+A technician's bookings are loaded on first use and kept in an interval tree: a treap
+ordered by start whose nodes also hold the latest end in their subtree, so adding or
+removing a booking is O(log n) and an overlap query skips every subtree that ends
+before the window (O(log n) per booking found, expected). Before each
+check the highest change_seq of their faults, schedules and sync tombstones is read
+(three index probes); if it moved, only the rows changed since are re-read and patched
+in. Writes from every worker process are therefore seen without reloading anything.
+"""
+import random
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Fault, MaintenanceSchedule, SyncTombstone
+from app.utils.recurrence import occurrences_between
+
+ACTIVE_MAINTENANCE = ('scheduled', 'in_progress')
+CLOSED_FAULTS = ('resolved', 'closed')
+LOOKBACK = timedelta(days=1)  # bookings that ended before this are never loaded
+
+Booking = namedtuple('Booking', 'start end kind ref')
+
+_KINDS = {'maintenance_schedules': 'maintenance', 'faults': 'fault'}
+
+
+def _day_start():
+    return time.fromisoformat(current_app.config.get('CREW_DAY_START', '08:00'))
+
+
+def maintenance_slot(scheduled_date, scheduled_time=None, estimated_duration=None):
+    """(start, end) datetimes booked by a maintenance visit"""
+    start = datetime.combine(scheduled_date, scheduled_time or _day_start())
+    hours = int(estimated_duration or current_app.config.get('CREW_DEFAULT_DURATION_HOURS', 4))
+    return start, start + timedelta(hours=max(hours, 1))
+
+
+def slot_hours(start, end):
+    return int((end - start).total_seconds() // 3600)
+
+
+def fault_slot(assigned_date):
+    return assigned_date, assigned_date + timedelta(hours=current_app.config.get('CREW_FAULT_HOURS', 4))
+
+
+class _Node:
+    """Treap node: a booking, a random heap priority and the latest end in its subtree"""
+    __slots__ = ('booking', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, booking):
+        self.booking = booking
+        self.priority = random.random()
+        self.left = self.right = None
+        self.max_end = booking.end
+
+    def update(self):
+        self.max_end = max([self.booking.end] + [child.max_end for child in (self.left, self.right) if child])
+        return self
+
+
+def _split(node, booking, after=False):
+    """(bookings before `booking`, the rest); with after=True `booking` itself goes left"""
+    if node is None:
+        return None, None
+    if node.booking < booking or (after and node.booking == booking):
+        node.right, right = _split(node.right, booking, after)
+        return node.update(), right
+    left, node.left = _split(node.left, booking, after)
+    return left, node.update()
+
+
+def _merge(left, right):
+    """Join two treaps where every booking in `left` sorts before every booking in `right`"""
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left.update()
+    right.left = _merge(left, right.left)
+    return right.update()
+
+
+class TechnicianCalendar:
+    """Bookings of one technician in an interval tree (treap by start, augmented with the latest end)"""
+
+    def __init__(self):
+        self.root = None
+        self.by_ref = {}
+        self.change_seq = 0
+
+    def __len__(self):
+        return len(self.by_ref)
+
+    def add(self, booking):
+        self.discard(booking.kind, booking.ref)
+        left, right = _split(self.root, booking)
+        self.root = _merge(_merge(left, _Node(booking)), right)
+        self.by_ref[booking.kind, booking.ref] = booking
+
+    def discard(self, kind, ref):
+        booking = self.by_ref.pop((kind, ref), None)
+        if booking is not None:
+            left, rest = _split(self.root, booking)
+            _, right = _split(rest, booking, after=True)
+            self.root = _merge(left, right)
+
+    def overlapping(self, start, end, ignore=None):
+        """Bookings that intersect [start, end), by start"""
+        found = []
+        stack, node = [], self.root
+        while stack or node is not None:
+            # Walk left while the subtree can still reach past `start`; in-order keeps results sorted
+            while node is not None and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            booking = node.booking
+            if booking.start >= end:
+                break  # this booking and everything after it starts too late
+            if booking.end > start and (booking.kind, booking.ref) != ignore:
+                found.append(booking)
+            node = node.right
+        return found
+
+
+def _series_calendar(technician_id, first_day, last_day):
+    """Visits of the technician's recurring series in [first_day, last_day], as a calendar"""
+    calendar = TechnicianCalendar()
+    for occurrence in occurrences_between(first_day, last_day, assigned_to=technician_id):
+        start, end = maintenance_slot(occurrence.occurrence_date, occurrence.scheduled_time,
+                                      occurrence.estimated_duration)
+        calendar.add(Booking(start, end, 'series', (occurrence.series_id, occurrence.occurrence_date)))
+    return calendar
+
+
+class CrewCalendar:
+    """Process-wide technician calendars, loaded lazily and brought up to date before each use"""
+
+    def __init__(self):
+        self._calendars = {}
+        self._lock = threading.RLock()
+
+    # ---- loading ----
+
+    @staticmethod
+    def _latest_seq(technician_id):
+        probes = [
+            select(func.max(Fault.change_seq)).where(Fault.assigned_to == technician_id),
+            select(func.max(MaintenanceSchedule.change_seq)).where(MaintenanceSchedule.assigned_to == technician_id),
+            select(func.max(SyncTombstone.change_seq)).where(SyncTombstone.user_id == technician_id),
+        ]
+        return max(db.session.execute(select(*(probe.scalar_subquery() for probe in probes))).one(),
+                   key=lambda seq: seq or 0) or 0
+
+    @staticmethod
+    def _apply(calendar, technician_id, after_seq):
+        """Patch in rows assigned to, or taken from, the technician after `after_seq` (all rows for 0)"""
+        since = datetime.combine(date.today(), time()) - LOOKBACK
+
+        schedules = db.session.query(
+            MaintenanceSchedule.maintenance_id, MaintenanceSchedule.scheduled_date, MaintenanceSchedule.scheduled_time,
+            MaintenanceSchedule.estimated_duration, MaintenanceSchedule.status
+        ).filter(MaintenanceSchedule.assigned_to == technician_id)
+        faults = db.session.query(Fault.fault_id, Fault.assigned_date, Fault.reported_date, Fault.status).filter(
+            Fault.assigned_to == technician_id)
+        if after_seq:
+            schedules = schedules.filter(MaintenanceSchedule.change_seq > after_seq)
+            faults = faults.filter(Fault.change_seq > after_seq)
+            for table_name, record_id in db.session.query(SyncTombstone.table_name, SyncTombstone.record_id).filter(
+                    SyncTombstone.user_id == technician_id, SyncTombstone.change_seq > after_seq):
+                if table_name in _KINDS:
+                    calendar.discard(_KINDS[table_name], record_id)
+        else:
+            schedules = schedules.filter(MaintenanceSchedule.status.in_(ACTIVE_MAINTENANCE),
+                                         MaintenanceSchedule.scheduled_date >= since.date())
+            faults = faults.filter(Fault.status.notin_(CLOSED_FAULTS))
+
+        for maintenance_id, scheduled_date, scheduled_time, duration, status in schedules:
+            start, end = maintenance_slot(scheduled_date, scheduled_time, duration)
+            if status in ACTIVE_MAINTENANCE and end > since:
+                calendar.add(Booking(start, end, 'maintenance', maintenance_id))
+            else:
+                calendar.discard('maintenance', maintenance_id)
+        for fault_id, assigned_date, reported_date, status in faults:
+            start, end = fault_slot(assigned_date or reported_date)
+            if status not in CLOSED_FAULTS and end > since:
+                calendar.add(Booking(start, end, 'fault', fault_id))
+            else:
+                calendar.discard('fault', fault_id)
+
+    def calendar(self, technician_id):
+        """The technician's calendar, current as of this call"""
+        with self._lock:
+            latest = self._latest_seq(technician_id)
+            calendar = self._calendars.get(technician_id)
+            if calendar is None:
+                calendar = self._calendars[technician_id] = TechnicianCalendar()
+                self._apply(calendar, technician_id, 0)
+            elif latest > calendar.change_seq:
+                self._apply(calendar, technician_id, calendar.change_seq)
+            calendar.change_seq = latest
+            return calendar
+
+    # ---- queries ----
+
+    def conflicts(self, technician_id, start, end, ignore=None):
+        """Bookings (maintenance, fault or series visit) that overlap [start, end) for the technician"""
+        with self._lock:
+            found = self.calendar(technician_id).overlapping(start, end, ignore)
+        series = _series_calendar(technician_id, start.date(), end.date()).overlapping(start, end, ignore)
+        return sorted(found + series)
+
+    def next_free_slot(self, technician_id, after, hours, horizon_days=None, also=None):
+        """
+        Earliest start at or after `after` when the technician is free for `hours`,
+        within the working day (CREW_DAY_START to CREW_DAY_END)
+
+        `also` is an extra TechnicianCalendar to keep clear of (e.g. a plan being imported).
+
+        Returns:
+            datetime, or None if nothing is free within horizon_days (CREW_SUGGEST_DAYS)
+        """
+        horizon_days = horizon_days or current_app.config.get('CREW_SUGGEST_DAYS', 14)
+        day_start = _day_start()
+        day_end = time.fromisoformat(current_app.config.get('CREW_DAY_END', '17:00'))
+        duration = timedelta(hours=int(hours or current_app.config.get('CREW_DEFAULT_DURATION_HOURS', 4)))
+        last_day = after.date() + timedelta(days=horizon_days)
+        others = [_series_calendar(technician_id, after.date(), last_day)] + ([also] if also is not None else [])
+
+        with self._lock:
+            calendar = self.calendar(technician_id)
+            candidate = max(after, datetime.combine(after.date(), day_start))
+            while candidate.date() <= last_day:
+                if candidate + duration > datetime.combine(candidate.date(), day_end):
+                    candidate = datetime.combine(candidate.date() + timedelta(days=1), day_start)
+                    continue
+                clashes = [b for c in [calendar] + others for b in c.overlapping(candidate, candidate + duration)]
+                if not clashes:
+                    return candidate
+                candidate = max(b.end for b in clashes)
+        return None
+
+    def validate_plan(self, rows):
+        """
+        Check an imported plan against existing bookings and against itself
+
+        Args:
+            rows: dicts with assigned_to, scheduled_date, scheduled_time, estimated_duration
+                and optionally the row number in the source file ('row')
+
+        Returns:
+            One dict per row: {'row', 'start', 'end', 'conflicts', 'suggestion'}; conflicts
+            with earlier rows of the same plan have kind 'plan' and the row number as ref
+        """
+        planned = {}
+        results = []
+        for number, row in enumerate(rows, start=1):
+            number = row.get('row', number)
+            start, end = maintenance_slot(row['scheduled_date'], row.get('scheduled_time'),
+                                          row.get('estimated_duration'))
+            result = {'row': number, 'start': start, 'end': end, 'conflicts': [], 'suggestion': None}
+            technician_id = row.get('assigned_to')
+            if technician_id:
+                own = planned.setdefault(technician_id, TechnicianCalendar())
+                result['conflicts'] = self.conflicts(technician_id, start, end) + own.overlapping(start, end)
+                if result['conflicts']:
+                    result['suggestion'] = self.next_free_slot(technician_id, start, slot_hours(start, end),
+                                                               also=own)
+                own.add(Booking(start, end, 'plan', number))
+            results.append(result)
+        return results
+
+
+def get_crew_calendar():
+    """Process-wide crew calendar for the current app"""
+    calendar = current_app.extensions.get('crew_calendar')
+    if calendar is None:
+        calendar = current_app.extensions['crew_calendar'] = CrewCalendar()
+    return calendar
+
+
+def describe(booking):
+    """Short human label for a booking, for flash messages and the plan report"""
+    when = f"{booking.start.strftime('%b %d %H:%M')}-{booking.end.strftime('%H:%M')}"
+    if booking.kind == 'maintenance':
+        return f'maintenance #{booking.ref} ({when})'
+    if booking.kind == 'fault':
+        return f'fault #{booking.ref} ({when})'
+    if booking.kind == 'series':
+        return f'recurring series #{booking.ref[0]} visit ({when})'
+    return f'plan row {booking.ref} ({when})'
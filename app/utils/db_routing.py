@@ -0,0 +1,171 @@
+"""
+Read-replica routing
+When REPLICA_DATABASE_URI is configured, SELECTs issued while handling a
+replica-eligible request go to the replica; everything else uses the primary.
+The replica engine is kept out of SQLALCHEMY_BINDS so db.create_all() and
+migrations never touch it.
+
+A request is replica-eligible when its view is marked with @replica_reads (or the
+blueprint opts in with a before_request hook), unless:
+- the session has already written in this request (read-your-writes within a request),
+- the client wrote within the last REPLICA_STICKY_SECONDS (read-your-writes across
+  the redirect that usually follows a POST), or
+- the replica is lagging more than REPLICA_MAX_LAG_SECONDS or cannot be reached.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, text
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+_STICKY_KEY = '_db_primary_until'
+
+
+def replica_reads(f):
+    """
+    Decorator letting a read-only view run its SELECTs on the replica
+
+    Usage:
+        @replica_reads
+        def list_view():
+            pass
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_replica = True
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def replica_request():
+    """True while handling a request marked for replica reads; such requests should not write"""
+    return has_request_context() and bool(g.get('db_read_replica'))
+
+
+@contextmanager
+def primary_reads():
+    """
+    Run the enclosed SELECTs on the primary, even in a replica-eligible request
+
+    For reads whose result outlives the request (cached results) or decides a write
+    (duplicate checks), where replica lag would be kept or acted on.
+    """
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_read_replica')
+    g.db_read_replica = False
+    try:
+        yield
+    finally:
+        g.db_read_replica = previous
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible SELECTs to the replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and not isinstance(clause, Select)):
+                self.info['wrote'] = True
+            else:
+                replica = self._replica_engine()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        """The replica engine if this read may use it, else None"""
+        if not has_request_context() or not g.get('db_read_replica') or self.info.get('wrote'):
+            return None
+        monitor = current_app.extensions.get('replica_monitor')
+        if monitor is None or session.get(_STICKY_KEY, 0) > time.time():
+            return None
+        return monitor.engine if monitor.healthy() else None
+
+
+class ReplicaMonitor:
+    """
+    Replica engine plus a cached lag check
+
+    The lag is probed at most every `check_interval` seconds per process. MySQL
+    replicas report Seconds_Behind_Source; a replica that is not replicating (probe
+    returns None) or cannot be reached counts as unhealthy. Engines without a
+    replication status (e.g. SQLite files in tests) report zero lag.
+    """
+
+    def __init__(self, engine, max_lag=5, check_interval=2.0):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lag = None
+
+    def probe(self):
+        """Current replica lag in seconds, or None if replication is stopped"""
+        if self.engine.dialect.name != 'mysql':
+            return 0
+        with self.engine.connect() as connection:
+            for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                      ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+                try:
+                    row = connection.execute(text(statement)).mappings().first()
+                except Exception:
+                    continue
+                # Not configured as a replica (e.g. a standalone read copy): no lag to wait for
+                return 0 if row is None else row.get(column)
+        return None
+
+    def lag(self):
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                try:
+                    self._lag = self.probe()
+                except Exception:
+                    logger.warning('Replica lag probe failed; reading from primary', exc_info=True)
+                    self._lag = None
+                self._checked_at = time.monotonic()
+            return self._lag
+
+    def healthy(self):
+        lag = self.lag()
+        return lag is not None and lag <= self.max_lag
+
+
+def _forget_writes():
+    # The session can outlive a request (e.g. a shared app context), so track writes per request
+    current_app.extensions['sqlalchemy'].session().info.pop('wrote', None)
+
+
+def _remember_write(response):
+    """Keep this client on the primary for a short while after it wrote"""
+    if current_app.extensions['sqlalchemy'].session().info.get('wrote'):
+        session[_STICKY_KEY] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+    return response
+
+
+def init_db_routing(app):
+    """Create the replica engine and read-your-writes tracking when a replica is configured"""
+    uri = app.config.get('REPLICA_DATABASE_URI')
+    if not uri:
+        return None
+
+    engine = create_engine(uri, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.extensions['replica_monitor'] = ReplicaMonitor(
+        engine,
+        max_lag=app.config.get('REPLICA_MAX_LAG_SECONDS', 5),
+        check_interval=app.config.get('REPLICA_LAG_CHECK_INTERVAL', 2.0)
+    )
+    app.before_request(_forget_writes)
+    app.after_request(_remember_write)
+    return app.extensions['replica_monitor']
@@ -0,0 +1,79 @@
+"""
+Fault list facet counts
+How many faults sit behind each status, severity and type option of the fault list
+filters. Each facet's counts respect the other two active filters (but not its own,
+so every option shows what picking it would give) and the technician's scope.
+
+One grouped query returns the fault count per (status, severity, type) cell, at most
+a few hundred rows; every facet for every filter combination is summed from those
+cells in Python. The cells are cached per scope for FAULT_FACETS_TTL seconds, so the
+dropdowns cost at most one round trip per scope per TTL. The rendered dropdowns are
+fragment-cached under a digest of the counts, so a recount that finds nothing changed
+keeps hitting the same entry.
+"""
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.models import Fault
+
+FACETS = ('status', 'severity', 'fault_type')
+
+Facets = namedtuple('Facets', 'counts key')
+
+_lock = threading.Lock()
+
+
+def technician_scope(user_id):
+    """Faults a technician may see: those assigned to them, and any still unassigned"""
+    return (Fault.assigned_to == user_id) | (Fault.status == 'reported')
+
+
+def _cells(technician_id):
+    query = db.session.query(Fault.status, Fault.severity, Fault.fault_type, func.count()).group_by(
+        Fault.status, Fault.severity, Fault.fault_type)
+    if technician_id is not None:
+        query = query.filter(technician_scope(technician_id))
+    return query.all()
+
+
+def _cached_cells(technician_id):
+    ttl = current_app.config.get('FAULT_FACETS_TTL', 30)
+    cache = current_app.extensions.setdefault('fault_facets', {})
+    now = time.monotonic()
+    with _lock:
+        entry = cache.get(technician_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    cells = _cells(technician_id)
+    with _lock:
+        cache[technician_id] = (now + ttl, cells)
+    return cells
+
+
+def fault_facets(filters, technician_id=None):
+    """
+    Counts for every value of each fault list filter
+
+    Args:
+        filters: the active filters, {'status': ..., 'severity': ..., 'fault_type': ...}; blank means any
+        technician_id: limit to technician_scope() of this user
+
+    Returns:
+        Facets(counts={'status': {value: n}, 'severity': {...}, 'fault_type': {...}}, key);
+        key is a digest of the counts, the same whenever they are, for fragment cache keys
+    """
+    cells = _cached_cells(technician_id)
+    counts = {facet: {} for facet in FACETS}
+    for *values, n in cells:
+        row = dict(zip(FACETS, values))
+        for facet in FACETS:
+            if all(not filters.get(other) or row[other] == filters[other] for other in FACETS if other != facet):
+                counts[facet][row[facet]] = counts[facet].get(row[facet], 0) + n
+    canonical = repr([sorted(counts[facet].items(), key=repr) for facet in FACETS])
+    return Facets(counts, hashlib.blake2b(canonical.encode(), digest_size=12).hexdigest())
@@ -0,0 +1,229 @@
+"""
+Fault timeline reconstruction
+Replays fault_updates as an event log to answer point-in-time questions
+("what state was every fault in at 08:00 yesterday?") and to build per-fault
+status timelines.
+"""
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.models import Fault, FaultUpdate
+from app.utils.sync import current_change_seq
+
+INITIAL_STATUS = 'reported'
+
+# Event kinds stored in the engine (fault creation plus FaultUpdate.update_type values)
+KIND_REPORTED = 'reported'
+
+
+def status_periods(reported_date, updates, now=None):
+    """
+    Turn a fault's updates into consecutive status periods
+
+    Args:
+        reported_date: When the fault was reported (start of the first period)
+        updates: FaultUpdate rows (any order)
+        now: End of the current period (defaults to utcnow)
+
+    Returns:
+        List of dicts with status, start, end and hours
+    """
+    now = now or datetime.utcnow()
+    changes = sorted(
+        (u for u in updates if u.new_status),
+        key=lambda u: (u.update_date or now, u.update_id or 0)
+    )
+
+    periods = [{'status': INITIAL_STATUS, 'start': reported_date}]
+    for update in changes:
+        if update.new_status == periods[-1]['status']:
+            continue
+        periods.append({'status': update.new_status, 'start': update.update_date})
+
+    for current, following in zip(periods, periods[1:] + [None]):
+        current['end'] = following['start'] if following else None
+        end = current['end'] or now
+        current['hours'] = round((end - current['start']).total_seconds() / 3600, 2) if current['start'] else None
+    return periods
+
+
+class FaultTimelineEngine:
+    """
+    In-memory event replay over faults and fault_updates
+
+    Events are loaded in one ordered streaming pass (faults by reported_date merged with
+    fault_updates by update_date). Every `snapshot_every` events a copy of the fleet state
+    is kept, so an as-of query replays at most `snapshot_every` events from the nearest
+    snapshot instead of from the beginning.
+
+    Refreshes read the rows whose change_seq is above the one loaded through, so edits and
+    rows that commit late are not missed. A new or moved event (e.g. a backdated update) is
+    placed at its time, and only the snapshots after the earliest such place are replayed.
+    """
+
+    def __init__(self, snapshot_every=5000, stream_batch=2000):
+        self.snapshot_every = snapshot_every
+        self.stream_batch = stream_batch
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        # Parallel event columns, ordered by (time, 0 for reports / 1 for updates, id)
+        self.keys = []
+        self.fault_ids = []
+        self.statuses = []      # new status, or None for events that don't change state (notes)
+
+        self.events = {}                     # (0 or 1, id) -> loaded event tuple
+        self.per_fault = defaultdict(list)   # fault_id -> sorted keys of its events
+        self.snapshot_positions = [0]        # event index each snapshot was taken at
+        self.snapshots = [{}]                # fleet state {fault_id: status} at that index
+        self.state = {}
+        self.change_seq = 0  # faults and fault_updates are loaded through this sync sequence value
+        self.built_at = None
+
+    # ---- loading ----
+
+    def _fault_stream(self, after_seq=None):
+        query = db.session.query(Fault.fault_id, Fault.reported_date)
+        if after_seq is not None:
+            query = query.filter(Fault.change_seq > after_seq)
+        query = query.order_by(Fault.reported_date, Fault.fault_id).execution_options(yield_per=self.stream_batch)
+        for fault_id, reported_date in query:
+            yield (reported_date, 0, fault_id, fault_id, KIND_REPORTED, INITIAL_STATUS)
+
+    def _update_stream(self, after_seq=None):
+        query = db.session.query(
+            FaultUpdate.update_id, FaultUpdate.fault_id, FaultUpdate.update_date,
+            FaultUpdate.update_type, FaultUpdate.new_status
+        )
+        if after_seq is not None:
+            query = query.filter(FaultUpdate.change_seq > after_seq)
+        query = query.order_by(FaultUpdate.update_date, FaultUpdate.update_id).execution_options(
+            yield_per=self.stream_batch)
+        for update_id, fault_id, update_date, update_type, new_status in query:
+            yield (update_date, 1, update_id, fault_id, update_type, new_status or None)
+
+    def _place(self, event):
+        """
+        Insert `event` at its time, replacing the copy loaded earlier if it changed
+
+        Returns:
+            The lowest index whose state is affected, or None if nothing changed
+        """
+        when, order, event_id, fault_id, _kind, status = event
+        previous = self.events.get((order, event_id))
+        if previous == event:
+            return None
+        first = None
+        if previous is not None:
+            key = previous[:3]
+            first = bisect_left(self.keys, key)
+            del self.keys[first], self.fault_ids[first], self.statuses[first]
+            self.per_fault[previous[3]].remove(key)
+
+        key = (when, order, event_id)
+        index = bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.fault_ids.insert(index, fault_id)
+        self.statuses.insert(index, status)
+        insort(self.per_fault[fault_id], key)
+        self.events[(order, event_id)] = event
+        return index if first is None else min(first, index)
+
+    def _advance(self, state, start):
+        """Replay events from `start` onto `state`, taking snapshots along the way"""
+        for index in range(start, len(self.keys)):
+            status = self.statuses[index]
+            if status:
+                state[self.fault_ids[index]] = status
+            if index + 1 - self.snapshot_positions[-1] >= self.snapshot_every:
+                self.snapshot_positions.append(index + 1)
+                self.snapshots.append(dict(state))
+        self.state = state
+
+    def build(self):
+        """Rebuild everything from the database in one ordered pass"""
+        with self._lock:
+            self._reset()
+            through = current_change_seq()  # read first: rows committed after it are read again by refresh
+            for event in heapq.merge(self._fault_stream(), self._update_stream()):
+                when, order, event_id, fault_id, _kind, status = event
+                self.keys.append((when, order, event_id))
+                self.fault_ids.append(fault_id)
+                self.statuses.append(status)
+                self.per_fault[fault_id].append((when, order, event_id))
+                self.events[(order, event_id)] = event
+            self._advance({}, 0)
+            self.change_seq = through
+            self.built_at = datetime.utcnow()
+        return self
+
+    def refresh(self):
+        """Load events written since the last load, replaying only from the earliest one placed"""
+        with self._lock:
+            if self.built_at is None:
+                return self.build()
+            through = current_change_seq()
+            loaded = len(self.keys)
+            placed = [index for index in map(self._place, heapq.merge(self._fault_stream(self.change_seq),
+                                                                      self._update_stream(self.change_seq)))
+                      if index is not None]
+            if placed and min(placed) >= loaded:
+                self._advance(self.state, loaded)  # appended after everything loaded so far
+            elif placed:
+                keep = bisect_right(self.snapshot_positions, min(placed))
+                del self.snapshot_positions[keep:], self.snapshots[keep:]
+                self._advance(dict(self.snapshots[-1]), self.snapshot_positions[-1])
+            self.change_seq = max(self.change_seq, through)
+            self.built_at = datetime.utcnow()
+        return self
+
+    # ---- queries ----
+
+    def state_as_of(self, at):
+        """Status of every fault that existed at `at`: {fault_id: status}"""
+        with self._lock:
+            end = bisect_right(self.keys, (at, 2))
+            snapshot = bisect_right(self.snapshot_positions, end) - 1
+            state = dict(self.snapshots[snapshot])
+            for index in range(self.snapshot_positions[snapshot], end):
+                status = self.statuses[index]
+                if status:
+                    state[self.fault_ids[index]] = status
+            return state
+
+    def status_counts_as_of(self, at):
+        """Number of faults in each status at `at`"""
+        return dict(Counter(self.state_as_of(at).values()))
+
+    def timeline(self, fault_id):
+        """Ordered events for one fault, each with the status in force afterwards"""
+        with self._lock:
+            events = []
+            status = None
+            for when, order, event_id in self.per_fault.get(fault_id, []):
+                kind, new_status = self.events[(order, event_id)][4:]
+                status = new_status or status
+                events.append({
+                    'time': when.isoformat() if when else None,
+                    'event': kind,
+                    'update_id': event_id if order else None,
+                    'status': status
+                })
+            return events
+
+
+def get_timeline_engine():
+    """Process-wide engine for the current app, refreshed incrementally on each call"""
+    engine = current_app.extensions.get('fault_timeline')
+    if engine is None:
+        engine = current_app.extensions['fault_timeline'] = FaultTimelineEngine(
+            snapshot_every=current_app.config.get('FAULT_TIMELINE_SNAPSHOT_EVERY', 5000)
+        )
+    return engine.refresh()
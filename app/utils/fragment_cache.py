@@ -0,0 +1,132 @@
+"""
+Template fragment cache
+A `{% cache %}` tag for blocks that are expensive to render but rarely change
+(navigation, enum-driven filter dropdowns, summary widgets):
+
+    {% cache 'sidebar_nav', request.endpoint %} ... {% endcache %}
+    {% cache 'footer_stats' ttl 60 %} ... {% endcache %}
+
+The key is the fragment name, the viewer's role, the cache version stamp and any
+extra expressions given. Entries live in a per-process LRU; a new version stamp
+(FRAGMENT_CACHE_VERSION, or invalidate() at runtime) retires every entry at once.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_request_context
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.models import Customer, Fault, MaintenanceSchedule, Connection
+
+
+class FragmentCache:
+    """Size-bounded LRU of rendered fragments with optional per-entry expiry"""
+
+    def __init__(self, version='1', max_entries=1024, default_ttl=None):
+        self.version = str(version)
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0}
+
+    @property
+    def stamp(self):
+        return f'{self.version}.{self._generation}'
+
+    def get_or_render(self, key, render, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        key = (self.stamp,) + key
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+
+        value = render()
+        with self._lock:
+            self._entries[key] = (value, now + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Retire every cached fragment (e.g. after a role or menu change)"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), stamp=self.stamp)
+
+
+def _viewer_role():
+    if not has_request_context():
+        return None
+    if current_user and current_user.is_authenticated:
+        return current_user.role
+    return 'customer' if g.get('customer') is not None else 'anonymous'
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension implementing {% cache name[, key...] [ttl seconds] %}...{% endcache %}"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        ttl = nodes.Const(None)
+        if parser.stream.skip_if('name:ttl'):
+            ttl = parser.parse_expression()
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(args), ttl]), [], [], body).set_lineno(lineno)
+
+    def _render(self, args, ttl, caller):
+        cache = current_app.extensions.get('fragment_cache')
+        if cache is None or not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+            return caller()
+        name, *parts = args
+        key = (name, _viewer_role()) + tuple(str(part) for part in parts)
+        return Markup(cache.get_or_render(key, caller, ttl))
+
+
+# Enum columns offered as filter dropdowns, so the options always match the schema
+ENUM_COLUMNS = {
+    ('faults', 'status'): Fault.status,
+    ('faults', 'severity'): Fault.severity,
+    ('faults', 'fault_type'): Fault.fault_type,
+    ('maintenance_schedules', 'status'): MaintenanceSchedule.status,
+    ('maintenance_schedules', 'maintenance_type'): MaintenanceSchedule.maintenance_type,
+    ('connections', 'connection_status'): Connection.connection_status,
+    ('customers', 'customer_type'): Customer.customer_type,
+}
+
+
+def enum_options(table, column):
+    """[(value, label)] for an enum column, e.g. ('in_progress', 'In Progress')"""
+    return [(value, value.replace('_', ' ').title()) for value in ENUM_COLUMNS[(table, column)].type.enums]
+
+
+def init_fragment_cache(app):
+    """Register the {% cache %} tag, enum_options() and the per-process fragment store"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['enum_options'] = enum_options
+    app.extensions['fragment_cache'] = FragmentCache(
+        version=app.config.get('FRAGMENT_CACHE_VERSION', '1'),
+        max_entries=app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 1024),
+        default_ttl=app.config.get('FRAGMENT_CACHE_TTL')
+    )
+    return app.extensions['fragment_cache']
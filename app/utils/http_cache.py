@@ -0,0 +1,131 @@
+"""
+HTTP response layer: compression, weak ETags and per-endpoint cache policies
+Runs as the app's last after_request hook:
+1. Cache-Control comes from @cache_policy on the view, else 'private, no-cache'
+   for pages and JSON (always revalidate, never stored by shared proxies).
+2. Buffered 200 responses to GET/HEAD get a weak ETag of the uncompressed body;
+   a matching If-None-Match turns the response into an empty 304.
+3. Compressible bodies of at least COMPRESS_MIN_SIZE bytes are brotli- (when the
+   optional `brotli` package is installed) or gzip-encoded. Streamed responses are
+   compressed chunk by chunk with a flush after each one, so they still stream;
+   they get no ETag. File responses (direct passthrough) are left alone.
+"""
+import gzip
+import zlib
+from functools import wraps
+
+from flask import current_app, g, request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+def cache_policy(max_age=0, private=True, no_store=False):
+    """
+    Decorator declaring how clients may cache a view's response
+
+    Args:
+        max_age: Seconds the response may be reused without revalidation
+                 (0 means revalidate every time, using the ETag)
+        private: Only the user's browser may cache it, not shared proxies
+        no_store: Never cache (e.g. job status polling)
+
+    Usage:
+        @cache_policy(max_age=300)
+        def chart_data():
+            pass
+    """
+    if no_store:
+        header = 'no-store'
+    else:
+        header = f"{'private' if private else 'public'}, " + (f'max-age={max_age}' if max_age else 'no-cache')
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.cache_policy = header
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def _choose_encoding():
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(offered)
+
+
+def _compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _compress_stream(chunks, encoding, level):
+    """Compress an iterable of chunks, flushing after each so the client sees them promptly"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(level, 11))
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def _encode_chunks(iterable):
+    for chunk in iterable:
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def finalize_response(response):
+    """after_request hook applying cache headers, conditional GETs and compression"""
+    config = current_app.config
+    if response.direct_passthrough:
+        return response
+
+    compressible = response.mimetype in config.get('COMPRESS_MIMETYPES', ())
+    if compressible and 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = g.get('cache_policy', 'private, no-cache')
+
+    if (response.status_code == 200 and request.method in ('GET', 'HEAD') and not response.is_streamed
+            and 'ETag' not in response.headers):
+        response.add_etag(weak=True)
+        response.make_conditional(request)
+
+    if (not compressible or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or not config.get('COMPRESS_ENABLED', True)):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    level = config.get('COMPRESS_LEVEL', 6)
+
+    if response.is_streamed:
+        response.response = _compress_stream(_encode_chunks(response.response), encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+        response.set_data(_compress(data, encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _reset_policy():
+    # g can outlive a request (e.g. a shared app context), so start each one without a policy
+    g.pop('cache_policy', None)
+
+
+def init_http_cache(app):
+    """Register the response layer; call before other after_request hooks so it runs last"""
+    app.before_request(_reset_policy)
+    app.after_request(finalize_response)
@@ -0,0 +1,118 @@
+"""
+Versioned SQL migrations
+Applies Database/migrations/NNN_name.sql files in order and records each version in
+schema_migrations. CREATE TABLE, CREATE INDEX and ALTER TABLE ... ADD COLUMN / ADD
+CONSTRAINT statements for tables, indexes, columns and constraints that already exist,
+and DROP INDEX / DROP COLUMN statements for indexes and columns that do not, are skipped, so a database built
+from the current schema.sql (or db.create_all) migrates cleanly. Tables that a later pending
+migration drops are not created. SQLite cannot add constraints to an existing table, so
+ADD CONSTRAINT is skipped there.
+"""
+import os
+import re
+
+from sqlalchemy import inspect, text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                              'Database', 'migrations')
+
+_CREATE_INDEX = re.compile(r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+_DROP_TABLE = re.compile(r'^DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+_DROP_INDEX = re.compile(r'^DROP\s+INDEX\s+(\w+)\s+ON\s+(\w+)', re.IGNORECASE)
+_ADD_CONSTRAINT = re.compile(r'^ALTER\s+TABLE\s+(\w+)\s+ADD\s+CONSTRAINT\s+(\w+)\s', re.IGNORECASE)
+_ADD_COLUMN = re.compile(r'^ALTER\s+TABLE\s+(\w+)\s+ADD\s+(?:COLUMN\s+)?(\w+)\s', re.IGNORECASE)
+_DROP_COLUMN = re.compile(r'^ALTER\s+TABLE\s+(\w+)\s+DROP\s+(?:COLUMN\s+)?(\w+)$', re.IGNORECASE)
+
+
+def migration_files(directory=MIGRATIONS_DIR):
+    """[(version, path)] sorted by version, e.g. ('001_query_indexes', '.../001_query_indexes.sql')"""
+    if not os.path.isdir(directory):
+        return []
+    return [(name[:-4], os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name.endswith('.sql')]
+
+
+def split_statements(sql):
+    """Statements in a migration file, with comment lines removed"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def _ensure_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version VARCHAR(50) PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as connection:
+        _ensure_table(connection)
+        return {row[0] for row in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def _index_exists(connection, table, name):
+    inspector = inspect(connection)
+    # SQLite reports a UNIQUE table constraint only as a constraint, not as an index
+    return any(index['name'] == name for index in inspector.get_indexes(table)) or any(
+        constraint['name'] == name for constraint in inspector.get_unique_constraints(table))
+
+
+def _constraint_exists(connection, table, name):
+    inspector = inspect(connection)
+    return any(constraint['name'] == name
+               for constraint in inspector.get_foreign_keys(table) + inspector.get_unique_constraints(table))
+
+
+def _column_exists(connection, table, name):
+    return any(column['name'] == name for column in inspect(connection).get_columns(table))
+
+
+def apply_migrations(engine, directory=MIGRATIONS_DIR):
+    """
+    Apply pending migrations, each in its own transaction
+
+    Returns:
+        List of versions applied
+    """
+    done = applied_versions(engine)
+    pending = []
+    for version, path in migration_files(directory):
+        if version not in done:
+            with open(path, encoding='utf-8') as fh:
+                pending.append((version, split_statements(fh.read())))
+
+    applied = []
+    for position, (version, statements) in enumerate(pending):
+        dropped_later = {match.group(1) for _, later in pending[position + 1:]
+                         for match in map(_DROP_TABLE.match, later) if match}
+        with engine.begin() as connection:
+            for statement in statements:
+                match = _CREATE_INDEX.match(statement)
+                if match and (match.group(2) in dropped_later or _index_exists(connection, *match.group(2, 1))):
+                    continue
+                match = _CREATE_TABLE.match(statement)
+                if match and (match.group(1) in dropped_later or inspect(connection).has_table(match.group(1))):
+                    continue
+                match = _DROP_INDEX.match(statement)
+                if match:
+                    if not _index_exists(connection, match.group(2), match.group(1)):
+                        continue
+                    if connection.dialect.name == 'sqlite':
+                        statement = f'DROP INDEX {match.group(1)}'  # SQLite index names are schema-wide, no ON
+                match = _ADD_CONSTRAINT.match(statement)
+                if match:
+                    if connection.dialect.name == 'sqlite' or _constraint_exists(connection, *match.groups()):
+                        continue
+                match = _ADD_COLUMN.match(statement)
+                if match and _column_exists(connection, match.group(1), match.group(2)):
+                    continue
+                match = _DROP_COLUMN.match(statement)
+                if match and not _column_exists(connection, match.group(1), match.group(2)):
+                    continue
+                connection.exec_driver_sql(statement)
+            connection.execute(text('INSERT INTO schema_migrations (version) VALUES (:version)'),
+                               {'version': version})
+        applied.append(version)
+    return applied
@@ -0,0 +1,432 @@
+"""
+Fault resolution-time (MTTR) analytics
+Loads resolved faults as NumPy columns and computes p50/p90/p99 and histograms
+per fault type, severity and county with vectorized operations.
+
+Two flavours:
+- resolution_percentiles(): exact, sort-based; used for ad-hoc date ranges.
+- mttr_stats table: per-group log-spaced histograms, which are additive, so changed
+  faults can be folded in (or taken out) without rereading history. Percentiles
+  derived from them are accurate to within one bin (about 3% relative).
+
+Keeping mttr_stats current:
+- a session hook sets faults.mttr_dirty on every fault whose resolution time or
+  grouping may have changed (resolved, reopened, re-resolved, backdated, edited);
+  bulk UPDATEs set it themselves,
+- mttr_folds records what each fault contributes now, so a background refresh
+  (MttrRefresher, every MTTR_REFRESH_SECONDS per worker, or the refresh-mttr command)
+  subtracts a flagged fault's old contribution, adds its new one and clears the flag.
+Request handlers never refresh; they only flag.
+"""
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import event, func, insert, update
+from sqlalchemy.orm import Session, aliased, attributes
+
+from app import db
+from app.models import Fault, Connection, Customer, MttrFold, MttrStat
+from app.utils.sync import next_sequence_value
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+DIMENSIONS = ('overall', 'fault_type', 'severity', 'county')
+
+# 400 log-spaced bins from one minute to one year (hours); outliers are clamped into the end bins
+HISTOGRAM_EDGES = np.geomspace(1 / 60, 24 * 365, num=401)
+HISTOGRAM_BINS = len(HISTOGRAM_EDGES) - 1
+
+# Coarse buckets used when showing a histogram (label, upper bound in hours)
+SLA_BUCKETS = (('< 1h', 1), ('1-4h', 4), ('4-12h', 12), ('12-24h', 24),
+               ('1-3 days', 72), ('3-7 days', 168), ('> 7 days', float('inf')))
+
+
+class ResolutionColumns:
+    """Resolution hours plus dictionary-encoded group columns for a set of resolved faults"""
+
+    def __init__(self, hours, codes, labels, fault_ids=None):
+        self.hours = hours              # float64 array
+        self.codes = codes              # {dimension: int32 array}
+        self.labels = labels            # {dimension: [label, ...]} indexed by code
+        self.fault_ids = fault_ids if fault_ids is not None else []
+        self._hour_order = None
+
+    @property
+    def hour_order(self):
+        """argsort of hours, computed once and shared by every dimension"""
+        if self._hour_order is None:
+            self._hour_order = np.argsort(self.hours)
+        return self._hour_order
+
+    def __len__(self):
+        return len(self.hours)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build columns from (reported_date, resolution_date, fault_type, severity, county, fault_id) tuples"""
+        reported, resolved, groups = [], [], []
+        for reported_date, resolution_date, *group in rows:
+            reported.append(reported_date)
+            resolved.append(resolution_date)
+            groups.append(group)
+
+        reported = np.array(reported, dtype='datetime64[s]')
+        resolved = np.array(resolved, dtype='datetime64[s]')
+        return cls._encode(np.maximum((resolved - reported).astype(np.float64) / 3600.0, 0.0), groups)
+
+    @classmethod
+    def from_samples(cls, rows):
+        """Build columns from (hours, fault_type, severity, county, fault_id) tuples, e.g. mttr_folds rows"""
+        hours, groups = [], []
+        for value, *group in rows:
+            hours.append(value)
+            groups.append(group)
+        return cls._encode(np.array(hours, dtype=np.float64), groups)
+
+    @classmethod
+    def _encode(cls, hours, groups):
+        """Dictionary-encode (fault_type, severity, county, fault_id) groups alongside hours"""
+        lookups = {d: {} for d in DIMENSIONS[1:]}
+        raw_codes = {d: [] for d in DIMENSIONS[1:]}
+        fault_ids = []
+        for fault_type, severity, county, fault_id in groups:
+            fault_ids.append(fault_id)
+            for dimension, value in (('fault_type', fault_type), ('severity', severity),
+                                     ('county', county or 'Unknown')):
+                lookup = lookups[dimension]
+                raw_codes[dimension].append(lookup.setdefault(value, len(lookup)))
+
+        codes = {'overall': np.zeros(len(hours), dtype=np.int32)}
+        labels = {'overall': ['all']}
+        for dimension in DIMENSIONS[1:]:
+            codes[dimension] = np.array(raw_codes[dimension], dtype=np.int32)
+            labels[dimension] = list(lookups[dimension])
+        return cls(hours, codes, labels, fault_ids)
+
+
+def load_resolution_columns(*filters, for_update=False):
+    """
+    Stream resolved faults (optionally filtered) into ResolutionColumns
+
+    for_update locks the fault rows read (and reads their latest committed values).
+    """
+    owner = aliased(Customer)
+    reporter = aliased(Customer)
+    county = func.coalesce(owner.county, reporter.county)
+
+    query = db.session.query(
+        Fault.reported_date, Fault.resolution_date, Fault.fault_type, Fault.severity, county, Fault.fault_id
+    ).outerjoin(
+        Connection, Fault.connection_id == Connection.connection_id
+    ).outerjoin(
+        owner, Connection.customer_id == owner.customer_id
+    ).outerjoin(
+        reporter, Fault.reported_by_customer == reporter.customer_id
+    ).filter(
+        Fault.resolution_date.isnot(None),
+        Fault.reported_date.isnot(None),
+        *filters
+    ).execution_options(yield_per=5000)
+    if for_update:
+        query = query.with_for_update(of=Fault)
+
+    return ResolutionColumns.from_rows(query)
+
+
+def resolution_percentiles(hours, codes, n_groups, hour_order=None):
+    """
+    Exact per-group percentiles, means and counts, without a Python loop over groups
+
+    Args:
+        hour_order: Optional np.argsort(hours), to share one sort across several dimensions
+
+    Returns:
+        dict with 'count', 'mean' and 'p<q>' arrays of length n_groups (NaN for empty groups)
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    result = {'count': counts}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['mean'] = np.bincount(codes, weights=hours, minlength=n_groups) / counts
+
+    if not len(hours):
+        for q in PERCENTILES:
+            result[f'p{q}'] = np.full(n_groups, np.nan)
+        return result
+
+    # Sort by value, then stably (radix) by group: each group becomes a sorted run starting at `starts`
+    order = np.argsort(hours) if hour_order is None else hour_order
+    order = order[np.argsort(codes[order], kind='stable')]
+    sorted_hours = hours[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    last = np.maximum(counts - 1, 0)
+
+    for q in PERCENTILES:
+        rank = starts + last * (q / 100.0)
+        lo = np.floor(rank).astype(np.int64)
+        hi = np.minimum(lo + 1, starts + last)
+        lo = np.minimum(lo, len(sorted_hours) - 1)
+        hi = np.minimum(hi, len(sorted_hours) - 1)
+        values = sorted_hours[lo] + (sorted_hours[hi] - sorted_hours[lo]) * (rank - lo)
+        values[counts == 0] = np.nan
+        result[f'p{q}'] = values
+    return result
+
+
+def histogram_bins(hours):
+    """Bin index of each value over HISTOGRAM_EDGES"""
+    return np.clip(np.searchsorted(HISTOGRAM_EDGES, hours, side='right') - 1, 0, HISTOGRAM_BINS - 1)
+
+
+def histogram_counts(hours, codes, n_groups, bins=None):
+    """Per-group counts over HISTOGRAM_EDGES, shape (n_groups, HISTOGRAM_BINS)"""
+    bins = histogram_bins(hours) if bins is None else bins
+    flat = np.bincount(codes.astype(np.int64) * HISTOGRAM_BINS + bins, minlength=n_groups * HISTOGRAM_BINS)
+    return flat.reshape(n_groups, HISTOGRAM_BINS)
+
+
+def histogram_percentiles(hist):
+    """Percentiles from per-group histograms, geometrically interpolated within the bin"""
+    counts = hist.sum(axis=1)
+    cumulative = np.cumsum(hist, axis=1)
+    rows = np.arange(hist.shape[0])
+    result = {}
+    for q in PERCENTILES:
+        target = counts * (q / 100.0)
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), HISTOGRAM_BINS - 1)
+        in_bin = hist[rows, index]
+        before = cumulative[rows, index] - in_bin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip(np.where(in_bin > 0, (target - before) / in_bin, 0.0), 0.0, 1.0)
+        lower, upper = HISTOGRAM_EDGES[index], HISTOGRAM_EDGES[index + 1]
+        values = lower * (upper / lower) ** fraction
+        values[counts == 0] = np.nan
+        result[f'p{q}'] = values
+    return result
+
+
+def coarse_histogram(histogram):
+    """Collapse a stored sparse histogram {bin: count} into SLA_BUCKETS"""
+    totals = [0] * len(SLA_BUCKETS)
+    for bin_index, count in (histogram or {}).items():
+        bin_index = int(bin_index)
+        midpoint = np.sqrt(HISTOGRAM_EDGES[bin_index] * HISTOGRAM_EDGES[bin_index + 1])
+        for position, (_label, upper) in enumerate(SLA_BUCKETS):
+            if midpoint < upper:
+                totals[position] += count
+                break
+    return [(label, total) for (label, _upper), total in zip(SLA_BUCKETS, totals)]
+
+
+def _float(value):
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def group_summary(columns, dimension):
+    """Exact percentile rows for one dimension, largest groups first"""
+    labels = columns.labels[dimension]
+    stats = resolution_percentiles(columns.hours, columns.codes[dimension], len(labels), columns.hour_order)
+    rows = [{
+        'group': label,
+        'count': int(stats['count'][i]),
+        'mean': _float(stats['mean'][i]),
+        **{f'p{q}': _float(stats[f'p{q}'][i]) for q in PERCENTILES}
+    } for i, label in enumerate(labels) if stats['count'][i]]
+    return sorted(rows, key=lambda row: -row['count'])
+
+
+def _dense(histogram):
+    counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    for bin_index, count in (histogram or {}).items():
+        counts[int(bin_index)] = count
+    return counts
+
+
+def _fold(stats, hists, columns, sign):
+    """Add (sign=1) or subtract (sign=-1) columns into the stats rows and their dense histograms"""
+    if not len(columns):
+        return
+    bins = histogram_bins(columns.hours)
+    for dimension in DIMENSIONS:
+        labels = columns.labels[dimension]
+        codes = columns.codes[dimension]
+        hist = histogram_counts(columns.hours, codes, len(labels), bins)
+        sums = np.bincount(codes, weights=columns.hours, minlength=len(labels))
+        for i, label in enumerate(labels):
+            key = (dimension, label)
+            stat = stats.get(key)
+            if stat is None:
+                stat = stats[key] = MttrStat(group_type=dimension, group_value=label, sample_count=0, total_hours=0.0)
+                db.session.add(stat)
+            if key not in hists:
+                hists[key] = _dense(stat.histogram)
+            hists[key] += sign * hist[i]
+            stat.total_hours = (stat.total_hours or 0.0) + sign * float(sums[i])
+
+
+def _store(stats, hists):
+    """Write the folded histograms back with fresh percentiles; groups left empty are removed"""
+    now = datetime.utcnow()
+    keys = [key for key in hists if hists[key].sum() > 0]
+    for key in hists:
+        if key not in keys:
+            stat = stats[key]
+            if stat in db.session.new:
+                db.session.expunge(stat)
+            else:
+                db.session.delete(stat)
+    if not keys:
+        return
+    hist = np.stack([hists[key] for key in keys])
+    percentiles = histogram_percentiles(hist)
+    for i, key in enumerate(keys):
+        stat = stats[key]
+        stat.histogram = {str(b): int(hist[i, b]) for b in np.flatnonzero(hist[i])}
+        stat.sample_count = int(hist[i].sum())
+        stat.total_hours = max(stat.total_hours, 0.0)
+        stat.p50_hours = _float(percentiles['p50'][i])
+        stat.p90_hours = _float(percentiles['p90'][i])
+        stat.p99_hours = _float(percentiles['p99'][i])
+        stat.updated_at = now
+
+
+def _record_folds(columns):
+    if not len(columns):
+        return
+    fault_types, severities, counties = (
+        [columns.labels[d][code] for code in columns.codes[d]] for d in ('fault_type', 'severity', 'county'))
+    db.session.execute(insert(MttrFold), [{
+        'fault_id': fault_id, 'hours': float(hours), 'fault_type': fault_type, 'severity': severity, 'county': county
+    } for fault_id, hours, fault_type, severity, county in zip(
+        columns.fault_ids, columns.hours.tolist(), fault_types, severities, counties)])
+
+
+def _clear_flags(*filters):
+    # updated_at is kept: clearing the flag is bookkeeping, not a change to the fault
+    db.session.execute(update(Fault).where(Fault.mttr_dirty.is_(True), *filters).values(
+        mttr_dirty=False, updated_at=Fault.updated_at).execution_options(synchronize_session=False))
+
+
+def refresh_mttr_stats(full=False, batch_size=5000):
+    """
+    Fold flagged faults into mttr_stats
+
+    Each batch locks up to batch_size faults with mttr_dirty set, subtracts what
+    mttr_folds says they contributed, adds what they contribute now (nothing, if
+    reopened) and clears their flags, all in one transaction. Use full=True to rebuild
+    every row from the faults table.
+
+    Runs are serialized on the 'mttr_stats' counter row in sync_sequence, and the stats
+    rows are read FOR UPDATE. Meant for MttrRefresher and the refresh-mttr command:
+    request handlers only flag faults.
+
+    Returns:
+        Number of faults folded
+    """
+    if full:
+        return _rebuild()
+
+    total = 0
+    while db.session.query(Fault.query.filter(Fault.mttr_dirty.is_(True)).exists()).scalar():
+        next_sequence_value(db.session, 'mttr_stats')  # row lock held until commit
+        fault_ids = [fault_id for (fault_id,) in db.session.query(Fault.fault_id).filter(
+            Fault.mttr_dirty.is_(True)).order_by(Fault.fault_id).limit(batch_size).with_for_update()]
+        if not fault_ids:
+            break
+        stats = {(s.group_type, s.group_value): s for s in MttrStat.query.with_for_update().populate_existing()}
+        hists = {}
+        folded = MttrFold.query.filter(MttrFold.fault_id.in_(fault_ids))
+        _fold(stats, hists, ResolutionColumns.from_samples(
+            (f.hours, f.fault_type, f.severity, f.county, f.fault_id) for f in folded), -1)
+        current = load_resolution_columns(Fault.fault_id.in_(fault_ids), for_update=True)
+        _fold(stats, hists, current, 1)
+
+        MttrFold.query.filter(MttrFold.fault_id.in_(fault_ids)).delete(synchronize_session=False)
+        _record_folds(current)
+        _clear_flags(Fault.fault_id.in_(fault_ids))
+        _store(stats, hists)
+        db.session.commit()
+        total += len(fault_ids)
+    db.session.commit()
+    return total
+
+
+def _rebuild():
+    next_sequence_value(db.session, 'mttr_stats')
+    MttrStat.query.delete()
+    MttrFold.query.delete()
+    # Flags go before the locking read: a fault changed after it is flagged again and re-folded next run
+    _clear_flags()
+    columns = load_resolution_columns(for_update=True)
+    stats, hists = {}, {}
+    _fold(stats, hists, columns, 1)
+    _record_folds(columns)
+    _store(stats, hists)
+    db.session.commit()
+    return len(columns)
+
+
+# ---- flagging changed faults ----
+
+# Attributes that move a fault's resolution time or its groups
+_WATCHED = ('status', 'resolution_date', 'reported_date', 'fault_type', 'severity', 'connection_id',
+            'reported_by_customer')
+
+
+def _before_flush(session, flush_context, instances):
+    for obj in session.new:
+        if isinstance(obj, Fault) and obj.resolution_date is not None:
+            obj.mttr_dirty = True
+    for obj in session.dirty:
+        if not isinstance(obj, Fault) or not any(attributes.get_history(obj, key).has_changes() for key in _WATCHED):
+            continue
+        # Only resolved faults, and ones just leaving that state, touch mttr_stats
+        if obj.resolution_date is not None or attributes.get_history(obj, 'resolution_date').has_changes():
+            obj.mttr_dirty = True
+
+
+class MttrRefresher:
+    """Runs refresh_mttr_stats() on a background thread every MTTR_REFRESH_SECONDS"""
+
+    def __init__(self, app):
+        self.app = app
+        self._poller = None
+        self._stopping = threading.Event()
+
+    def start_polling(self):
+        interval = self.app.config.get('MTTR_REFRESH_SECONDS', 60)
+        if not interval:
+            return
+        if self._poller is not None and self._poller.is_alive():
+            return
+        self._poller = threading.Thread(target=self._poll, args=(interval,), name='mttr-refresh', daemon=True)
+        self._poller.start()
+
+    def _poll(self, interval):
+        while not self._stopping.wait(interval):
+            with self.app.app_context():
+                try:
+                    refresh_mttr_stats()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Refreshing mttr_stats failed')
+                finally:
+                    db.session.remove()
+
+    def shutdown(self):
+        self._stopping.set()
+
+
+_listeners_registered = False
+
+
+def init_mttr(app):
+    """Register the fault flagging hook once per process and attach a (not yet started) refresher"""
+    global _listeners_registered
+    if not _listeners_registered:
+        event.listen(Session, 'before_flush', _before_flush)
+        _listeners_registered = True
+    app.extensions['mttr_refresher'] = MttrRefresher(app)
+    return app.extensions['mttr_refresher']
@@ -0,0 +1,194 @@
+"""
+Password hashing
+Passwords are stored as self-describing hashes, so the scheme and its cost can change
+without a migration:
+
+    scrypt:32768:8:1$<salt>$<hash>        (werkzeug format; also pbkdf2:sha256:<iterations>)
+    $argon2id$v=19$m=65536,t=3,p=4$...    (when the optional argon2-cffi package is installed)
+
+PASSWORD_HASH_METHOD selects the scheme for new hashes. A successful login with a value
+stored under any other scheme or cost (including legacy plain text) returns an upgraded
+hash for the caller to save, so accounts migrate as their owners sign in.
+
+Hashing is memory-hard and deliberately slow, so it runs on a small per-process thread
+pool (hashlib releases the GIL while hashing). The pool bounds how many hashes run at
+once, and so the CPU and memory a login burst can take. Logins that cannot get a slot
+within PASSWORD_HASH_TIMEOUT raise PasswordHashBusy instead of piling up.
+"""
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # optional dependency
+    argon2 = None
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+WERKZEUG_SCHEMES = ('scrypt', 'pbkdf2')
+
+
+class PasswordHashBusy(RuntimeError):
+    """Every hashing slot is taken; the caller should ask the user to retry"""
+
+
+class WerkzeugScheme:
+    """scrypt or pbkdf2 via werkzeug.security, e.g. 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'"""
+
+    def __init__(self, method):
+        self.method = method
+
+    @staticmethod
+    def identify(stored):
+        return stored.count('$') == 2 and stored.split(':', 1)[0] in WERKZEUG_SCHEMES
+
+    def hash(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    @staticmethod
+    def verify(stored, password):
+        return check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        return stored.split('$', 1)[0] != self.method
+
+
+class Argon2Scheme:
+    """argon2id, e.g. 'argon2' or 'argon2:<time_cost>:<memory_cost KiB>:<parallelism>'"""
+
+    def __init__(self, method):
+        if argon2 is None:
+            raise RuntimeError('PASSWORD_HASH_METHOD argon2 needs the argon2-cffi package')
+        params = [int(part) for part in method.split(':')[1:]]
+        self._hasher = argon2.PasswordHasher(**dict(zip(('time_cost', 'memory_cost', 'parallelism'), params)))
+
+    @staticmethod
+    def identify(stored):
+        return stored.startswith('$argon2')
+
+    def hash(self, password):
+        return self._hasher.hash(password)
+
+    def verify(self, stored, password):
+        try:
+            return self._hasher.verify(stored, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+
+    def needs_rehash(self, stored):
+        return self._hasher.check_needs_rehash(stored)
+
+
+@lru_cache(maxsize=8)
+def make_scheme(method):
+    return Argon2Scheme(method) if method.split(':', 1)[0] == 'argon2' else WerkzeugScheme(method)
+
+
+def _verify_any(scheme, stored, password):
+    """Check a password against a value stored under any known scheme, or plain text"""
+    if WerkzeugScheme.identify(stored):
+        return WerkzeugScheme.verify(stored, password)
+    if Argon2Scheme.identify(stored):
+        # Stored by argon2 but configured otherwise: any default-parameter verifier will do
+        verifier = scheme if isinstance(scheme, Argon2Scheme) else Argon2Scheme('argon2')
+        return verifier.verify(stored, password)
+    return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+
+
+def _needs_rehash(scheme, stored):
+    if WerkzeugScheme.identify(stored) or Argon2Scheme.identify(stored):
+        return not scheme.identify(stored) or scheme.needs_rehash(stored)
+    return True  # plain text
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a lazily started, size-capped thread pool"""
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, queue_limit=32, timeout=5.0):
+        self.method = method
+        make_scheme(method)  # fail at startup on a bad method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_limit)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(method=config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+                   workers=config.get('PASSWORD_HASH_WORKERS', 2),
+                   queue_limit=config.get('PASSWORD_HASH_QUEUE', 32),
+                   timeout=config.get('PASSWORD_HASH_TIMEOUT', 5.0))
+
+    @property
+    def scheme(self):
+        """Scheme for new hashes; follows PASSWORD_HASH_METHOD at call time so it can be retuned live"""
+        method = current_app.config.get('PASSWORD_HASH_METHOD', self.method) if has_app_context() else self.method
+        return make_scheme(method)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashBusy('Too many password checks in progress')
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(self.scheme.hash, password)
+
+    @staticmethod
+    def _verify_and_upgrade(scheme, stored, password):
+        if not _verify_any(scheme, stored, password):
+            return False, None
+        return True, scheme.hash(password) if _needs_rehash(scheme, stored) else None
+
+    def verify(self, stored, password):
+        """
+        Check a password against its stored value
+
+        Returns:
+            (matches, upgraded) where upgraded is a new hash to store when the stored
+            value used another scheme or cost, else None
+        """
+        if not stored or password is None:
+            return False, None
+        return self._run(self._verify_and_upgrade, self.scheme, stored, password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def get_password_hasher():
+    if has_app_context() and 'password_hasher' in current_app.extensions:
+        return current_app.extensions['password_hasher']
+    return PasswordHasher(workers=0)  # scripts without an app: hash inline with the defaults
+
+
+def hash_password(password):
+    return get_password_hasher().hash(password)
+
+
+def verify_password(stored, password):
+    return get_password_hasher().verify(stored, password)
+
+
+def init_passwords(app):
+    """Attach a password hasher to the app; the pool starts on first use"""
+    app.extensions['password_hasher'] = PasswordHasher.from_config(app.config)
+    return app.extensions['password_hasher']
@@ -0,0 +1,141 @@
+"""
+Query capture and plan analysis
+Records the statements the app actually issues (during a test or benchmark run) and
+runs EXPLAIN (MySQL) or EXPLAIN QUERY PLAN (SQLite) on each one to find full table
+scans, full index scans and sorts that a better index could avoid.
+
+    with QueryCapture() as capture:
+        ...exercise the app...
+    findings = analyze(engine, capture.statements)
+"""
+import re
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?$')
+_SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')
+
+
+class QueryCapture:
+    """
+    Collect distinct statements executed on any engine (or just `engine`) while active
+
+    statements maps SQL text to {'count', 'total_ms', 'params'} where params is the
+    first parameter set seen, kept so the statement can be explained later.
+    """
+
+    def __init__(self, engine=None):
+        self.target = engine or Engine
+        self.statements = OrderedDict()
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_capture_start', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_capture_start'].pop()
+        entry = self.statements.get(statement)
+        if entry is None:
+            params = parameters[0] if executemany and parameters else parameters
+            entry = self.statements[statement] = {'count': 0, 'total_ms': 0.0, 'params': params}
+        entry['count'] += 1
+        entry['total_ms'] += (time.perf_counter() - started) * 1000
+
+    def __enter__(self):
+        event.listen(self.target, 'before_cursor_execute', self._before)
+        event.listen(self.target, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.target, 'before_cursor_execute', self._before)
+        event.remove(self.target, 'after_cursor_execute', self._after)
+        return False
+
+
+def _explain_sqlite(connection, statement, params):
+    findings = []
+    for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', params):
+        detail = row[-1]
+        scan = _SQLITE_SCAN.match(detail)
+        if scan:
+            findings.append(('index_scan' if scan.group(2) else 'full_scan', scan.group(1), detail))
+        sort = _SQLITE_SORT.search(detail)
+        if sort:
+            findings.append(('filesort', None, detail))
+    return findings
+
+
+def _explain_mysql(connection, statement, params):
+    findings = []
+    result = connection.exec_driver_sql(f'EXPLAIN {statement}', params)
+    columns = list(result.keys())
+    for row in result:
+        row = dict(zip(columns, row))
+        extra = row.get('Extra') or ''
+        if row.get('type') in ('ALL', 'index'):
+            kind = 'full_scan' if row['type'] == 'ALL' else 'index_scan'
+            findings.append((kind, row.get('table'), f"type={row['type']} rows={row.get('rows')}"))
+        if 'Using filesort' in extra:
+            findings.append(('filesort', row.get('table'), extra))
+    return findings
+
+
+def explain(connection, statement, params=None):
+    """
+    Plan problems for one statement
+
+    Returns:
+        List of (kind, table, detail) with kind 'full_scan', 'index_scan' or 'filesort'
+    """
+    params = params if params is not None else ()
+    if connection.dialect.name == 'sqlite':
+        return _explain_sqlite(connection, statement, params)
+    return _explain_mysql(connection, statement, params)
+
+
+def analyze(engine, statements, ignore_tables=()):
+    """
+    EXPLAIN every captured statement
+
+    Args:
+        engine: Engine holding the schema to plan against
+        statements: QueryCapture.statements
+        ignore_tables: Tables small enough that scanning them is fine (e.g. users)
+
+    Returns:
+        List of dicts (statement, count, total_ms, findings), worst first; statements
+        that fail to explain are reported with an 'error' instead
+    """
+    report = []
+    with engine.connect() as connection:
+        for statement, entry in statements.items():
+            if not statement.lstrip().upper().startswith(EXPLAINABLE):
+                continue
+            try:
+                findings = [f for f in explain(connection, statement, entry['params'])
+                            if f[1] not in ignore_tables]
+            except Exception as exc:  # statement from another dialect, table since dropped, ...
+                report.append({'statement': statement, 'count': entry['count'], 'total_ms': entry['total_ms'],
+                               'findings': [], 'error': str(exc).splitlines()[0]})
+                continue
+            if findings:
+                report.append({'statement': statement, 'count': entry['count'],
+                               'total_ms': entry['total_ms'], 'findings': findings})
+    return sorted(report, key=lambda item: (-len(item['findings']), -item['count']))
+
+
+def format_report(report, width=110):
+    """Plain-text rendering of analyze() output"""
+    lines = []
+    for item in report:
+        if item.get('error'):
+            continue
+        summary = ', '.join(f"{kind}{'(' + table + ')' if table else ''}" for kind, table, _detail in item['findings'])
+        statement = ' '.join(item['statement'].split())
+        lines.append(f"[{item['count']}x, {item['total_ms']:.1f} ms] {summary}")
+        lines.append(f"    {statement[:width]}{'...' if len(statement) > width else ''}")
+    return '\n'.join(lines) if lines else 'No scans or filesorts found.'
@@ -0,0 +1,203 @@
+"""
+Token-bucket rate limiting
+Views declare their limits next to their other access decorators:
+
+    @auth_bp.route('/login', methods=['GET', 'POST'])
+    @rate_limit('20/minute', by='ip')
+    @rate_limit('5/minute', by='form:username')
+    def login():
+        ...
+
+Each (route, key kind, key value) gets its own bucket holding up to `limit` tokens and
+refilling at limit/period. A request that finds its bucket empty is answered with 429
+and Retry-After before the view runs, so it never reaches the database.
+
+Buckets live in a per-process dict (O(1) per request, idle buckets swept periodically),
+or, with RATE_LIMIT_STORAGE set to a file path, in a SQLite file shared by every worker
+on the host. A failing shared store lets requests through rather than locking users out.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request, session
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+def parse_limit(limit):
+    """'5/minute' or '100/15 minutes' -> (capacity, tokens per second)"""
+    match = _LIMIT.match(limit)
+    if not match:
+        raise ValueError(f'Invalid rate limit {limit!r}, expected e.g. "5/minute"')
+    count, multiple, unit = int(match.group(1)), int(match.group(2) or 1), match.group(3)
+    return count, count / (multiple * PERIODS[unit])
+
+
+def _refill(tokens, updated, now, capacity, rate):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _take(tokens, cost, rate):
+    """(allowed, tokens left, seconds until `cost` tokens are available)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Buckets in a dict of key -> [tokens, updated, full_at]; one worker process only"""
+
+    def __init__(self, sweep_interval=60.0):
+        self.sweep_interval = sweep_interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else _refill(bucket[0], bucket[1], now, capacity, rate)
+            allowed, tokens, retry_after = _take(tokens, cost, rate)
+            self._buckets[key] = [tokens, now, now + (capacity - tokens) / rate]
+        return allowed, retry_after
+
+    def _sweep(self, now):
+        # A bucket that has refilled completely is indistinguishable from a missing one
+        for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteBucketStore:
+    """Buckets in a local SQLite file, shared by all worker processes on the host"""
+
+    def __init__(self, path, sweep_interval=60.0):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._next_sweep = 0.0
+
+    def _connection(self):
+        # One connection per thread and process (connections must not cross a fork)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+                               'full_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS idx_rate_buckets_full_at ON rate_buckets (full_at)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if now >= self._next_sweep:
+                connection.execute('DELETE FROM rate_buckets WHERE full_at <= ?', (now,))
+                self._next_sweep = now + self.sweep_interval
+            row = connection.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], now, capacity, rate)
+            allowed, tokens, retry_after = _take(tokens, cost, rate)
+            connection.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) '
+                               'VALUES (?, ?, ?, ?)', (key, tokens, now, now + (capacity - tokens) / rate))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM rate_buckets').fetchone()[0]
+
+
+def make_store(storage, sweep_interval=60.0):
+    if not storage or storage == 'memory':
+        return MemoryBucketStore(sweep_interval)
+    return SqliteBucketStore(storage, sweep_interval)
+
+
+def client_ip():
+    """Client address; with RATE_LIMIT_TRUSTED_PROXIES = n, the address the nth proxy saw"""
+    proxies = current_app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 0)
+    forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+    if proxies and len(forwarded) >= proxies:
+        return forwarded[-proxies]
+    return request.remote_addr or 'unknown'
+
+
+def _key_value(by):
+    if by == 'ip':
+        return client_ip()
+    if by == 'customer':
+        return session.get('customer_id')
+    if by.startswith('form:'):
+        value = (request.form.get(by[5:]) or '').strip().lower()
+        return value or None
+    raise ValueError(f'Unknown rate limit key {by!r}')
+
+
+def rate_limit(limit, by='ip', methods=('POST',), scope=None):
+    """
+    Decorator limiting how often one client (or account) may call a view
+
+    Args:
+        limit: '<count>/<period>', e.g. '5/minute' or '100/15 minutes'
+        by: 'ip', 'customer' (logged-in portal customer) or 'form:<field>' (e.g. an
+            account number); requests without a value for the key are not limited
+        methods: HTTP methods that spend a token (GETs of a form page usually don't)
+        scope: Bucket namespace, defaults to the endpoint; share it to pool routes
+
+    Usage:
+        @rate_limit('5/minute', by='form:account_number')
+        def login():
+            pass
+    """
+    capacity, rate = parse_limit(limit)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limiter = current_app.extensions.get('rate_limiter')
+            if (limiter is not None and request.method in methods
+                    and current_app.config.get('RATE_LIMIT_ENABLED', True)):
+                value = _key_value(by)
+                if value is not None:
+                    key = f'{scope or request.endpoint}|{by}|{value}'
+                    try:
+                        allowed, retry_after = limiter.take(key, capacity, rate)
+                    except Exception:
+                        logger.warning('Rate limit store failed; allowing request', exc_info=True)
+                        allowed = True
+                    if not allowed:
+                        raise TooManyRequests(retry_after=max(1, int(retry_after + 0.999)))
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def init_rate_limiter(app):
+    """Attach the bucket store selected by RATE_LIMIT_STORAGE to the app"""
+    app.extensions['rate_limiter'] = make_store(app.config.get('RATE_LIMIT_STORAGE'),
+                                                app.config.get('RATE_LIMIT_SWEEP_INTERVAL', 60.0))
+    return app.extensions['rate_limiter']
@@ -0,0 +1,326 @@
+"""
+Recurring maintenance
+Preventive programmes are stored as one maintenance_series row with an RRULE-style
+rule instead of one maintenance_schedules row per visit.
+
+- Rules are a subset of RFC 5545 RRULE: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY with
+  INTERVAL, COUNT or UNTIL, BYDAY (MO, TU.. or 1MO, -1FR for monthly/yearly),
+  BYMONTHDAY (negative counts from month end) and BYMONTH.
+- Occurrences are expanded only for the window being displayed. Expansion jumps
+  straight to the first period of the window, so its cost depends on the window,
+  not on how long ago the series started. COUNT is converted to an end date when the
+  series is saved, so windows never replay a series from its start.
+- A maintenance_schedules row (series_id, occurrence_date) is materialized only when
+  an occurrence is worked on (status change, log entry); from then on the row replaces
+  the generated occurrence, wherever it has been rescheduled to.
+"""
+import heapq
+from calendar import monthrange
+from datetime import date, timedelta
+from functools import lru_cache
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import MaintenanceSchedule, MaintenanceSeries
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# A rule that produces nothing (e.g. BYMONTH=2;BYMONTHDAY=30) is given up on after this many empty periods
+MAX_EMPTY_PERIODS = 1000
+
+
+def _int_list(value, name, low, high):
+    try:
+        numbers = [int(part) for part in value.split(',')]
+    except ValueError:
+        raise ValueError(f'{name} must be a list of numbers')
+    if any(n == 0 or not low <= n <= high for n in numbers):
+        raise ValueError(f'{name} values must be between {low} and {high} (not 0)')
+    return tuple(sorted(set(numbers)))
+
+
+def _add_months(month_index, months):
+    """(year, month) for a month index counted as year * 12 + month - 1"""
+    index = month_index + months
+    return index // 12, index % 12 + 1
+
+
+class RecurrenceRule:
+    """A parsed rule; occurrences() yields dates in ascending order"""
+
+    def __init__(self, freq, interval=1, count=None, until=None, by_day=(), by_month_day=(), by_month=()):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.by_day = by_day  # ((ordinal or None, weekday 0-6), ...)
+        self.by_month_day = by_month_day
+        self.by_month = by_month
+
+    @classmethod
+    def parse(cls, text):
+        """Parse 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH' (an optional 'RRULE:' prefix is ignored)"""
+        text = (text or '').strip()
+        if text.upper().startswith('RRULE:'):
+            text = text[6:]
+        parts = {}
+        for part in filter(None, text.upper().split(';')):
+            key, _, value = part.partition('=')
+            if not value:
+                raise ValueError(f'Invalid rule part {part!r}')
+            parts[key.strip()] = value.strip()
+
+        freq = parts.pop('FREQ', None)
+        if freq not in FREQUENCIES:
+            raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+        interval = parts.pop('INTERVAL', '1')
+        if not interval.isdigit() or int(interval) < 1:
+            raise ValueError('INTERVAL must be a positive number')
+        interval = int(interval)
+        count = parts.pop('COUNT', None)
+        until = parts.pop('UNTIL', None)
+        if count is not None and until is not None:
+            raise ValueError('Use either COUNT or UNTIL, not both')
+        if count is not None:
+            if not count.isdigit() or int(count) < 1:
+                raise ValueError('COUNT must be a positive number')
+            count = int(count)
+        if until is not None:
+            try:
+                until = date(int(until[0:4]), int(until[4:6]), int(until[6:8]))
+            except ValueError:
+                raise ValueError('UNTIL must be a date as YYYYMMDD')
+
+        by_day = []
+        for item in filter(None, parts.pop('BYDAY', '').split(',')):
+            ordinal, weekday = item[:-2], item[-2:]
+            if weekday not in WEEKDAYS or (ordinal and not ordinal.lstrip('+-').isdigit()):
+                raise ValueError(f'Invalid BYDAY value {item!r}')
+            ordinal = int(ordinal) if ordinal else None
+            if ordinal is not None and (freq not in ('MONTHLY', 'YEARLY') or ordinal == 0 or abs(ordinal) > 5):
+                raise ValueError(f'BYDAY {item!r}: numbered weekdays need FREQ=MONTHLY and -5..5')
+            by_day.append((ordinal, WEEKDAYS.index(weekday)))
+        by_month_day = _int_list(parts.pop('BYMONTHDAY'), 'BYMONTHDAY', -31, 31) if 'BYMONTHDAY' in parts else ()
+        by_month = _int_list(parts.pop('BYMONTH'), 'BYMONTH', 1, 12) if 'BYMONTH' in parts else ()
+        parts.pop('WKST', None)  # weeks always start on Monday
+        if parts:
+            raise ValueError(f"Unsupported rule parts: {', '.join(sorted(parts))}")
+        return cls(freq, interval, count, until, tuple(by_day), by_month_day, by_month)
+
+    # ---- candidates within one period ----
+
+    def _month_days(self, year, month, dtstart):
+        if self.by_month and month not in self.by_month:
+            return []
+        length = monthrange(year, month)[1]
+        days = set()
+        for n in self.by_month_day:
+            day = n if n > 0 else length + n + 1
+            if 1 <= day <= length:
+                days.add(day)
+        first_weekday = date(year, month, 1).weekday()
+        for ordinal, weekday in self.by_day:
+            matches = list(range(1 + (weekday - first_weekday) % 7, length + 1, 7))
+            if ordinal is None:
+                days.update(matches)
+            elif -len(matches) <= ordinal <= len(matches):
+                days.add(matches[ordinal - 1 if ordinal > 0 else ordinal])
+        if not self.by_month_day and not self.by_day and dtstart.day <= length:
+            days.add(dtstart.day)
+        return [date(year, month, day) for day in sorted(days)]
+
+    def _periods(self, dtstart, start):
+        """Yield (first day of the period, candidate dates), starting with the period containing `start`"""
+        if self.freq == 'DAILY':
+            weekdays = {weekday for _ordinal, weekday in self.by_day}
+            k = max(0, -(-(start - dtstart).days // self.interval))
+            while True:
+                day = dtstart + timedelta(days=k * self.interval)
+                keep = ((not weekdays or day.weekday() in weekdays)
+                        and (not self.by_month or day.month in self.by_month)
+                        and (not self.by_month_day or day in self._month_days(day.year, day.month, dtstart)))
+                yield day, [day] if keep else []
+                k += 1
+        elif self.freq == 'WEEKLY':
+            week0 = dtstart - timedelta(days=dtstart.weekday())
+            weekdays = sorted({weekday for _ordinal, weekday in self.by_day}) or [dtstart.weekday()]
+            k = max(0, (start - week0).days // 7 // self.interval)
+            while True:
+                monday = week0 + timedelta(weeks=k * self.interval)
+                days = [monday + timedelta(days=weekday) for weekday in weekdays]
+                yield monday, [day for day in days if not self.by_month or day.month in self.by_month]
+                k += 1
+        elif self.freq == 'MONTHLY':
+            month0 = dtstart.year * 12 + dtstart.month - 1
+            k = max(0, (start.year * 12 + start.month - 1 - month0) // self.interval)
+            while True:
+                year, month = _add_months(month0, k * self.interval)
+                yield date(year, month, 1), self._month_days(year, month, dtstart)
+                k += 1
+        else:
+            k = max(0, (start.year - dtstart.year) // self.interval)
+            months = self.by_month or (dtstart.month,)
+            while True:
+                year = dtstart.year + k * self.interval
+                yield date(year, 1, 1), [day for month in months for day in self._month_days(year, month, dtstart)]
+                k += 1
+
+    def occurrences(self, dtstart, start=None, end=None, until=None):
+        """
+        Occurrence dates in [start, end], ascending
+
+        `until` (the series' stored end date) replaces COUNT, which would otherwise
+        need counting from dtstart.
+        """
+        start = max(start or dtstart, dtstart)
+        limits = [d for d in (end, until, self.until) if d is not None]
+        last = min(limits) if limits else None
+        counting = self.count is not None and until is None
+        first_period = dtstart if counting else start
+        emitted = empty = 0
+        for period_start, candidates in self._periods(dtstart, first_period):
+            if last is not None and period_start > last:
+                return
+            for day in candidates:
+                if day < dtstart:
+                    continue
+                if last is not None and day > last:
+                    return
+                emitted += 1
+                if day >= start:
+                    yield day
+                if counting and emitted >= self.count:
+                    return
+            empty = 0 if candidates else empty + 1
+            if empty >= MAX_EMPTY_PERIODS:
+                return
+
+    def last_occurrence(self, dtstart):
+        """Date of the final occurrence, or None for an open-ended rule"""
+        if self.count is None and self.until is None:
+            return None
+        final = None
+        for final in self.occurrences(dtstart):
+            pass
+        return final
+
+
+@lru_cache(maxsize=4096)
+def parse_rule(text):
+    return RecurrenceRule.parse(text)
+
+
+# ---- maintenance series ----
+
+class Occurrence:
+    """
+    A generated, not yet materialized visit of a MaintenanceSeries
+
+    Reads like a MaintenanceSchedule (title, technician, priority, ... come from the
+    series) so list and calendar templates can show both.
+    """
+    maintenance_id = None
+    status = 'scheduled'
+    completion_date = None
+    completion_notes = None
+
+    def __init__(self, series, occurrence_date):
+        self.series = series
+        self.series_id = series.series_id
+        self.occurrence_date = occurrence_date
+        self.scheduled_date = occurrence_date
+
+    def __getattr__(self, name):
+        return getattr(self.series, name)
+
+    def __repr__(self):
+        return f'<Occurrence {self.series_id} {self.occurrence_date}>'
+
+
+def create_series(rule_text, dtstart, **fields):
+    """Validate the rule and add a MaintenanceSeries (not committed); raises ValueError for bad rules"""
+    rule = RecurrenceRule.parse(rule_text)
+    until = rule.last_occurrence(dtstart)
+    if until is None and (rule.count is not None or rule.until is not None):
+        raise ValueError('The rule produces no occurrences')
+    series = MaintenanceSeries(rrule=rule_text.strip().upper().removeprefix('RRULE:'), dtstart=dtstart,
+                               until=until, **fields)
+    db.session.add(series)
+    return series
+
+
+def occurrences_between(start, end, assigned_to=None, maintenance_type=None):
+    """
+    Generated occurrences dated in [start, end] that have no materialized row, by date
+
+    The series are read with one indexed query and the materialized occurrences in the
+    window with another; the rest is date arithmetic.
+    """
+    query = MaintenanceSeries.query.options(selectinload(MaintenanceSeries.technician)).filter(
+        MaintenanceSeries.is_active.is_(True),
+        MaintenanceSeries.dtstart <= end,
+        db.or_(MaintenanceSeries.until.is_(None), MaintenanceSeries.until >= start)
+    )
+    if assigned_to is not None:
+        query = query.filter(MaintenanceSeries.assigned_to == assigned_to)
+    if maintenance_type:
+        query = query.filter(MaintenanceSeries.maintenance_type == maintenance_type)
+    series_list = query.all()
+    if not series_list:
+        return []
+
+    materialized = set(db.session.query(MaintenanceSchedule.series_id, MaintenanceSchedule.occurrence_date).filter(
+        MaintenanceSchedule.occurrence_date >= start,
+        MaintenanceSchedule.occurrence_date <= end,
+        MaintenanceSchedule.series_id.isnot(None)
+    ))
+
+    def expand(series):
+        rule = parse_rule(series.rrule)
+        for day in rule.occurrences(series.dtstart, start, end, series.until):
+            if (series.series_id, day) not in materialized:
+                yield day, series.series_id, series
+
+    merged = heapq.merge(*(expand(series) for series in series_list), key=lambda item: item[:2])
+    return [Occurrence(series, day) for day, _series_id, series in merged]
+
+
+def is_occurrence(series, occurrence_date):
+    rule = parse_rule(series.rrule)
+    return any(True for _ in rule.occurrences(series.dtstart, occurrence_date, occurrence_date, series.until))
+
+
+def materialize_occurrence(series, occurrence_date):
+    """
+    The maintenance_schedules row for an occurrence, created (and flushed) if needed
+
+    Callers make their change and commit; a concurrent materialization of the same
+    occurrence is resolved by the unique (occurrence_date, series_id) key. The insert
+    runs in a savepoint, so losing that race leaves the caller's other changes in place.
+    """
+    def existing(lock=False):
+        query = MaintenanceSchedule.query.filter_by(series_id=series.series_id, occurrence_date=occurrence_date)
+        # A locking read sees the row the other transaction committed, whatever our snapshot
+        return (query.with_for_update() if lock else query).first()
+
+    schedule = existing()
+    if schedule is not None:
+        return schedule
+    schedule = MaintenanceSchedule(
+        series_id=series.series_id, occurrence_date=occurrence_date, scheduled_date=occurrence_date,
+        title=series.title, description=series.description, maintenance_type=series.maintenance_type,
+        equipment_type=series.equipment_type, equipment_id=series.equipment_id,
+        location_description=series.location_description, location_coordinates=series.location_coordinates,
+        scheduled_time=series.scheduled_time, estimated_duration=series.estimated_duration,
+        assigned_team=series.assigned_team, assigned_to=series.assigned_to, priority=series.priority,
+        created_by=series.created_by
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(schedule)
+    except IntegrityError:
+        schedule = existing(lock=True)
+    return schedule
@@ -0,0 +1,264 @@
+"""
+Report result cache
+Caches computed report contexts keyed by report name and normalized date range.
+
+- Closed ranges (ending before today) are kept until evicted, unless a committed write
+  touches a row dated inside the range (at its old or new date).
+- Ranges that include today are validated against per-table generation counters,
+  which are bumped whenever a write to one of those tables is committed, and expire
+  after a few minutes so counts from tables without report dates (customers,
+  connections) stay fresh.
+- Entries are evicted least-recently-used once the cache is full.
+
+Each gunicorn worker has its own cache, so writes are shared through the database:
+a transaction that writes a report table inserts one report_cache_events row per table
+(with the span of report days it touched) just before it commits. Nothing is locked, so
+ids can become visible out of order; before each lookup the cache reads the rows above
+the highest id it knows every earlier row of, applies the ones it has not seen, and only
+moves that floor past rows older than the re-read window.
+"""
+import threading
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session, attributes
+
+from app import db
+from app.models import ReportCacheInvalidation
+from app.utils.db_routing import primary_reads
+
+# Dated tables read by the report pages, with the date columns that place a row in a report range
+WATCHED_TABLES = {
+    'faults': ('reported_date', 'resolution_date'),
+    'maintenance_schedules': ('scheduled_date', 'completion_date'),
+    'service_requests': ('submitted_date',),
+}
+
+PRUNE_EVERY = 1000  # every this many events, drop the ones older than KEEP_EVENTS
+KEEP_EVENTS = timedelta(days=1)
+
+_TOUCHED_KEY = 'report_cache_touched'
+
+
+def normalize_range(start, end):
+    """Return (start_date, end_date) as dates; the range covers both days in full"""
+    start = start.date() if isinstance(start, datetime) else start
+    end = end.date() if isinstance(end, datetime) else end
+    return start, end
+
+
+def range_bounds(start, end):
+    """Datetime bounds for a normalized range: start 00:00 inclusive to the day after end, exclusive"""
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+class ReportCache:
+    """Size-bounded LRU cache of report results with generation-based invalidation"""
+
+    def __init__(self, max_entries=256, open_seconds=300, reread_seconds=30):
+        self.max_entries = max_entries
+        self.open_ttl = timedelta(seconds=open_seconds)
+        self.reread = timedelta(seconds=reread_seconds)  # longest a committing transaction's event can stay invisible
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._floor = None  # every report_cache_events id at or below this has been applied
+        self._seen = set()  # ids above _floor already applied
+        self._synced_at = None
+        self._applied = 0  # invalidations applied by this process, in the order they were applied
+        self._reset = 0  # value of _applied when events were last lost to pruning
+        self._recent = deque(maxlen=1024)  # (applied, table, first_day, last_day), newest last
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def generation(self, table):
+        return self._generations.get(table, 0)
+
+    def bump(self, table, dates=()):
+        """Record a committed write to `table` touching rows on `dates`"""
+        first, last = (min(dates), max(dates)) if dates else (None, None)
+        with self._lock:
+            self._apply(table, first, last)
+
+    def _apply(self, table, first, last):
+        self._generations[table] = self._generations.get(table, 0) + 1
+        self._applied += 1
+        self._recent.append((self._applied, table, first, last))
+        if first is None:
+            return
+        # Closed ranges are otherwise trusted forever, so drop the ones that cover a touched day
+        stale = [key for key, entry in self._entries.items()
+                 if entry['generations'] is None and table in entry['tables'] and key[1] <= last and first <= key[2]]
+        for key in stale:
+            del self._entries[key]
+        self._stats['invalidations'] += len(stale)
+
+    def sync(self):
+        """Apply invalidations committed by any process since the last sync; returns how many were applied so far"""
+        # Bound to the primary: a lagging replica would hide the newest writes
+        primary = {'bind': db.engine}
+        table = ReportCacheInvalidation.__table__
+        now = datetime.utcnow()
+        settled_before = now - self.reread
+        if self._floor is None:
+            # Older events cannot affect results this process has not computed yet
+            floor = db.session.execute(select(func.max(table.c.event_id)).where(table.c.created_at < settled_before),
+                                       bind_arguments=primary).scalar() or 0
+            with self._lock:
+                if self._floor is None:
+                    self._floor = floor
+
+        rows = db.session.execute(select(table.c.event_id, table.c.table_name, table.c.first_day, table.c.last_day,
+                                         table.c.created_at)
+                                  .where(table.c.event_id > self._floor).order_by(table.c.event_id),
+                                  bind_arguments=primary).all()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at > KEEP_EVENTS - self.reread:
+                # Events this process has not read may have been pruned: nothing cached can be trusted
+                self._entries.clear()
+                self._recent.clear()
+                self._generations = {name: n + 1 for name, n in self._generations.items()}
+                self._reset = self._applied
+            self._synced_at = now
+            for row in rows:
+                if row.event_id > self._floor and row.event_id not in self._seen:
+                    self._apply(row.table_name, row.first_day, row.last_day)
+                    self._seen.add(row.event_id)
+            # Any event below one older than the window has committed (or never will), so it needs no re-read
+            settled = [row.event_id for row in rows if row.created_at < settled_before]
+            if settled and max(settled) > self._floor:
+                self._floor = max(settled)
+                self._seen = {event_id for event_id in self._seen if event_id > self._floor}
+            return self._applied
+
+    def get_or_compute(self, report_name, start, end, tables, compute):
+        """
+        Return the cached result for (report_name, start, end) or compute and store it
+
+        Args:
+            report_name: Name of the report
+            start, end: Range bounds (dates or datetimes; normalized to whole days)
+            tables: Tables the report reads from
+            compute: Callable taking (start_date, end_date) and returning the result
+        """
+        start, end = normalize_range(start, end)
+        key = (report_name, start, end)
+        is_open = end >= date.today()
+        seen = self.sync()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry['generations'] is None or (
+                    entry['generations'] == {t: self.generation(t) for t in tables}
+                    and entry['expires'] > datetime.utcnow())):
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry['value']
+            self._stats['misses'] += 1
+            generations = {t: self.generation(t) for t in tables} if is_open else None
+
+        with primary_reads():  # a result computed on a lagging replica would be cached as current
+            value = compute(start, end)
+
+        with self._lock:
+            if not is_open and self._overlapping_since(seen, tables, start, end):
+                return value  # another thread applied a write to this range while it was computed
+            self._entries[key] = {'value': value, 'generations': generations, 'tables': set(tables),
+                                  'expires': datetime.utcnow() + self.open_ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def _overlapping_since(self, seen, tables, start, end):
+        if seen < self._reset or (self._recent and self._recent[0][0] > seen + 1):
+            return True  # the log no longer reaches back to `seen`
+        return any(applied > seen and table in tables and first is not None
+                   and first <= end and start <= last for applied, table, first, last in self._recent)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def _after_flush(session, flush_context):
+    touched = session.info.setdefault(_TOUCHED_KEY, {})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table not in WATCHED_TABLES:
+            continue
+        dates = touched.setdefault(table, set())
+        for column in WATCHED_TABLES[table]:
+            # The old value too: moving a row out of a closed range changes that range's report
+            for value in attributes.get_history(obj, column).sum():
+                day = _as_date(value)
+                if day:
+                    dates.add(day)
+
+
+def touch(session, table, dates=()):
+    """Record a write made outside the ORM (bulk UPDATE/INSERT); applied when the session commits"""
+    touched = session.info.setdefault(_TOUCHED_KEY, {})
+    touched.setdefault(table, set()).update(day for day in map(_as_date, dates) if day)
+
+
+def _before_commit(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()  # pending changes record their tables in after_flush
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if not touched:
+        return
+    now = datetime.utcnow()
+    for table, dates in touched.items():
+        result = session.execute(insert(ReportCacheInvalidation.__table__).values(
+            table_name=table, first_day=min(dates) if dates else None, last_day=max(dates) if dates else None,
+            created_at=now))
+        if result.inserted_primary_key[0] % PRUNE_EVERY == 0:
+            session.execute(delete(ReportCacheInvalidation.__table__).where(
+                ReportCacheInvalidation.created_at < now - KEEP_EVENTS))
+
+
+def _after_rollback(session):
+    session.info.pop(_TOUCHED_KEY, None)
+
+
+_listeners_registered = False
+
+
+def init_report_cache(app):
+    """Attach a report cache to the app and register the write hooks once per process"""
+    global _listeners_registered
+
+    app.extensions['report_cache'] = ReportCache(app.config.get('REPORT_CACHE_MAX_ENTRIES', 256),
+                                                 app.config.get('REPORT_CACHE_OPEN_SECONDS', 300),
+                                                 app.config.get('REPORT_CACHE_REREAD_SECONDS', 30))
+
+    if not _listeners_registered:
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_registered = True
+
+    return app.extensions['report_cache']
+
+
+def get_report_cache():
+    return current_app.extensions['report_cache']
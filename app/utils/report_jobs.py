@@ -0,0 +1,359 @@
+"""
+Background report jobs
+Long-range reports are queued as report_jobs rows and computed in a process pool,
+so a multi-year request gets a job ID back instead of holding a web worker.
+
+- Each pool process builds its own app, and so its own engine and DB connections.
+- REPORT_JOB_WORKERS sizes the pool of each web worker process. Across all of them at
+  most REPORT_JOB_MAX_RUNNING jobs run at once: a job is claimed (queued -> running)
+  in the web process before it is handed to the pool, and claims are serialized on
+  the 'report_jobs' counter row in sync_sequence. Enqueueing is refused once
+  REPORT_JOB_MAX_ACTIVE jobs are queued or running.
+- Each web worker polls for queued jobs every REPORT_JOB_POLL_SECONDS, so jobs left
+  queued by the cap, or handed back by a worker that was recycled, start without an
+  operator running `flask resume-report-jobs`.
+- A running job touches heartbeat_at every REPORT_JOB_HEARTBEAT_SECONDS (and with each
+  progress update); one silent for REPORT_JOB_TIMEOUT seconds is handed back to the queue.
+  Every write a job makes is conditional on its own claim (status running, started_at
+  unchanged), so a worker whose job was handed back and claimed again stores nothing.
+- Progress and the finished result are stored on the job row. A completed job for
+  a range that has already ended is reused for identical requests.
+"""
+import atexit
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from app import db
+from app.models import ReportJob
+from app.utils.db_routing import primary_reads
+from app.utils.report_cache import normalize_range
+from app.utils.sync import next_sequence_value
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def _report_functions():
+    # Imported lazily: the compute functions live with their routes
+    from app.routes.reports import compute_fault_report, compute_maintenance_report
+    return {'faults': compute_fault_report, 'maintenance': compute_maintenance_report}
+
+
+def _jsonable(value):
+    """Round-trip through JSON so dates become ISO strings and tuples become lists"""
+    return json.loads(json.dumps(value, default=str))
+
+
+def _claimed(job_id, claimed_at):
+    table = ReportJob.__table__
+    return table.c.job_id == job_id, table.c.status == 'running', table.c.started_at == claimed_at
+
+
+def set_progress(job_id, claimed_at, percent):
+    """Persist progress in its own short transaction, leaving the report's session alone"""
+    with db.engine.begin() as connection:
+        connection.execute(update(ReportJob.__table__).where(*_claimed(job_id, claimed_at)).values(
+            progress=int(percent), heartbeat_at=datetime.utcnow()))
+
+
+class _Heartbeat:
+    """Touches a claimed job's heartbeat_at every `interval` seconds on a daemon thread"""
+
+    def __init__(self, engine, job_id, claimed_at, interval):
+        self.engine = engine
+        self.job_id = job_id
+        self.claimed_at = claimed_at
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def __enter__(self):
+        if self.interval:
+            threading.Thread(target=self._beat, name=f'report-job-{self.job_id}-heartbeat', daemon=True).start()
+        return self
+
+    def _beat(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(update(ReportJob.__table__).where(
+                        *_claimed(self.job_id, self.claimed_at)).values(heartbeat_at=datetime.utcnow()))
+            except Exception:
+                logger.exception('Report job %s heartbeat failed', self.job_id)
+
+    def __exit__(self, *exc_info):
+        self._stopping.set()
+
+
+def claim_job(job_id):
+    """
+    Move a queued job to running, unless REPORT_JOB_MAX_RUNNING jobs already run
+
+    The claim is a conditional UPDATE, so a job submitted twice (e.g. by two polling
+    workers) only runs once.
+
+    Returns:
+        The claim's started_at (whole seconds, as the column stores it) if this call
+        claimed the job, else None
+    """
+    table = ReportJob.__table__
+    now = datetime.utcnow().replace(microsecond=0)
+    with db.engine.begin() as connection:
+        next_sequence_value(connection, 'report_jobs')  # serializes claims across processes until commit
+        running = connection.execute(select(func.count()).select_from(table).where(
+            table.c.status == 'running')).scalar()
+        if running >= current_app.config.get('REPORT_JOB_MAX_RUNNING', 4):
+            return None
+        claimed = connection.execute(update(table).where(
+            table.c.job_id == job_id, table.c.status == 'queued'
+        ).values(status='running', started_at=now, heartbeat_at=now, progress=0)).rowcount
+    return now if claimed else None
+
+
+def requeue_jobs(job_ids):
+    """Hand claimed jobs that never started back to the queue"""
+    table = ReportJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(update(table).where(
+            table.c.job_id.in_(job_ids), table.c.status == 'running'
+        ).values(status='queued', started_at=None, heartbeat_at=None, progress=0))
+
+
+def run_job(job_id):
+    """
+    Claim a queued job and compute it in the current app context
+
+    Returns:
+        Final status, or None if the job was not claimed
+    """
+    claimed_at = claim_job(job_id)
+    if claimed_at is None:
+        return None
+    return compute_job(job_id, claimed_at)
+
+
+def compute_job(job_id, claimed_at):
+    """
+    Compute a claimed job and store its result or error
+
+    Returns:
+        Final status, or None if the claim was lost (the job was handed back and claimed
+        again before or while this call computed it)
+    """
+    job = db.session.get(ReportJob, job_id, populate_existing=True)
+    if job is None or job.status != 'running' or job.started_at != claimed_at:
+        return None
+
+    heartbeat = _Heartbeat(db.engine, job_id, claimed_at, current_app.config.get('REPORT_JOB_HEARTBEAT_SECONDS', 60))
+    with heartbeat:
+        try:
+            compute = _report_functions()[job.report_name]
+            result = compute(job.start_date, job.end_date,
+                             progress=lambda percent: set_progress(job_id, claimed_at, percent))
+            values = {'result': _jsonable(result), 'status': 'completed', 'progress': 100}
+        except Exception as exc:
+            logger.exception('Report job %s failed', job_id)
+            values = {'status': 'failed', 'error': str(exc)[:2000]}
+    db.session.rollback()
+
+    stored = db.session.execute(update(ReportJob.__table__).where(*_claimed(job_id, claimed_at)).values(
+        finished_at=datetime.utcnow(), **values)).rowcount
+    db.session.commit()
+    if not stored:
+        logger.warning('Report job %s was handed back while it ran; its result was dropped', job_id)
+        return None
+    return values['status']
+
+
+# ---- pool processes ----
+
+_worker_app = None
+
+
+def _init_worker(config_name):
+    """Pool initializer: a private app (engine, connection pool) per process"""
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(config_name)
+    _worker_app.config['AUDIT_ASYNC'] = False
+
+
+def _run_in_worker(job_id, claimed_at):
+    with _worker_app.app_context():
+        try:
+            return compute_job(job_id, claimed_at)
+        finally:
+            db.session.remove()
+
+
+class ReportJobRunner:
+    """Submits claimed report jobs to a lazily started, size-capped process pool"""
+
+    def __init__(self, app, config_name='default', max_workers=2):
+        self.app = app
+        self.config_name = config_name
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = {}  # future -> job_id, until the future finishes
+        self._lock = threading.Lock()
+        self._exit_registered = False
+        self._poller = None
+        self._stopping = threading.Event()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: children must not inherit the parent's sockets or writer threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.config_name,)
+                )
+                if not self._exit_registered:
+                    atexit.register(self.shutdown)
+                    self._exit_registered = True
+            return self._executor
+
+    def submit(self, job_id):
+        """
+        Claim the job and run it in the pool, or inline when REPORT_JOBS_ASYNC is off (tests, CLI)
+
+        Returns:
+            The job's status after submitting ('running' in the pool, final status inline),
+            or None if it was not claimed (taken elsewhere, or left queued by the running cap)
+        """
+        if not current_app.config.get('REPORT_JOBS_ASYNC', True):
+            return run_job(job_id)
+        claimed_at = claim_job(job_id)
+        if claimed_at is None:
+            return None
+
+        try:
+            future = self._pool().submit(_run_in_worker, job_id, claimed_at)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool and try once more
+            with self._lock:
+                self._executor = None
+            future = self._pool().submit(_run_in_worker, job_id, claimed_at)
+        with self._lock:
+            self._pending[future] = job_id
+        future.add_done_callback(self._finished)
+        return 'running'
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending.pop(future, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Report job worker crashed: %s', future.exception())
+
+    def start_polling(self):
+        """Resume queued and abandoned jobs now, then every REPORT_JOB_POLL_SECONDS"""
+        interval = self.app.config.get('REPORT_JOB_POLL_SECONDS', 30)
+        if not self.app.config.get('REPORT_JOBS_ASYNC', True) or not interval:
+            return  # inline jobs never wait in the queue
+        if self._poller is not None and self._poller.is_alive():
+            return
+        self._poller = threading.Thread(target=self._poll, args=(interval,), name='report-job-poller', daemon=True)
+        self._poller.start()
+
+    def _poll(self, interval):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    resume_report_jobs()
+                except Exception:
+                    logger.exception('Resuming report jobs failed')
+                finally:
+                    db.session.remove()
+            self._stopping.wait(interval)
+
+    def shutdown(self, wait=False):
+        """Stop polling and the pool; claimed jobs that had not started go back to the queue"""
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pending = dict(self._pending)
+        if executor is None:
+            return
+        cancelled = [job_id for future, job_id in pending.items() if future.cancel()]
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+        if cancelled:
+            with self.app.app_context():
+                requeue_jobs(cancelled)
+
+
+def enqueue_report(report_name, start, end, user_id=None):
+    """
+    Queue a report for background computation
+
+    Returns:
+        The ReportJob (possibly an existing one for the same range), or None if too
+        many jobs are already queued or running
+    """
+    if report_name not in _report_functions():
+        raise ValueError(f'Unknown report: {report_name}')
+    start, end = normalize_range(start, end)
+
+    # On the primary: a job queued moments ago may not have reached the replica yet
+    with primary_reads():
+        existing = ReportJob.query.filter(
+            ReportJob.report_name == report_name,
+            ReportJob.start_date == start,
+            ReportJob.end_date == end,
+            db.or_(ReportJob.status.in_(ACTIVE_STATUSES),
+                   db.and_(ReportJob.status == 'completed', ReportJob.end_date < date.today()))
+        ).order_by(ReportJob.job_id.desc()).first()
+        if existing:
+            return existing
+
+        active = ReportJob.query.filter(ReportJob.status.in_(ACTIVE_STATUSES)).count()
+    if active >= current_app.config.get('REPORT_JOB_MAX_ACTIVE', 10):
+        return None
+
+    job = ReportJob(report_name=report_name, start_date=start, end_date=end,
+                    requested_by=user_id, status='queued', progress=0)
+    db.session.add(job)
+    db.session.commit()
+
+    get_job_runner().submit(job.job_id)
+    return job
+
+
+def resume_report_jobs():
+    """
+    Resubmit jobs left behind by a restart or the running cap: queued jobs, and
+    running jobs whose heartbeat is older than REPORT_JOB_TIMEOUT seconds
+
+    Returns:
+        Number of jobs claimed
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get('REPORT_JOB_TIMEOUT', 600))
+    ReportJob.query.filter(
+        ReportJob.status == 'running', ReportJob.heartbeat_at < cutoff
+    ).update({ReportJob.status: 'queued', ReportJob.started_at: None, ReportJob.heartbeat_at: None,
+              ReportJob.progress: 0}, synchronize_session=False)
+    db.session.commit()
+
+    job_ids = [job_id for (job_id,) in db.session.query(ReportJob.job_id).filter(
+        ReportJob.status == 'queued').order_by(ReportJob.job_id)]
+    runner = get_job_runner()
+    return sum(runner.submit(job_id) is not None for job_id in job_ids)
+
+
+def init_report_jobs(app, config_name='default'):
+    """Attach a job runner to the app; the pool itself starts on first submit"""
+    app.extensions['report_jobs'] = ReportJobRunner(app, config_name, app.config.get('REPORT_JOB_WORKERS', 2))
+    return app.extensions['report_jobs']
+
+
+def get_job_runner():
+    return current_app.extensions['report_jobs']
@@ -0,0 +1,66 @@
+"""
+Pre-fork serving support
+The production server (gunicorn.conf.py) builds the app once in the master and
+forks workers from it. Anything holding a socket, thread or process pool must not
+be shared across that fork:
+- pooled database connections (primary and replica engines) are discarded in the
+  child so each worker opens its own MySQL connections,
+- the audit writer thread, the outage broadcast thread and the password hashing and
+  report job pools do not survive fork, so each worker gets fresh instances that
+  start lazily on first use,
+- each worker polls for queued report jobs and outage broadcasts, so work a
+  recycled worker handed back is resumed without an operator, and folds faults
+  flagged for mttr_stats on its own timer.
+Per-process caches (report results, fragments) are empty at preload and are kept.
+"""
+import logging
+
+from app.utils.audit import AuditWriter
+from app.utils.broadcasts import BroadcastWorker
+from app.utils.mttr import MttrRefresher
+from app.utils.passwords import PasswordHasher
+from app.utils.rate_limit import init_rate_limiter
+from app.utils.report_jobs import ReportJobRunner
+
+logger = logging.getLogger(__name__)
+
+
+def app_engines(app):
+    """Every engine the app may hold connections on"""
+    with app.app_context():
+        engines = list(app.extensions['sqlalchemy'].engines.values())
+    monitor = app.extensions.get('replica_monitor')
+    if monitor is not None:
+        engines.append(monitor.engine)
+    return engines
+
+
+def after_fork(app):
+    """Run in each worker right after fork, before it serves any request"""
+    for engine in app_engines(app):
+        # close=False: leave the parent's sockets alone, just stop this process using them
+        engine.dispose(close=False)
+
+    app.extensions['audit_writer'] = AuditWriter(app)
+    app.extensions['password_hasher'] = PasswordHasher.from_config(app.config)
+    init_rate_limiter(app)
+    app.extensions['broadcast_worker'] = BroadcastWorker(app)
+    app.extensions['broadcast_worker'].start_polling()  # picks up broadcasts handed back by a replaced worker
+    app.extensions['mttr_refresher'] = MttrRefresher(app)
+    app.extensions['mttr_refresher'].start_polling()
+    runner = app.extensions.get('report_jobs')
+    if runner is not None:
+        runner = app.extensions['report_jobs'] = ReportJobRunner(app, runner.config_name, runner.max_workers)
+        runner.start_polling()  # picks up jobs handed back by the worker this one replaces
+
+
+def before_exit(app):
+    """Run when a worker stops (graceful reload or shutdown): drain queued work, close connections"""
+    app.extensions['audit_writer'].shutdown()
+    app.extensions['broadcast_worker'].shutdown()  # unfinished broadcasts go back to the queue
+    app.extensions['mttr_refresher'].shutdown()
+    runner = app.extensions.get('report_jobs')
+    if runner is not None:
+        runner.shutdown()
+    for engine in app_engines(app):
+        engine.dispose()
@@ -0,0 +1,222 @@
+"""
+Change tracking for offline device sync
+Every transaction that writes faults, fault_updates, maintenance_schedules or
+maintenance_logs takes the next value of the 'changes' counter in sync_sequence and
+stamps it on the rows it inserts or updates (change_seq). The counter row stays locked
+until the transaction ends, so sequence values become visible in commit order: once a
+client has seen value N, every later change gets a value above N.
+
+Rows that leave a technician's scope (deleted, or reassigned to someone else) are
+recorded in sync_tombstones so their devices can drop them. When a fault or visit is
+reassigned, its fault_updates or maintenance_logs are stamped with the transaction's
+value too, so the new assignee's next sync brings the history along with the parent.
+
+changes_since() answers "what changed after token N" for one technician (or everything
+for office roles) using the change_seq indexes, so its cost follows the number of
+changes rather than the table sizes.
+"""
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session, attributes
+
+from app import db
+from app.models import Fault, FaultUpdate, MaintenanceSchedule, MaintenanceLog, SyncSequence, SyncTombstone
+
+SEQUENCE_NAME = 'changes'
+TRACKED_TABLES = {'faults', 'fault_updates', 'maintenance_schedules', 'maintenance_logs'}
+ASSIGNED_TABLES = {'faults', 'maintenance_schedules'}
+CHILD_TABLES = {'faults': (FaultUpdate.__table__, 'fault_id'),
+                'maintenance_schedules': (MaintenanceLog.__table__, 'maintenance_id')}
+
+_SEQ_KEY = 'sync_change_seq'
+
+
+def transaction_change_seq(session):
+    """
+    The change sequence value of the session's current transaction, allocated on first use
+
+    Call this when writing tracked rows outside the ORM (bulk INSERT/UPDATE) and put
+    the value in their change_seq column.
+    """
+    seq = session.info.get(_SEQ_KEY)
+    if seq is None:
+        seq = session.info[_SEQ_KEY] = next_sequence_value(session, SEQUENCE_NAME)
+    return seq
+
+
+def next_sequence_value(session, name):
+    """
+    Increment the named counter and return its new value
+
+    The counter row stays locked until the session's transaction ends, so values become
+    visible in commit order.
+    """
+    table = SyncSequence.__table__
+    bumped = session.execute(update(table).where(table.c.name == name).values(value=table.c.value + 1))
+    if bumped.rowcount == 0:
+        session.execute(insert(table).values(name=name, value=1))
+    return session.execute(select(table.c.value).where(table.c.name == name)).scalar_one()
+
+
+def current_change_seq():
+    """Highest sequence value committed so far (a token that covers everything visible now)"""
+    table = SyncSequence.__table__
+    return db.session.execute(select(table.c.value).where(table.c.name == SEQUENCE_NAME)).scalar() or 0
+
+
+def _owner(obj):
+    """Technician whose devices hold this row"""
+    if isinstance(obj, FaultUpdate):
+        return obj.fault.assigned_to if obj.fault is not None else None
+    if isinstance(obj, MaintenanceLog):
+        return obj.schedule.assigned_to if obj.schedule is not None else None
+    return obj.assigned_to
+
+
+def _before_flush(session, flush_context, instances):
+    def tracked(objects):
+        return [obj for obj in objects if getattr(obj, '__tablename__', None) in TRACKED_TABLES]
+
+    written = tracked(session.new) + [obj for obj in tracked(session.dirty)
+                                      if session.is_modified(obj, include_collections=False)]
+    deleted = tracked(session.deleted)
+    if not written and not deleted:
+        return
+
+    seq = transaction_change_seq(session)
+    for obj in written:
+        obj.change_seq = seq
+        if obj.__tablename__ in ASSIGNED_TABLES and obj not in session.new:
+            previous = attributes.get_history(obj, 'assigned_to').deleted
+            if not previous or previous[0] == obj.assigned_to:
+                continue
+            if previous[0] is not None:
+                session.add(SyncTombstone(change_seq=seq, table_name=obj.__tablename__, record_id=_record_id(obj),
+                                          user_id=previous[0], reason='unassigned'))
+            if obj.assigned_to is not None:
+                child, column = CHILD_TABLES[obj.__tablename__]
+                session.execute(update(child).where(child.c[column] == _record_id(obj)).values(change_seq=seq))
+    for obj in deleted:
+        session.add(SyncTombstone(change_seq=seq, table_name=obj.__tablename__, record_id=_record_id(obj),
+                                  user_id=_owner(obj), reason='deleted'))
+
+
+def _record_id(obj):
+    return db.inspect(obj).mapper.primary_key_from_instance(obj)[0]
+
+
+def _end_transaction(session, *args):
+    session.info.pop(_SEQ_KEY, None)
+
+
+# ---- reading ----
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def fault_delta(fault):
+    return {'id': fault.fault_id, 'type': fault.fault_type, 'status': fault.status, 'severity': fault.severity,
+            'description': fault.description, 'location': fault.location_description,
+            'connection_id': fault.connection_id, 'assigned_to': fault.assigned_to,
+            'reported': _iso(fault.reported_date), 'resolved': _iso(fault.resolution_date), 'seq': fault.change_seq}
+
+
+def fault_update_delta(row):
+    return {'id': row.update_id, 'fault_id': row.fault_id, 'type': row.update_type, 'status': row.new_status,
+            'notes': row.notes, 'by': row.updated_by, 'at': _iso(row.update_date), 'seq': row.change_seq}
+
+
+def schedule_delta(schedule):
+    return {'id': schedule.maintenance_id, 'title': schedule.title, 'type': schedule.maintenance_type,
+            'equipment': schedule.equipment_type, 'equipment_id': schedule.equipment_id,
+            'location': schedule.location_description, 'date': _iso(schedule.scheduled_date),
+            'time': _iso(schedule.scheduled_time), 'status': schedule.status, 'priority': schedule.priority,
+            'assigned_to': schedule.assigned_to, 'seq': schedule.change_seq}
+
+
+def maintenance_log_delta(row):
+    return {'id': row.log_id, 'maintenance_id': row.maintenance_id, 'work': row.work_performed,
+            'hours': row.actual_duration, 'by': row.logged_by, 'at': _iso(row.log_date), 'seq': row.change_seq}
+
+
+def _scoped_queries(user_id):
+    """{table: (model, query, serializer)} restricted to one technician, or unrestricted for None"""
+    faults, updates = Fault.query, FaultUpdate.query
+    schedules, logs = MaintenanceSchedule.query, MaintenanceLog.query
+    if user_id is not None:
+        faults = faults.filter(Fault.assigned_to == user_id)
+        updates = updates.join(Fault, Fault.fault_id == FaultUpdate.fault_id).filter(Fault.assigned_to == user_id)
+        schedules = schedules.filter(MaintenanceSchedule.assigned_to == user_id)
+        logs = logs.join(MaintenanceSchedule, MaintenanceSchedule.maintenance_id == MaintenanceLog.maintenance_id
+                         ).filter(MaintenanceSchedule.assigned_to == user_id)
+    return {
+        'faults': (Fault, faults, fault_delta),
+        'fault_updates': (FaultUpdate, updates, fault_update_delta),
+        'maintenance_schedules': (MaintenanceSchedule, schedules, schedule_delta),
+        'maintenance_logs': (MaintenanceLog, logs, maintenance_log_delta),
+    }
+
+
+def _tombstones(user_id, since, through):
+    query = SyncTombstone.query.filter(SyncTombstone.change_seq > since, SyncTombstone.change_seq <= through)
+    if user_id is not None:
+        query = query.filter(SyncTombstone.user_id == user_id)
+    else:
+        query = query.filter(SyncTombstone.reason == 'deleted')
+    removed = {}
+    for tombstone in query.order_by(SyncTombstone.change_seq):
+        removed.setdefault(tombstone.table_name, []).append(tombstone.record_id)
+    return removed
+
+
+def changes_since(user_id, since=None, limit=500):
+    """
+    Rows changed after `since` in the scope of technician `user_id` (None = all rows)
+
+    Without `since` the whole scope is returned as a snapshot. Either way at most about
+    `limit` rows per table are returned, always ending on a whole transaction; while
+    'more' is set, call again with the returned token.
+
+    Returns:
+        {'token', 'more', 'changes': {table: [delta, ...]}, 'removed': {table: [id, ...]}}
+    """
+    queries = _scoped_queries(user_id)
+    snapshot = since is None
+    if snapshot:
+        since = -1  # rows written before change tracking carry change_seq 0
+
+    fetched, cutoff = {}, None
+    for table, (model, query, _serialize) in queries.items():
+        rows = query.filter(model.change_seq > since).order_by(model.change_seq).limit(limit + 1).all()
+        fetched[table] = rows
+        if len(rows) > limit:
+            cutoff = rows[limit].change_seq if cutoff is None else min(cutoff, rows[limit].change_seq)
+
+    if cutoff is None:
+        through = max([since, current_change_seq(), 0])
+    elif any(row.change_seq < cutoff for rows in fetched.values() for row in rows):
+        through = cutoff - 1  # stop before the transaction that did not fit
+    else:
+        # One transaction larger than the limit: send all of it
+        through = cutoff
+        for table, (model, query, _serialize) in queries.items():
+            fetched[table] = query.filter(model.change_seq > since, model.change_seq <= cutoff).order_by(
+                model.change_seq).all()
+
+    changes = {table: [queries[table][2](row) for row in rows if row.change_seq <= through]
+               for table, rows in fetched.items()}
+    return {'token': through, 'more': cutoff is not None, 'changes': changes,
+            'removed': {} if snapshot else _tombstones(user_id, since, through)}
+
+
+_listeners_registered = False
+
+
+def init_sync():
+    """Register the change-sequence hooks once per process"""
+    global _listeners_registered
+    if not _listeners_registered:
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_commit', _end_transaction)
+        event.listen(Session, 'after_rollback', _end_transaction)
+        _listeners_registered = True
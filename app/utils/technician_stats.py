@@ -0,0 +1,170 @@
+"""
+Technician workload and performance projection
+technician_stats keeps one row per technician so staff pages and assignment screens
+read a technician's figures with a primary-key lookup instead of counting their faults,
+maintenance and logs on every page view.
+
+- After each flush, the technicians touched by fault, maintenance or log changes
+  (assignee before and after, or the logging user) are remembered on the session.
+- Just before commit their rows are recomputed from a handful of indexed per-technician
+  queries, in the same transaction as the change, and written with a single upsert so
+  two transactions creating the same row cannot collide.
+- Bulk writes that bypass the ORM call mark_technicians() themselves.
+- The 30-day figures drift as days pass without writes, so rows older than
+  TECHNICIAN_STATS_MAX_AGE seconds are recomputed when read on the primary. Views
+  reading from the replica show the rows as they are; the nightly
+  refresh-technician-stats command catches those up.
+"""
+from datetime import datetime, timedelta
+from itertools import chain
+from statistics import median
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, attributes
+
+from app import db
+from app.models import Fault, MaintenanceSchedule, MaintenanceLog, TechnicianStats, User
+from app.utils.db_routing import replica_request
+
+SEVERITIES = ('low', 'medium', 'high', 'critical')
+CLOSED_FAULTS = ('resolved', 'closed')
+ACTIVE_MAINTENANCE = ('scheduled', 'in_progress')
+WINDOW = timedelta(days=30)
+
+# Attributes whose changes move a technician's figures, and the attribute naming the technician
+_WATCHED = {
+    Fault: ('assigned_to', ('assigned_to', 'status', 'severity', 'resolution_date', 'reported_date')),
+    MaintenanceSchedule: ('assigned_to', ('assigned_to', 'status')),
+    MaintenanceLog: ('logged_by', ('logged_by', 'actual_duration', 'log_date')),
+}
+
+_PENDING_KEY = 'technician_stats_pending'
+
+
+def mark_technicians(session, user_ids):
+    """Have these technicians' rows recomputed when the session's transaction commits"""
+    session.info.setdefault(_PENDING_KEY, set()).update(user_id for user_id in user_ids if user_id)
+
+
+def _technicians(obj, changed_only):
+    owner, watched = _WATCHED[type(obj)]
+    if changed_only and not any(attributes.get_history(obj, key).has_changes() for key in watched):
+        return ()
+    return [getattr(obj, owner)] + list(attributes.get_history(obj, owner).deleted)
+
+
+def _after_flush(session, flush_context):
+    for obj in chain(session.new, session.deleted):
+        if type(obj) in _WATCHED:
+            mark_technicians(session, _technicians(obj, changed_only=False))
+    for obj in session.dirty:
+        if type(obj) in _WATCHED:
+            mark_technicians(session, _technicians(obj, changed_only=True))
+
+
+def _before_commit(session):
+    if not session.info.get(_PENDING_KEY) and not session.new and not session.dirty and not session.deleted:
+        return
+    session.flush()  # pending changes mark their technicians in after_flush
+    for user_id in sorted(session.info.pop(_PENDING_KEY, ())):
+        refresh_technician(user_id, session)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def refresh_technician(user_id, session=None):
+    """
+    Recompute one technician's row (non-technicians are skipped)
+
+    Returns:
+        The TechnicianStats row, or None
+    """
+    session = session or db.session
+    user = session.get(User, user_id)
+    if user is None or user.role != 'technician':
+        return None
+    now = datetime.utcnow()
+    since = now - WINDOW
+
+    open_faults = dict(session.query(Fault.severity, func.count()).filter(
+        Fault.assigned_to == user_id, Fault.status.notin_(CLOSED_FAULTS)
+    ).group_by(Fault.severity).all())
+    active = session.query(func.count(MaintenanceSchedule.maintenance_id)).filter(
+        MaintenanceSchedule.assigned_to == user_id, MaintenanceSchedule.status.in_(ACTIVE_MAINTENANCE)
+    ).scalar()
+    resolved = session.query(Fault.reported_date, Fault.resolution_date).filter(
+        Fault.assigned_to == user_id, Fault.status.in_(CLOSED_FAULTS), Fault.resolution_date >= since
+    ).all()
+    # actual_duration is recorded in hours
+    logged_hours = session.query(func.coalesce(func.sum(MaintenanceLog.actual_duration), 0)).filter(
+        MaintenanceLog.logged_by == user_id, MaintenanceLog.log_date >= since
+    ).scalar()
+
+    hours = [(resolved_at - reported).total_seconds() / 3600 for reported, resolved_at in resolved if reported]
+    values = {f'open_faults_{severity}': open_faults.get(severity, 0) for severity in SEVERITIES}
+    values.update(active_maintenance=active, resolved_30d=len(resolved),
+                  median_resolution_hours=round(median(hours), 2) if hours else None,
+                  logged_minutes_30d=int(logged_hours) * 60, refreshed_at=now)
+    session.execute(_upsert(session, user_id, values))
+    return session.get(TechnicianStats, user_id, populate_existing=True)
+
+
+def _upsert(session, user_id, values):
+    """INSERT the technician's row, or UPDATE it if another transaction got there first"""
+    table = TechnicianStats.__table__
+    if db.engine.dialect.name == 'sqlite':
+        statement = sqlite_insert(table).values(user_id=user_id, **values)
+        return statement.on_conflict_do_update(index_elements=[table.c.user_id], set_=values)
+    statement = mysql_insert(table).values(user_id=user_id, **values)
+    return statement.on_duplicate_key_update(**{key: statement.inserted[key] for key in values})
+
+
+def technician_stats(user_ids):
+    """
+    {user_id: TechnicianStats} for the given technicians, one query for the lot
+
+    Rows that are missing or older than TECHNICIAN_STATS_MAX_AGE are recomputed (and
+    committed) first, so the 30-day figures never lag by more than that. In requests
+    reading from the replica nothing is recomputed: missing rows are left out and stale
+    ones returned as they are.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id]
+    if not user_ids:
+        return {}
+    stats = {row.user_id: row for row in TechnicianStats.query.filter(TechnicianStats.user_id.in_(user_ids))}
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get('TECHNICIAN_STATS_MAX_AGE', 21600))
+    stale = [user_id for user_id in user_ids if user_id not in stats or stats[user_id].refreshed_at < cutoff]
+    if stale and not replica_request():
+        for user_id in stale:
+            row = refresh_technician(user_id)
+            if row is not None:
+                stats[user_id] = row
+        db.session.commit()
+    return stats
+
+
+def refresh_all_technicians():
+    """Recompute every technician's row (nightly, or after loading data outside the app)"""
+    user_ids = [user_id for (user_id,) in db.session.query(User.user_id).filter(User.role == 'technician')]
+    for user_id in user_ids:
+        refresh_technician(user_id)
+    db.session.commit()
+    return len(user_ids)
+
+
+_listeners_registered = False
+
+
+def init_technician_stats():
+    """Register the session hooks once per process"""
+    global _listeners_registered
+    if not _listeners_registered:
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_registered = True
@@ -0,0 +1,151 @@
+"""
+Time-series chart data
+Counts rows per time bucket for the report charts. The database groups by day (or
+hour for short ranges), so it returns at most one row per day; rolling up to weeks
+or months, gap filling and downsampling happen here on those few rows.
+"""
+from datetime import datetime, timedelta
+from math import ceil
+
+from sqlalchemy import func
+
+from app import db
+from app.models import Fault, MaintenanceSchedule, ServiceRequest, Connection
+
+RESOLUTIONS = ('hour', 'day', 'week', 'month')
+
+# Longest range each resolution may be asked for; longer ranges get the next coarser one
+RESOLUTION_MAX_DAYS = {'hour': 31, 'day': 731}
+
+# Chart type -> (date column counted, table it reads)
+SERIES = {
+    'faults_trend': (Fault.reported_date, 'faults'),
+    'faults_resolved': (Fault.resolution_date, 'faults'),
+    'maintenance_trend': (MaintenanceSchedule.scheduled_date, 'maintenance_schedules'),
+    'maintenance_completed': (MaintenanceSchedule.completion_date, 'maintenance_schedules'),
+    'service_requests_trend': (ServiceRequest.submitted_date, 'service_requests'),
+    'connections_trend': (Connection.created_at, 'connections'),
+}
+
+
+def choose_resolution(days):
+    """Coarsest-needed bucket for a range of `days` days (roughly 30-100 points)"""
+    if days <= 2:
+        return 'hour'
+    if days <= 90:
+        return 'day'
+    if days <= 730:
+        return 'week'
+    return 'month'
+
+
+def fit_resolution(resolution, days):
+    """`resolution`, coarsened until a range of `days` days stays within RESOLUTION_MAX_DAYS"""
+    for candidate in RESOLUTIONS[RESOLUTIONS.index(resolution):]:
+        if days <= RESOLUTION_MAX_DAYS.get(candidate, days):
+            return candidate
+    return RESOLUTIONS[-1]
+
+
+def bucket_start(value, resolution):
+    """Truncate a datetime to the start of its bucket"""
+    if resolution == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = datetime(value.year, value.month, value.day)
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    if resolution == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(value, resolution):
+    if resolution == 'hour':
+        return value + timedelta(hours=1)
+    if resolution == 'week':
+        return value + timedelta(weeks=1)
+    if resolution == 'month':
+        return (value + timedelta(days=32)).replace(day=1)
+    return value + timedelta(days=1)
+
+
+def bucket_label(value, resolution):
+    if resolution == 'hour':
+        return value.strftime('%Y-%m-%d %H:00')
+    if resolution == 'month':
+        return value.strftime('%Y-%m')
+    return value.strftime('%Y-%m-%d')
+
+
+def _hour_expression(column):
+    """Hour truncation as a string; there is no portable SQL function for it"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m-%d %H:00:00', column)
+    return func.date_format(column, '%Y-%m-%d %H:00:00')
+
+
+def _parse_bucket(value):
+    if isinstance(value, datetime):
+        return value
+    if hasattr(value, 'year'):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def bucket_counts(column, range_start, range_end, resolution):
+    """{bucket start: count} for rows with range_start <= column < range_end"""
+    expression = _hour_expression(column) if resolution == 'hour' else func.date(column)
+    rows = db.session.query(expression, func.count()).filter(
+        column >= range_start, column < range_end
+    ).group_by(expression).all()
+
+    counts = {}
+    for value, count in rows:
+        if value is None:
+            continue
+        key = bucket_start(_parse_bucket(value), resolution)
+        counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def fill_gaps(counts, range_start, range_end, resolution):
+    """Every bucket between the bounds, with zero where there were no rows"""
+    buckets = []
+    current = bucket_start(range_start, resolution)
+    while current < range_end:
+        buckets.append((current, counts.get(current, 0)))
+        current = next_bucket(current, resolution)
+    return buckets
+
+
+def downsample(buckets, max_points):
+    """Merge runs of adjacent buckets (summing counts) so at most max_points remain"""
+    if len(buckets) <= max_points:
+        return buckets
+    size = ceil(len(buckets) / max_points)
+    return [(buckets[i][0], sum(count for _start, count in buckets[i:i + size]))
+            for i in range(0, len(buckets), size)]
+
+
+def time_series(chart_type, range_start, range_end, resolution=None, max_points=200):
+    """
+    Gap-filled, bounded series for one chart type
+
+    Returns:
+        dict with labels, values, resolution and the number of buckets merged per point
+    """
+    column, _table = SERIES[chart_type]
+    days = max((range_end - range_start).days, 1)
+    resolution = fit_resolution(resolution, days) if resolution else choose_resolution(days)
+
+    buckets = fill_gaps(bucket_counts(column, range_start, range_end, resolution),
+                        range_start, range_end, resolution)
+    points = downsample(buckets, max_points)
+
+    return {
+        'labels': [bucket_label(start, resolution) for start, _count in points],
+        'values': [count for _start, count in points],
+        'resolution': resolution,
+        'buckets_per_point': ceil(len(buckets) / len(points)) if points else 1,
+        'total': sum(count for _start, count in buckets)
+    }
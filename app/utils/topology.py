@@ -0,0 +1,358 @@
+"""
+Grid topology and upstream fault localization
+The network hierarchy (feeder -> transformer -> connection) is only recorded as the
+feeder_line and transformer_id strings on each connection. This module keeps it as a
+compact in-memory graph per process:
+- feeders and transformers are interned to integer node IDs,
+- each connection is a row in parallel NumPy arrays (connection ID, transformer node,
+  feeder node, live flag), and each transformer's feeder is the feeder most of its
+  connections name. Children of a node are found with vectorized masks and bincounts.
+
+The graph is loaded on first use, patched after every commit that changes or deletes
+a connection in this process, and caught up with other processes' changes at most every
+TOPOLOGY_REFRESH_SECONDS through the connections.updated_at index. That catch-up starts
+TOPOLOGY_GRACE_SECONDS before the newest updated_at seen, so a transaction that stamped
+its rows earlier but committed later is not skipped. Deleted rows leave nothing for
+updated_at to find, so every TOPOLOGY_RECONCILE_SECONDS the graph's connection IDs are
+checked against the table's (one pass over the primary key) and missing ones dropped.
+
+localize() takes the connections currently reporting trouble and ranks the feeders
+and transformers whose failure best explains them, by log-likelihood ratio: if an
+element is down, each of its connections reports with probability
+TOPOLOGY_REPORT_RATE; otherwise with the background rate TOPOLOGY_BACKGROUND_RATE.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+
+from app import db
+from app.models import Connection, Fault, MaintenanceSchedule
+
+LIVE_STATUSES = ('active',)
+_WATCHED = ('transformer_id', 'feeder_line', 'connection_status')
+_CHANGED_KEY = 'topology_changed'
+
+
+def _grow(array, capacity, fill):
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class TopologyGraph:
+    """Array-backed feeder -> transformer -> connection hierarchy"""
+
+    def __init__(self, refresh_seconds=60, stream_batch=20000, grace_seconds=120, reconcile_seconds=3600):
+        self.refresh_seconds = refresh_seconds
+        self.stream_batch = stream_batch
+        self.grace = timedelta(seconds=grace_seconds)
+        self.reconcile_seconds = reconcile_seconds
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.feeders = []
+        self.feeder_index = {}
+        self.transformers = []
+        self.transformer_index = {}
+        self.transformer_feeder = np.zeros(0, dtype=np.int32)  # feeder node per transformer, -1 unknown
+
+        # Parallel connection columns, the first `size` entries in use
+        self.size = 0
+        self.connection_ids = np.zeros(0, dtype=np.int64)
+        self.connection_transformer = np.zeros(0, dtype=np.int32)
+        self.connection_feeder = np.zeros(0, dtype=np.int32)
+        self.connection_live = np.zeros(0, dtype=bool)
+        self.position = {}  # connection_id -> row
+
+        self._totals = None
+        self.watermark = None  # latest connections.updated_at seen
+        self.loaded_at = None
+        self.checked_at = None
+        self.reconciled_at = None
+
+    @staticmethod
+    def _node(names, index, name):
+        if not name:
+            return -1
+        node = index.get(name)
+        if node is None:
+            node = index[name] = len(names)
+            names.append(name)
+        return node
+
+    # ---- loading and patching ----
+
+    def _rows(self, since=None):
+        query = db.session.query(
+            Connection.connection_id, Connection.transformer_id, Connection.feeder_line,
+            Connection.connection_status, Connection.updated_at
+        )
+        if since is not None:
+            query = query.filter(Connection.updated_at >= since)
+        return query.order_by(Connection.connection_id).execution_options(yield_per=self.stream_batch)
+
+    def build(self):
+        """Load every connection in one streaming pass"""
+        with self._lock:
+            self._reset()
+            self.apply(self._rows())
+            self.loaded_at = self.checked_at = self.reconciled_at = time.monotonic()
+        return self
+
+    def refresh(self):
+        """Build on first use; afterwards pick up rows changed by other processes, at most every refresh_seconds"""
+        with self._lock:
+            if self.loaded_at is None:
+                return self.build()
+            now = time.monotonic()
+            if now - self.checked_at >= self.refresh_seconds:
+                if self.watermark is not None:
+                    self.apply(self._rows(self.watermark - self.grace))
+                if now - self.reconciled_at >= self.reconcile_seconds:
+                    self.reconcile()
+                self.checked_at = time.monotonic()
+        return self
+
+    def reconcile(self):
+        """Drop connections that no longer exist (deleted by another process)"""
+        with self._lock:
+            query = db.session.query(Connection.connection_id).execution_options(yield_per=self.stream_batch)
+            existing = np.fromiter((connection_id for (connection_id,) in query), dtype=np.int64)
+            ids = self.connection_ids[:self.size]
+            self.remove(ids[~np.isin(ids, existing)].tolist())
+            self.reconciled_at = time.monotonic()
+
+    def apply(self, rows):
+        """Insert or update connections from (connection_id, transformer_id, feeder_line, status, updated_at) rows"""
+        with self._lock:
+            touched = set()
+            for connection_id, transformer_id, feeder_line, status, updated_at in rows:
+                row = self.position.get(connection_id)
+                if row is None:
+                    if self.size == len(self.connection_ids):
+                        capacity = max(1024, 2 * self.size)
+                        self.connection_ids = _grow(self.connection_ids, capacity, 0)
+                        self.connection_transformer = _grow(self.connection_transformer, capacity, -1)
+                        self.connection_feeder = _grow(self.connection_feeder, capacity, -1)
+                        self.connection_live = _grow(self.connection_live, capacity, False)
+                    row = self.position[connection_id] = self.size
+                    self.connection_ids[row] = connection_id
+                    self.size += 1
+                else:
+                    touched.add(int(self.connection_transformer[row]))
+
+                transformer = self._node(self.transformers, self.transformer_index, transformer_id)
+                self.connection_transformer[row] = transformer
+                self.connection_feeder[row] = self._node(self.feeders, self.feeder_index, feeder_line)
+                self.connection_live[row] = status in LIVE_STATUSES
+                touched.add(transformer)
+                if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+
+            touched.discard(-1)
+            if touched:
+                if len(self.transformer_feeder) < len(self.transformers):
+                    self.transformer_feeder = _grow(self.transformer_feeder, len(self.transformers), -1)
+                self._fit_feeders(touched if len(touched) < len(self.transformers) else None)
+            self._totals = None
+
+    def remove(self, connection_ids):
+        """Drop connections; the last row moves into each freed slot"""
+        with self._lock:
+            touched = set()
+            for connection_id in connection_ids:
+                row = self.position.pop(connection_id, None)
+                if row is None:
+                    continue
+                touched.add(int(self.connection_transformer[row]))
+                last = self.size - 1
+                if row != last:
+                    for column in (self.connection_ids, self.connection_transformer, self.connection_feeder,
+                                   self.connection_live):
+                        column[row] = column[last]
+                    self.position[int(self.connection_ids[row])] = row
+                self.size = last
+
+            touched.discard(-1)
+            if touched:
+                self._fit_feeders(touched)
+            self._totals = None
+
+    def _fit_feeders(self, transformers=None):
+        """Set each (or each given) transformer's feeder to the one most of its connections name"""
+        n = self.size
+        t, f = self.connection_transformer[:n], self.connection_feeder[:n]
+        mask = (t >= 0) & (f >= 0)
+        if transformers is not None:
+            nodes = np.fromiter(transformers, dtype=np.int32)
+            mask &= np.isin(t, nodes)
+            self.transformer_feeder[nodes] = -1
+        width = max(len(self.feeders), 1)
+        keys, counts = np.unique(t[mask].astype(np.int64) * width + f[mask], return_counts=True)
+        if not len(keys):
+            return
+        key_transformers, key_feeders = keys // width, keys % width
+        order = np.lexsort((-counts, key_transformers))
+        key_transformers, key_feeders = key_transformers[order], key_feeders[order]
+        first = np.concatenate(([True], key_transformers[1:] != key_transformers[:-1]))
+        self.transformer_feeder[key_transformers[first]] = key_feeders[first]
+
+    def totals(self):
+        """(live connections per transformer, live connections per feeder)"""
+        with self._lock:
+            if self._totals is None:
+                n = self.size
+                live = self.connection_live[:n]
+                t, f = self.connection_transformer[:n][live], self.connection_feeder[:n][live]
+                self._totals = (np.bincount(t[t >= 0], minlength=len(self.transformers)),
+                                np.bincount(f[f >= 0], minlength=len(self.feeders)))
+            return self._totals
+
+    # ---- queries ----
+
+    def children(self, feeder=None, transformer=None):
+        """Transformer names on a feeder, or connection IDs behind a transformer"""
+        with self._lock:
+            if transformer is not None:
+                node = self.transformer_index.get(transformer)
+                n = self.size
+                return [] if node is None else self.connection_ids[:n][self.connection_transformer[:n] == node].tolist()
+            node = self.feeder_index.get(feeder)
+            if node is None:
+                return []
+            return [self.transformers[i] for i in np.flatnonzero(self.transformer_feeder == node)]
+
+    def localize(self, connection_ids, limit=10, report_rate=0.3, background_rate=0.001):
+        """
+        Rank the upstream elements most likely to explain reports from `connection_ids`
+
+        Returns:
+            {'reports', 'unmatched', 'no_upstream', 'candidates': [{'type', 'id', 'feeder',
+            'reporting', 'connections', 'coverage', 'score'}, ...]} best first
+        """
+        connection_ids = set(connection_ids)
+        with self._lock:
+            rows = np.fromiter((self.position[c] for c in connection_ids if c in self.position), dtype=np.int64)
+            transformer_totals, feeder_totals = self.totals()
+            t, f = self.connection_transformer[rows], self.connection_feeder[rows]
+            reporting_t = np.bincount(t[t >= 0], minlength=len(self.transformers))
+            reporting_f = np.bincount(f[f >= 0], minlength=len(self.feeders))
+            transformer_names, feeder_names = self.transformers, self.feeders
+            transformer_feeder = self.transformer_feeder
+            no_upstream = int(np.count_nonzero((t < 0) & (f < 0)))
+
+        hit, miss = math.log(report_rate / background_rate), math.log((1 - report_rate) / (1 - background_rate))
+        candidates = []
+        for kind, reporting, totals in (('transformer', reporting_t, transformer_totals),
+                                        ('feeder', reporting_f, feeder_totals)):
+            nodes = np.flatnonzero(reporting)
+            k = reporting[nodes]
+            total = np.maximum(totals[nodes], k)  # reports from connections that are not live still count
+            scores = k * hit + (total - k) * miss
+            for node, k_node, total_node, score in zip(nodes.tolist(), k.tolist(), total.tolist(), scores.tolist()):
+                feeder = None
+                if kind == 'transformer' and transformer_feeder[node] >= 0:
+                    feeder = feeder_names[transformer_feeder[node]]
+                candidates.append({
+                    'type': kind,
+                    'id': transformer_names[node] if kind == 'transformer' else feeder_names[node],
+                    'feeder': feeder,
+                    'reporting': k_node,
+                    'connections': total_node,
+                    'coverage': round(k_node / total_node, 3),
+                    'score': round(score, 2)
+                })
+        candidates.sort(key=lambda c: (-c['score'], c['type'], c['id']))
+        return {'reports': len(connection_ids), 'unmatched': len(connection_ids) - len(rows),
+                'no_upstream': no_upstream, 'candidates': candidates[:limit]}
+
+
+def get_topology():
+    """Process-wide topology graph for the current app, loaded on first use"""
+    graph = current_app.extensions.get('topology')
+    if graph is None:
+        graph = current_app.extensions['topology'] = TopologyGraph(
+            refresh_seconds=current_app.config.get('TOPOLOGY_REFRESH_SECONDS', 60),
+            grace_seconds=current_app.config.get('TOPOLOGY_GRACE_SECONDS', 120),
+            reconcile_seconds=current_app.config.get('TOPOLOGY_RECONCILE_SECONDS', 3600))
+    return graph.refresh()
+
+
+def reporting_connections(hours=None):
+    """Connections with an open fault reported in the last `hours` (TOPOLOGY_WINDOW_HOURS)"""
+    hours = hours or current_app.config.get('TOPOLOGY_WINDOW_HOURS', 2)
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return {connection_id for (connection_id,) in db.session.query(Fault.connection_id).filter(
+        Fault.reported_date >= since, Fault.connection_id.isnot(None), Fault.status.notin_(('resolved', 'closed'))
+    ).distinct()}
+
+
+def locate_failures(connection_ids, limit=10):
+    """localize() on the process graph, with any active maintenance on each candidate attached"""
+    result = get_topology().localize(
+        connection_ids, limit,
+        report_rate=current_app.config.get('TOPOLOGY_REPORT_RATE', 0.3),
+        background_rate=current_app.config.get('TOPOLOGY_BACKGROUND_RATE', 0.001))
+
+    equipment = {('transformer' if c['type'] == 'transformer' else 'feeder_line', c['id'])
+                 for c in result['candidates']}
+    work = {}
+    if equipment:
+        for maintenance_id, equipment_type, equipment_id in db.session.query(
+                MaintenanceSchedule.maintenance_id, MaintenanceSchedule.equipment_type,
+                MaintenanceSchedule.equipment_id).filter(
+                MaintenanceSchedule.status == 'in_progress',
+                MaintenanceSchedule.equipment_type.in_(('transformer', 'feeder_line')),
+                MaintenanceSchedule.equipment_id.in_([equipment_id for _, equipment_id in equipment])):
+            work.setdefault((equipment_type, equipment_id), []).append(maintenance_id)
+    for candidate in result['candidates']:
+        key = ('transformer' if candidate['type'] == 'transformer' else 'feeder_line', candidate['id'])
+        candidate['maintenance'] = work.get(key, [])
+    return result
+
+
+# ---- keeping the graph current ----
+
+def _after_flush(session, flush_context):
+    changed = session.info.setdefault(_CHANGED_KEY, {})  # connection_id -> row, or None once deleted
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Connection) and (obj in session.new or any(
+                attributes.get_history(obj, key).has_changes() for key in _WATCHED)):
+            changed[obj.connection_id] = (obj.connection_id, obj.transformer_id, obj.feeder_line,
+                                          obj.connection_status, obj.updated_at)
+    for obj in session.deleted:
+        if isinstance(obj, Connection):
+            changed[obj.connection_id] = None
+
+
+def _after_commit(session):
+    changed = session.info.pop(_CHANGED_KEY, None)
+    if changed and has_app_context():
+        graph = current_app.extensions.get('topology')
+        if graph is not None and graph.loaded_at is not None:
+            graph.apply(row for row in changed.values() if row is not None)
+            graph.remove([connection_id for connection_id, row in changed.items() if row is None])
+
+
+def _after_rollback(session):
+    session.info.pop(_CHANGED_KEY, None)
+
+
+_listeners_registered = False
+
+
+def init_topology():
+    """Register the connection change hooks once per process; the graph itself loads on first use"""
+    global _listeners_registered
+    if not _listeners_registered:
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_registered = True
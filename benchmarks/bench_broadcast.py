@@ -0,0 +1,87 @@
+"""
+Benchmark: outage broadcast to every customer on one feeder, sent by the background
+worker in chunks. Reports throughput and the longest single chunk (the longest time
+the notifications table is held by one write transaction).
+
+Usage:
+    python benchmarks/bench_broadcast.py [customers] [chunk_size]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory.name, 'bench.db')}"
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import Customer, Connection, Notification, OutageBroadcast  # noqa: E402
+from app.utils.broadcasts import create_broadcast  # noqa: E402
+
+SEED_BATCH = 20000
+
+
+def seed(customers):
+    for start in range(0, customers, SEED_BATCH):
+        stop = min(customers, start + SEED_BATCH)
+        db.session.execute(insert(Customer), [{
+            'account_number': f'B-{i}', 'first_name': 'Bench', 'last_name': str(i), 'phone': '0700000000',
+            'id_number': f'B-{i}', 'address': 'Grid Road', 'county': 'Nairobi', 'town': 'Nairobi',
+            'customer_type': 'residential'
+        } for i in range(start, stop)])
+        # Every tenth customer has a second connection on the same feeder
+        db.session.execute(insert(Connection), [{
+            'customer_id': i + 1, 'meter_number': f'B-{i}-{n}', 'connection_type': 'single_phase',
+            'load_capacity': 5, 'feeder_line': 'F-BENCH'
+        } for i in range(start, stop) for n in range(2 if i % 10 == 0 else 1)])
+        db.session.commit()
+
+
+def main():
+    customers = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    app = create_app('production')
+    app.config.update(AUDIT_ASYNC=False, BROADCAST_CHUNK_SIZE=chunk_size)
+
+    commits = []
+    began = {}
+
+    def on_begin(connection):
+        began[id(connection)] = time.perf_counter()
+
+    def on_commit(connection):
+        if id(connection) in began:
+            commits.append(time.perf_counter() - began.pop(id(connection)))
+
+    with app.app_context():
+        db.create_all()
+        seed(customers)
+        event.listen(db.engine, 'begin', on_begin)
+        event.listen(db.engine, 'commit', on_commit)
+
+        started = time.perf_counter()
+        broadcast = create_broadcast('feeder', 'F-BENCH', 'Planned outage', 'Supply off 09:00-13:00',
+                                     'maintenance_reminder')
+        broadcast_id = broadcast.broadcast_id
+        while True:
+            time.sleep(0.2)
+            db.session.expire_all()
+            broadcast = db.session.get(OutageBroadcast, broadcast_id)
+            if broadcast.is_finished:
+                break
+        seconds = time.perf_counter() - started
+        sent = db.session.query(Notification).filter_by(reference_id=broadcast_id).count()
+        app.extensions['broadcast_worker'].shutdown()
+
+    print(f'{customers} customers ({customers // 10} with two connections) on one feeder, '
+          f'chunks of {chunk_size}, SQLite\n')
+    print(f'status {broadcast.status}, {sent} notifications in {seconds:.1f} s ({sent / seconds:.0f}/s)')
+    print(f'longest write transaction {max(commits) * 1000:.0f} ms over {len(commits)} commits')
+
+
+if __name__ == '__main__':
+    main()
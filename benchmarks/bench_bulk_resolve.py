@@ -0,0 +1,93 @@
+"""
+Benchmark: closing every open fault behind a restored transformer one at a time
+(the per-fault status update: ORM change, FaultUpdate, notification, commit) versus
+the set-based bulk resolution in app.utils.bulk_faults.
+
+Usage:
+    python benchmarks/bench_bulk_resolve.py [faults]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory.name, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import User, Customer, Connection, Fault, FaultUpdate, Notification  # noqa: E402
+from app.utils.bulk_faults import resolve_faults  # noqa: E402
+
+
+def seed(faults, transformer):
+    now = datetime.utcnow()
+    first = db.session.query(db.func.coalesce(db.func.max(Customer.customer_id), 0)).scalar() + 1
+    db.session.execute(insert(Customer), [{
+        'account_number': f'{transformer}-{i}', 'first_name': 'Bench', 'last_name': str(i), 'phone': '0700000000',
+        'id_number': f'{transformer}-{i}', 'address': 'Grid Road', 'county': 'Nairobi', 'town': 'Nairobi',
+        'customer_type': 'residential'
+    } for i in range(faults)])
+    db.session.execute(insert(Connection), [{
+        'customer_id': first + i, 'meter_number': f'{transformer}-{i}', 'connection_type': 'single_phase',
+        'load_capacity': 5, 'transformer_id': transformer
+    } for i in range(faults)])
+    connection_ids = [c for (c,) in db.session.query(Connection.connection_id).filter_by(transformer_id=transformer)]
+    db.session.execute(insert(Fault), [{
+        'fault_type': 'power_outage', 'description': 'Outage', 'connection_id': connection_id,
+        'reported_date': now, 'status': 'reported'
+    } for connection_id in connection_ids])
+    db.session.commit()
+
+
+def one_at_a_time(transformer, user_id):
+    faults = Fault.query.join(Connection).filter(Connection.transformer_id == transformer,
+                                                 Fault.status == 'reported').all()
+    for fault in faults:
+        previous_status = fault.status
+        fault.status = 'resolved'
+        fault.resolution_date = datetime.utcnow()
+        fault.resolution_notes = 'Restored'
+        db.session.add(FaultUpdate(fault_id=fault.fault_id, updated_by=user_id, update_type='status_change',
+                                   previous_status=previous_status, new_status='resolved', notes='Restored'))
+        db.session.add(Notification(customer_id=fault.connection.customer_id, title='Power Restored',
+                                    message='Restored', notification_type='fault_update', reference_type='fault',
+                                    reference_id=fault.fault_id))
+        db.session.commit()
+    return len(faults)
+
+
+def main():
+    faults = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    app = create_app('production')
+    app.config.update(AUDIT_ASYNC=False)
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', full_name='Bench Admin', role='admin')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        seed(faults, 'TX-LOOP')
+        seed(faults, 'TX-BULK')
+
+        started = time.perf_counter()
+        closed = one_at_a_time('TX-LOOP', user.user_id)
+        loop_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        summary = resolve_faults('transformer', 'TX-BULK', user.user_id, notes='Restored')
+        bulk_seconds = time.perf_counter() - started
+
+    print(f'{faults} open faults behind one transformer (SQLite, audit inline)\n')
+    print(f"{'approach':<16}{'closed':>8}{'seconds':>10}{'faults/s':>11}")
+    print(f"{'one at a time':<16}{closed:>8}{loop_seconds:>10.2f}{closed / loop_seconds:>11.0f}")
+    print(f"{'bulk':<16}{summary['resolved']:>8}{bulk_seconds:>10.2f}{summary['resolved'] / bulk_seconds:>11.0f}"
+          f"   ({summary['chunks']} chunks)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: the route filters covered by Database/migrations/001_query_indexes.sql,
+timed on a synthetic SQLite database before and after the migration is applied.
+
+Usage:
+    python benchmarks/bench_indexes.py [scale]    (scale 1 = 200k faults, 500k notifications)
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app import db  # noqa: E402
+import app.models  # noqa: E402,F401  (registers the tables)
+from app.utils.migrations import apply_migrations, migration_files, split_statements  # noqa: E402
+from app.utils.query_log import explain  # noqa: E402
+
+TECHNICIANS = 50
+CUSTOMERS = 20000
+
+QUERIES = {
+    'technician open faults': (
+        "SELECT count(*) FROM faults WHERE assigned_to = ? AND status IN ('assigned', 'in_progress')",
+        lambda r: (r.randint(1, TECHNICIANS),)),
+    'portal unread notifications': (
+        'SELECT count(*) FROM notifications WHERE customer_id = ? AND is_read = 0 AND created_at > ?',
+        lambda r: (r.randint(1, CUSTOMERS), '2024-06-01 00:00:00')),
+    'portal my faults': (
+        'SELECT * FROM faults WHERE reported_by_customer = ? ORDER BY reported_date DESC LIMIT 10',
+        lambda r: (r.randint(1, CUSTOMERS),)),
+    'connection recent faults': (
+        'SELECT * FROM faults WHERE connection_id = ? ORDER BY reported_date DESC LIMIT 5',
+        lambda r: (r.randint(1, CUSTOMERS),)),
+    'technician maintenance list': (
+        'SELECT * FROM maintenance_schedules WHERE assigned_to = ? ORDER BY scheduled_date LIMIT 10',
+        lambda r: (r.randint(1, TECHNICIANS),)),
+    'technician calendar month': (
+        'SELECT * FROM maintenance_schedules WHERE assigned_to = ? AND scheduled_date BETWEEN ? AND ?',
+        lambda r: (r.randint(1, TECHNICIANS), '2024-03-01', '2024-03-31')),
+}
+
+
+def migration_indexes():
+    names = []
+    for _version, path in migration_files():
+        with open(path, encoding='utf-8') as fh:
+            names += [s.split()[2] for s in split_statements(fh.read()) if s.upper().startswith('CREATE INDEX')]
+    return names
+
+
+def seed(engine, scale):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    n_faults, n_notifications, n_schedules = int(200_000 * scale), int(500_000 * scale), int(50_000 * scale)
+
+    faults = [(
+        rng.randint(1, CUSTOMERS), 'power_outage', 'Synthetic fault', rng.randint(1, CUSTOMERS),
+        (start + timedelta(minutes=rng.randint(0, 500_000))).isoformat(' '),
+        rng.choice(('reported', 'assigned', 'in_progress', 'resolved', 'closed')), rng.randint(1, TECHNICIANS)
+    ) for _ in range(n_faults)]
+    notifications = [(
+        rng.randint(1, CUSTOMERS), 'Update', 'Synthetic notification', 'fault_update', rng.random() < 0.7,
+        (start + timedelta(minutes=rng.randint(0, 500_000))).isoformat(' ')
+    ) for _ in range(n_notifications)]
+    schedules = [(
+        'Synthetic job', 'preventive', 'transformer', 'Somewhere',
+        (start + timedelta(days=rng.randint(0, 365))).date().isoformat(), rng.randint(1, TECHNICIANS), 1
+    ) for _ in range(n_schedules)]
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            'INSERT INTO faults (connection_id, fault_type, description, reported_by_customer, reported_date, '
+            'status, assigned_to) VALUES (?, ?, ?, ?, ?, ?, ?)', faults)
+        connection.exec_driver_sql(
+            'INSERT INTO notifications (customer_id, title, message, notification_type, is_read, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)', notifications)
+        connection.exec_driver_sql(
+            'INSERT INTO maintenance_schedules (title, maintenance_type, equipment_type, location_description, '
+            'scheduled_date, assigned_to, created_by) VALUES (?, ?, ?, ?, ?, ?, ?)', schedules)
+    return n_faults, n_notifications, n_schedules
+
+
+def time_queries(engine, repeats=50):
+    results = {}
+    with engine.connect() as connection:
+        connection.exec_driver_sql('ANALYZE')
+        for name, (sql, params) in QUERIES.items():
+            rng = random.Random(11)
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                connection.exec_driver_sql(sql, params(rng)).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            issues = explain(connection, sql, params(rng))
+            results[name] = (statistics.median(samples), ', '.join(kind for kind, _t, _d in issues) or 'ok')
+    return results
+
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            for name in migration_indexes():
+                connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+
+        counts = seed(engine, scale)
+        print(f'faults: {counts[0]:,}  notifications: {counts[1]:,}  maintenance_schedules: {counts[2]:,}\n')
+
+        before = time_queries(engine)
+        apply_migrations(engine)
+        after = time_queries(engine)
+
+        print(f"{'query':<30}{'before ms':>11}{'after ms':>10}{'speedup':>9}  plan before -> after")
+        for name in QUERIES:
+            (b_ms, b_plan), (a_ms, a_plan) = before[name], after[name]
+            print(f'{name:<30}{b_ms:>11.2f}{a_ms:>10.3f}{b_ms / a_ms:>8.0f}x  {b_plan} -> {a_plan}')
+
+
+if __name__ == '__main__':
+    main()
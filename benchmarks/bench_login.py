@@ -0,0 +1,101 @@
+"""
+Benchmark: staff login throughput at several password hashing costs, with hashing
+inline in the request threads versus on the bounded hashing pool, and the latency
+of a cheap page served during the login burst.
+
+Usage:
+    python benchmarks/bench_login.py [seconds_per_setting] [login_threads]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory.name, 'bench.db')}"
+
+from app import create_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+from app.utils.passwords import PasswordHasher  # noqa: E402
+
+METHODS = ('pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1', 'scrypt:65536:8:1')
+POOL_WORKERS = 2
+
+
+def make_app():
+    app = create_app('production')
+    app.config.update(AUDIT_ASYNC=False, WTF_CSRF_ENABLED=False, RATE_LIMIT_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        if User.query.filter_by(username='bench').first() is None:
+            user = User(username='bench', email='bench@example.com', full_name='Bench Admin', role='admin',
+                        password='bench')
+            db.session.add(user)
+            db.session.commit()
+    return app
+
+
+def run(app, method, workers, seconds, threads):
+    app.config['PASSWORD_HASH_METHOD'] = method
+    app.extensions['password_hasher'] = PasswordHasher(method, workers=workers, queue_limit=threads, timeout=30)
+    with app.app_context():
+        # Store the password under the method being measured, so logins do not rehash
+        user = User.query.filter_by(username='bench').first()
+        user.set_password('bench')
+        db.session.commit()
+
+    stop = time.perf_counter() + seconds
+    logins, cheap = [], []
+
+    def login_loop():
+        client = app.test_client(use_cookies=False)
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': 'bench', 'password': 'bench'})
+            assert response.status_code == 302, response.status_code
+            logins.append(time.perf_counter() - started)
+
+    def cheap_loop():
+        client = app.test_client(use_cookies=False)
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            client.get('/login')
+            cheap.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    pool = [threading.Thread(target=login_loop) for _ in range(threads)] + [threading.Thread(target=cheap_loop)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    app.extensions['password_hasher'].shutdown()
+
+    cheap.sort()
+    return {
+        'logins_per_s': len(logins) / seconds,
+        'login_p50_ms': statistics.median(logins) * 1000,
+        'page_p95_ms': cheap[int(len(cheap) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    app = make_app()
+
+    print(f'{threads} login threads, {seconds:.0f} s per setting, {os.cpu_count()} CPU(s), '
+          f'pool of {POOL_WORKERS} hashing threads\n')
+    print(f"{'method':<22}{'mode':<8}{'logins/s':>10}{'login p50 ms':>14}{'page p95 ms':>13}")
+    for method in METHODS:
+        for mode, workers in (('inline', 0), ('pool', POOL_WORKERS)):
+            result = run(app, method, workers, seconds, threads)
+            print(f"{method:<22}{mode:<8}{result['logins_per_s']:>10.1f}{result['login_p50_ms']:>14.1f}"
+                  f"{result['page_p95_ms']:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark: request throughput of the Werkzeug dev server (`python main.py`) versus
+the production server (`gunicorn -c gunicorn.conf.py wsgi:app`).
+
+Both serve the same seeded SQLite database. Load comes from client processes
+holding keep-alive connections; each page is measured for a fixed duration.
+
+Usage:
+    python benchmarks/bench_serving.py [seconds_per_page] [client_processes]
+"""
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ('/login', '/faults/', '/dashboard')  # /login anonymously, the rest logged in
+CONNECTIONS_PER_CLIENT = 4
+
+
+def seed(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app, db
+    from app.models import User, Fault
+
+    app = create_app('production')
+    app.config['AUDIT_ASYNC'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(username='bench', email='bench@example.com', full_name='Bench Admin', role='admin')
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.flush()
+        for i in range(200):
+            db.session.add(Fault(fault_type='power_outage', description=f'Fault {i}', severity='high',
+                                 reported_by_user=admin.user_id, reported_date=datetime.now() - timedelta(hours=i)))
+        db.session.commit()
+        app.extensions['audit_writer'].shutdown()
+
+
+def login_cookie(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('POST', '/login', body='username=bench&password=bench',
+                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    connection.close()
+    return cookie
+
+
+def _client(port, path, cookie, seconds, results):
+    """One client process: round-robin over a few keep-alive connections until time is up"""
+    connections = [http.client.HTTPConnection('127.0.0.1', port) for _ in range(CONNECTIONS_PER_CLIENT)]
+    done, errors = 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        connection = connections[done % CONNECTIONS_PER_CLIENT]
+        try:
+            connection.request('GET', path, headers={'Cookie': cookie} if cookie else {})
+            response = connection.getresponse()
+            response.read()
+            done += response.status == 200
+            errors += response.status != 200
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+    results.put((done, errors))
+
+
+def throughput(port, path, cookie, seconds, clients):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_client, args=(port, path, cookie, seconds, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(t[0] for t in totals) / seconds, sum(t[1] for t in totals)
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/login')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run_server(command, port, env, seconds, clients):
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        cookie = login_cookie(port)
+        return {path: throughput(port, path, cookie if path != '/login' else '', seconds, clients) for path in PAGES}
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        seed(database_url)
+        env = dict(os.environ, DATABASE_URL=database_url, ACCESS_LOG='', AUDIT_ENABLED='false',
+                   JINJA_BYTECODE_CACHE_DIR=directory)
+
+        dev = run_server(
+            [sys.executable, '-c', "from main import app; app.run(debug=True, use_reloader=False, port=5055)"],
+            5055, dict(env, FLASK_CONFIG='development'), seconds, clients)
+        prod = run_server(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:5056', 'wsgi:app'],
+            5056, dict(env, FLASK_CONFIG='production'), seconds, clients)
+
+    workers, threads = os.environ.get('WEB_CONCURRENCY', 'default'), os.environ.get('WEB_THREADS', 'default')
+    print(f'{clients} client processes x {CONNECTIONS_PER_CLIENT} connections, {seconds:.0f} s per page, '
+          f'{os.cpu_count()} CPU(s); gunicorn workers={workers} threads={threads}\n')
+    print(f"{'page':<14}{'dev req/s':>11}{'gunicorn req/s':>16}{'speedup':>9}")
+    for path in PAGES:
+        (d_rps, d_err), (p_rps, p_err) = dev[path], prod[path]
+        errors = f'  ({d_err} / {p_err} errors)' if d_err or p_err else ''
+        print(f'{path:<14}{d_rps:>11.1f}{p_rps:>16.1f}{p_rps / max(d_rps, 0.1):>8.1f}x{errors}')
+
+
+if __name__ == '__main__':
+    main()
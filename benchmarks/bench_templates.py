@@ -0,0 +1,97 @@
+"""
+Benchmark: template compile cost (with and without the bytecode cache) and
+render time of the heaviest pages (with and without fragment caching).
+
+Runs against an in-memory SQLite database seeded with a handful of rows.
+
+Usage:
+    python benchmarks/bench_templates.py [requests_per_page]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+from jinja2 import FileSystemBytecodeCache  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import User, Fault  # noqa: E402
+
+TEMPLATES = ('base.html', 'faults/list.html', 'faults/view.html', 'maintenance/list.html',
+             'reports/faults.html', 'customer/base.html', 'customer/dashboard.html')
+PAGES = ('/faults/', '/maintenance/', '/reports/faults', '/dashboard')
+
+
+def compile_ms(app, bytecode_cache, repeats=5):
+    """Median time for a fresh environment (a new worker) to load every template"""
+    samples = []
+    for _ in range(repeats):
+        # A fresh template cache, same loader/extensions/globals as the app
+        env = app.jinja_env.overlay(bytecode_cache=bytecode_cache, cache_size=400)
+        started = time.perf_counter()
+        for name in TEMPLATES:
+            env.get_template(name)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def render_ms(client, path, n):
+    samples = []
+    for _ in range(n):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, (path, response.status_code)
+    return statistics.median(samples)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app = create_app('default')
+    app.config.update(AUDIT_ASYNC=False, WTF_CSRF_ENABLED=False)
+
+    with app.app_context():
+        db.create_all()
+        admin = User(username='bench', email='bench@example.com', full_name='Bench Admin', role='admin')
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.flush()
+        for i in range(10):
+            db.session.add(Fault(fault_type='power_outage', description=f'Fault {i}', severity='high',
+                                 reported_by_user=admin.user_id, reported_date=datetime.now() - timedelta(hours=i)))
+        db.session.commit()
+
+        with tempfile.TemporaryDirectory() as directory:
+            cold = compile_ms(app, None)
+            cache = FileSystemBytecodeCache(directory)
+            compile_ms(app, cache, repeats=1)  # warm the cache, as the first worker would
+            warm = compile_ms(app, cache)
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        rows = []
+        for path in PAGES:
+            app.config['FRAGMENT_CACHE_ENABLED'] = False
+            without = render_ms(client, path, n)
+            app.config['FRAGMENT_CACHE_ENABLED'] = True
+            with_cache = render_ms(client, path, n)
+            rows.append((path, without, with_cache))
+
+    print(f'Loading {len(TEMPLATES)} templates in a fresh environment:')
+    print(f'  compile from source:   {cold:7.2f} ms')
+    print(f'  from bytecode cache:   {warm:7.2f} ms  ({cold / warm:.1f}x)\n')
+    print(f"{'page':<20}{'no fragments ms':>17}{'fragments ms':>14}")
+    for path, without, with_cache in rows:
+        print(f'{path:<20}{without:>17.3f}{with_cache:>14.3f}')
+
+
+if __name__ == '__main__':
+    main()
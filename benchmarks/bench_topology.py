@@ -0,0 +1,95 @@
+"""
+Benchmark: upstream fault localization on the in-memory topology graph. Loads a
+synthetic grid (connections behind transformers behind feeders), then times
+localize() for a transformer-sized and a feeder-sized burst of reports, and an
+incremental patch of a batch of re-wired connections.
+
+Usage:
+    python benchmarks/bench_topology.py [connections]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory.name, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import Customer, Connection  # noqa: E402
+from app.utils.topology import TopologyGraph  # noqa: E402
+
+PER_TRANSFORMER = 50
+TRANSFORMERS_PER_FEEDER = 40
+
+
+def seed(connections):
+    db.session.execute(insert(Customer), [{
+        'account_number': 'KP-BENCH-0001', 'first_name': 'Bench', 'last_name': 'Customer', 'phone': '+254700000000',
+        'id_number': 'BENCH1', 'address': 'Grid Road', 'county': 'Nairobi', 'town': 'Nairobi',
+        'customer_type': 'residential'
+    }])
+    customer_id = db.session.query(Customer.customer_id).scalar()
+    now = datetime.utcnow()
+    for chunk in range(0, connections, 20000):
+        db.session.execute(insert(Connection), [{
+            'customer_id': customer_id, 'meter_number': f'MTR-{i}', 'connection_type': 'single_phase',
+            'load_capacity': 5, 'connection_status': 'active', 'updated_at': now,
+            'transformer_id': f'TX-{i // PER_TRANSFORMER}',
+            'feeder_line': f'F-{i // (PER_TRANSFORMER * TRANSFORMERS_PER_FEEDER)}'
+        } for i in range(chunk, min(chunk + 20000, connections))])
+    db.session.commit()
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    app = create_app('production')
+    app.config.update(AUDIT_ASYNC=False)
+    rng = random.Random(7)
+    with app.app_context():
+        db.create_all()
+        seed(connections)
+        ids = [connection_id for (connection_id,) in db.session.query(Connection.connection_id)]
+
+        graph = TopologyGraph()
+        _, build_seconds = timed(graph.build, repeat=1)
+
+        # 30% of one transformer, 30% of one feeder, plus scattered background noise
+        noise = rng.sample(ids, 20)
+        transformer_burst = ids[:PER_TRANSFORMER][::3] + noise
+        feeder_size = PER_TRANSFORMER * TRANSFORMERS_PER_FEEDER
+        feeder_burst = rng.sample(ids[feeder_size:2 * feeder_size], feeder_size * 3 // 10) + noise
+        transformer_result, transformer_seconds = timed(lambda: graph.localize(transformer_burst))
+        feeder_result, feeder_seconds = timed(lambda: graph.localize(feeder_burst))
+
+        moved = [(connection_id, 'TX-0', 'F-0', 'active', datetime.utcnow()) for connection_id in rng.sample(ids, 500)]
+        _, patch_seconds = timed(lambda: graph.apply(moved))
+
+    print(f'{connections} connections, {len(graph.transformers)} transformers, {len(graph.feeders)} feeders\n')
+    print(f"{'operation':<34}{'ms':>10}  top candidate")
+    print(f"{'load graph':<34}{build_seconds * 1000:>10.1f}")
+    print(f"{f'localize {len(transformer_burst)} reports':<34}{transformer_seconds * 1000:>10.2f}  "
+          f"{transformer_result['candidates'][0]['id']}")
+    print(f"{f'localize {len(feeder_burst)} reports':<34}{feeder_seconds * 1000:>10.2f}  "
+          f"{feeder_result['candidates'][0]['id']}")
+    print(f"{'patch 500 re-wired connections':<34}{patch_seconds * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
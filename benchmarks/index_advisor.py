@@ -0,0 +1,57 @@
+"""
+Index advisor: capture the statements issued while the test suite runs, then
+EXPLAIN each one and list full table scans and filesorts.
+
+Usage:
+    python benchmarks/index_advisor.py [--database-uri URI] [--include-small-tables]
+
+Plans are computed against --database-uri (default: the configured database).
+For a SQLite URI the schema is created from the models first.
+"""
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from config import Config  # noqa: E402
+from app import db  # noqa: E402
+from app.utils.query_log import QueryCapture, analyze, format_report  # noqa: E402
+
+# Lookup tables that stay small; scanning them is cheaper than an index
+SMALL_TABLES = ('users', 'mttr_stats', 'schema_migrations')
+
+
+def capture_test_statements(test_dir):
+    suite = unittest.defaultTestLoader.discover(test_dir)
+    with QueryCapture() as capture:
+        unittest.TextTestRunner(stream=open(os.devnull, 'w'), verbosity=0).run(suite)
+    return capture.statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database-uri', default=Config.SQLALCHEMY_DATABASE_URI)
+    parser.add_argument('--tests', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                        'tests'))
+    parser.add_argument('--include-small-tables', action='store_true')
+    args = parser.parse_args()
+
+    statements = capture_test_statements(args.tests)
+
+    engine = create_engine(args.database_uri)
+    if engine.dialect.name == 'sqlite':
+        db.metadata.create_all(engine)
+
+    report = analyze(engine, statements, ignore_tables=() if args.include_small_tables else SMALL_TABLES)
+    errors = sum(1 for item in report if item.get('error'))
+    print(f'Captured {len(statements)} distinct statements; {len(report) - errors} with plan issues'
+          f'{f", {errors} could not be explained" if errors else ""}.\n')
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
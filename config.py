@@ -17,12 +17,124 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or '0123'
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'kenya_power_db'
 
-    SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+    SQLALCHEMY_DATABASE_URI = (os.environ.get('DATABASE_URL')
+                               or f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Optional read replica: report, list and chart reads are routed to it (app.utils.db_routing)
+    REPLICA_DATABASE_URI = os.environ.get('REPLICA_DATABASE_URI')
+    REPLICA_MAX_LAG_SECONDS = int(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_LAG_CHECK_INTERVAL = 2.0  # seconds between lag probes per process
+    REPLICA_STICKY_SECONDS = 10  # a client that wrote reads from the primary for this long
+
     # Pagination
     ITEMS_PER_PAGE = 10
 
+    # Audit logging (batched background writer into audit_log)
+    AUDIT_ENABLED = os.environ.get('AUDIT_ENABLED', 'true').lower() == 'true'
+    AUDIT_ASYNC = True
+    AUDIT_QUEUE_SIZE = 10000
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_INTERVAL = 1.0  # seconds a partial batch may wait
+    AUDIT_ENQUEUE_TIMEOUT = 0.5  # seconds a request waits on a full queue before writing inline
+
+    # Audit archive (compressed NDJSON segments for rows past retention)
+    AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR')  # defaults to <instance>/audit_archive
+    AUDIT_RETENTION_DAYS = int(os.environ.get('AUDIT_RETENTION_DAYS', 90))
+    AUDIT_ARCHIVE_BATCH_SIZE = 5000
+
+    # Report result cache (LRU entries per worker)
+    REPORT_CACHE_MAX_ENTRIES = 256
+    REPORT_CACHE_OPEN_SECONDS = 300  # ranges that include today are recomputed after this long
+    REPORT_CACHE_REREAD_SECONDS = 30  # invalidations this recent are re-read, as they can commit out of id order
+
+    # Background report jobs (process pool for long date ranges)
+    REPORT_JOBS_ASYNC = True
+    REPORT_JOB_THRESHOLD_DAYS = 366  # longer ranges are queued instead of computed in the request
+    REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))  # pool size in each web worker process
+    REPORT_JOB_MAX_RUNNING = int(os.environ.get('REPORT_JOB_MAX_RUNNING', 4))  # reports computed at once, all workers
+    REPORT_JOB_MAX_ACTIVE = 10  # queued + running jobs before new requests are refused
+    REPORT_JOB_POLL_SECONDS = 30  # how often each web worker picks up queued jobs (0 disables)
+    REPORT_JOB_HEARTBEAT_SECONDS = 60  # how often a running job proves it is alive
+    REPORT_JOB_TIMEOUT = 600  # seconds without a heartbeat before a running job is handed back to the queue
+
+    # Templates: compiled bytecode cache (directory defaults to a per-user temp dir)
+    JINJA_BYTECODE_CACHE = True
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+
+    # Rendered fragment cache ({% cache %} tag); bump the version on deploys that change fragments
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_VERSION = os.environ.get('APP_VERSION', '1')
+    FRAGMENT_CACHE_MAX_ENTRIES = 1024
+    FRAGMENT_CACHE_TTL = None  # seconds; None keeps entries until evicted or the version changes
+
+    # Time-series chart API bounds
+    CHART_MAX_DAYS = 1830
+    CHART_MAX_POINTS = 200
+
+    # Recurring maintenance: days ahead of today that generated occurrences appear in the list view
+    RECURRENCE_LIST_DAYS = 90
+
+    # Crew calendar (double-booking checks when scheduling maintenance)
+    CREW_DAY_START = '08:00'  # start of a visit with no scheduled time, and of the working day
+    CREW_DAY_END = '17:00'
+    CREW_DEFAULT_DURATION_HOURS = 4  # visits without an estimated duration
+    CREW_FAULT_HOURS = 4  # time an open fault assignment blocks from its assigned_date
+    CREW_SUGGEST_DAYS = 14  # how far ahead the next free slot is searched
+
+    # Technician workload projection: rows older than this are recomputed when read (30-day figures)
+    TECHNICIAN_STATS_MAX_AGE = 6 * 3600
+
+    # Resolution-time statistics (mttr_stats): how often each web worker folds in flagged faults (0 disables)
+    MTTR_REFRESH_SECONDS = 60
+
+    # Fault list filter counts: seconds the per-scope grouped counts are reused
+    FAULT_FACETS_TTL = 30
+
+    # Grid topology graph and upstream fault localization
+    TOPOLOGY_REFRESH_SECONDS = 60  # how often other processes' connection changes are picked up
+    TOPOLOGY_GRACE_SECONDS = 120  # each catch-up re-reads rows stamped this long before the newest seen
+    TOPOLOGY_RECONCILE_SECONDS = 3600  # how often connections deleted by other processes are dropped
+    TOPOLOGY_WINDOW_HOURS = 2  # open faults reported this recently count as reports
+    TOPOLOGY_REPORT_RATE = 0.3  # share of connections behind a failed element expected to report
+    TOPOLOGY_BACKGROUND_RATE = 0.001  # share expected to report when nothing upstream has failed
+
+    # Response compression (brotli when the optional `brotli` package is installed, else gzip)
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are not worth the CPU
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIMETYPES = ('text/html', 'text/plain', 'text/csv', 'text/css', 'application/json',
+                          'application/javascript')
+
+    # Password hashing (app.utils.passwords): new hashes use this method; older ones upgrade on login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # ~32 MB, ~0.1 s each
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # hashes run at once per process
+    PASSWORD_HASH_QUEUE = 32  # logins that may wait for a hashing thread
+    PASSWORD_HASH_TIMEOUT = 5.0  # seconds a login waits for a slot before being told to retry
+
+    # Batch field-update API (/api/v1)
+    API_BATCH_MAX_ITEMS = 200
+    API_SYNC_MAX_ROWS = 500  # rows per table in one /sync response
+
+    # Bulk fault resolution: faults closed per transaction
+    BULK_RESOLVE_CHUNK_SIZE = 500
+
+    # Outage broadcasts (app.utils.broadcasts): background thread per worker, notifications per INSERT/commit
+    BROADCAST_ASYNC = True
+    BROADCAST_CHUNK_SIZE = 5000
+    BROADCAST_STALL_TIMEOUT = 300  # seconds without a committed chunk before a running broadcast is resumed
+    BROADCAST_POLL_SECONDS = 30  # how often each web worker resumes queued and stalled broadcasts (0 disables)
+
+    # Rate limiting (app.utils.rate_limit); storage 'memory' is per worker, a file path is shared by the host
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'memory')
+    RATE_LIMIT_SWEEP_INTERVAL = 60.0  # seconds between removals of idle buckets
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))  # proxies adding X-Forwarded-For
+
+    # Production serving (gunicorn.conf.py); wsgi.py picks the config from FLASK_CONFIG
+    WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
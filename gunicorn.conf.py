@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for the production server
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers and threads come from WEB_CONCURRENCY and WEB_THREADS (see config.py).
+The app is built once in the master (preload_app) and forked into the workers;
+post_fork gives each worker its own database connections and background threads.
+
+Reloading:
+    kill -HUP <master pid>     start new workers, then stop old ones gracefully
+                               (config only: preloaded application code is not re-imported)
+    kill -USR2 <master pid>    start a new master with new code; once it is up,
+    kill -TERM <old master>    stop the old one (zero-downtime code deploy)
+"""
+import os
+
+# Imported under another name: a module-level `config` would be read as a gunicorn setting
+from config import config as app_configs
+
+_settings = app_configs[os.environ.get('FLASK_CONFIG', 'production')]
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = _settings.WEB_WORKERS
+threads = _settings.WEB_THREADS
+worker_class = 'gthread'
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30  # seconds a worker has to finish in-flight requests on reload/shutdown
+keepalive = 5
+
+# Recycle workers periodically so slow leaks cannot accumulate; jitter avoids restarting all at once
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = os.environ.get('ACCESS_LOG', '-') or None  # ACCESS_LOG= (empty) disables it
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app.utils.serving import after_fork
+    from wsgi import app
+    after_fork(app)
+
+
+def worker_exit(server, worker):
+    from app.utils.serving import before_exit
+    from wsgi import app
+    before_exit(app)
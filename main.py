@@ -2,10 +2,14 @@
 Kenya Power Electrical Systems Management Application
 Main entry point
 """
+import os
+
+import click
+
 from app import create_app, db
-from app.models import User
+from app.models import User, MessageThread
 
-app = create_app('development')
+app = create_app(os.environ.get('FLASK_CONFIG', 'development'))
 
 
 @app.shell_context_processor
@@ -34,5 +38,70 @@ def create_admin():
             print('Admin user already exists.')
 
 
+@app.cli.command()
+def rebuild_message_threads():
+    """Rebuild message_threads summaries from customer_messages"""
+    with app.app_context():
+        count = MessageThread.rebuild()
+        db.session.commit()
+        print(f'Rebuilt {count} message thread(s).')
+
+
+@app.cli.command()
+def archive_audit_log():
+    """Move audit_log rows past retention into compressed archive segments"""
+    from app.utils.audit_archive import AuditArchive
+    with app.app_context():
+        result = AuditArchive.from_app(app).archive()
+        print(f"Archived {result['rows']} audit row(s) older than {result['cutoff']} "
+              f"in {result['batches']} batch(es), {result['segments']} segment(s).")
+
+
+@app.cli.command()
+@click.option('--full', is_flag=True, help='Rebuild from scratch instead of folding in flagged faults')
+def refresh_mttr(full):
+    """Refresh precomputed resolution-time percentiles (mttr_stats)"""
+    from app.utils.mttr import refresh_mttr_stats
+    with app.app_context():
+        count = refresh_mttr_stats(full=full)
+        print(f'Folded {count} fault(s) into mttr_stats.')
+
+
+@app.cli.command()
+def resume_report_jobs():
+    """Resubmit queued and abandoned background report jobs"""
+    from app.utils.report_jobs import resume_report_jobs as resume
+    with app.app_context():
+        count = resume()
+        print(f'Resubmitted {count} report job(s).')
+
+
+@app.cli.command()
+def resume_broadcasts():
+    """Resubmit queued and stalled outage broadcasts"""
+    from app.utils.broadcasts import resume_broadcasts as resume
+    with app.app_context():
+        count = resume()
+        print(f'Resubmitted {count} outage broadcast(s).')
+
+
+@app.cli.command()
+def refresh_technician_stats():
+    """Recompute every technician's workload and performance figures"""
+    from app.utils.technician_stats import refresh_all_technicians
+    with app.app_context():
+        count = refresh_all_technicians()
+        print(f'Refreshed figures for {count} technician(s).')
+
+
+@app.cli.command()
+def migrate_db():
+    """Apply pending versioned migrations from Database/migrations"""
+    from app.utils.migrations import apply_migrations
+    with app.app_context():
+        applied = apply_migrations(db.engine)
+        print(f"Applied {len(applied)} migration(s){': ' + ', '.join(applied) if applied else ''}.")
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,9 +1,14 @@
 """
 Test suite for Kenya Power Management System
 """
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime, timedelta
 from app import create_app, db
-from app.models import User, Customer, Connection, Fault, MaintenanceSchedule
+from app.models import (User, Customer, Connection, Fault, MaintenanceSchedule, CustomerMessage, MessageThread,
+                        Notification, AuditLog, FaultUpdate)
 
 
 class TestConfig:
@@ -11,6 +16,10 @@ class TestConfig:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     SECRET_KEY = 'test-secret-key'
+    AUDIT_ASYNC = False
+    REPORT_JOBS_ASYNC = False
+    BROADCAST_ASYNC = False
+    PASSWORD_HASH_METHOD = 'scrypt:1024:8:1'
 
 
 class TestBase(unittest.TestCase):
@@ -69,6 +78,89 @@ class TestAuth(TestBase):
         response = self.client.get('/logout', follow_redirects=True)
         self.assertIn(b'Login', response.data)
 
+    def test_passwords_are_hashed_and_upgraded_on_login(self):
+        self.assertTrue(self.test_user.password.startswith('scrypt:1024:8:1$'))
+
+        # Legacy plain-text values still work once, and are replaced by a hash
+        self.test_user.password = 'testpass'
+        db.session.commit()
+        self.login('testuser', 'wrongpass')
+        self.assertEqual(db.session.get(User, self.test_user.user_id).password, 'testpass')
+        self.assertIn(b'Dashboard', self.login().data)
+        self.assertTrue(db.session.get(User, self.test_user.user_id).password.startswith('scrypt:1024:8:1$'))
+
+        # Retuning the cost upgrades existing hashes on the next login
+        self.client.get('/logout')
+        self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        self.assertIn(b'Dashboard', self.login().data)
+        self.assertTrue(db.session.get(User, self.test_user.user_id).password.startswith('pbkdf2:sha256:1000$'))
+
+    def test_login_is_refused_when_hashing_pool_is_saturated(self):
+        hasher = self.app.extensions['password_hasher']
+        hasher.timeout = 0.01
+        taken = 0
+        while hasher._slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = self.client.post('/login', data={'username': 'testuser', 'password': 'testpass'})
+            self.assertEqual(response.status_code, 503)
+        finally:
+            for _ in range(taken):
+                hasher._slots.release()
+        self.assertIn(b'Dashboard', self.login().data)
+
+    def test_password_changes_are_refused_when_hashing_pool_is_saturated(self):
+        self.login()
+        hasher = self.app.extensions['password_hasher']
+        hasher.timeout = 0.01
+        taken = 0
+        while hasher._slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = self.client.post('/staff/add', data={
+                'username': 'newtech', 'email': 'newtech@test.com', 'full_name': 'New Tech', 'role': 'technician',
+                'password': 'techpass', 'confirm_password': 'techpass'})
+            self.assertEqual(response.status_code, 503)
+        finally:
+            for _ in range(taken):
+                hasher._slots.release()
+        self.assertIsNone(User.query.filter_by(username='newtech').first())
+
+    def test_login_attempts_are_rate_limited_per_account(self):
+        for _ in range(5):
+            self.assertEqual(self.login('testuser', 'wrongpass').status_code, 200)
+        response = self.client.post('/login', data={'username': 'TestUser ', 'password': 'testpass'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+
+        # Other accounts are unaffected until the per-IP bucket runs out
+        self.assertEqual(self.login('otheruser', 'x').status_code, 200)
+        self.assertEqual(self.client.get('/login').status_code, 200)
+
+    def test_bucket_stores_refill_sweep_and_share(self):
+        import time
+        from unittest import mock
+        from app.utils.rate_limit import MemoryBucketStore, SqliteBucketStore, parse_limit
+
+        self.assertEqual(parse_limit('100/15 minutes'), (100, 100 / 900))
+        store = MemoryBucketStore(sweep_interval=0)
+        now = time.monotonic()
+        capacity, rate = parse_limit('2/second')
+        with mock.patch('app.utils.rate_limit.time.monotonic', return_value=now):
+            self.assertEqual([store.take('k', capacity, rate)[0] for _ in range(3)], [True, True, False])
+            self.assertAlmostEqual(store.take('k', capacity, rate)[1], 0.5)
+        with mock.patch('app.utils.rate_limit.time.monotonic', return_value=now + 0.6):
+            self.assertTrue(store.take('k', capacity, rate)[0])
+        with mock.patch('app.utils.rate_limit.time.monotonic', return_value=now + 10):
+            store.take('other', capacity, rate)
+        self.assertEqual(len(store), 1)  # 'k' had refilled and was swept
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/buckets.db'
+            worker_a, worker_b = SqliteBucketStore(path), SqliteBucketStore(path)
+            self.assertTrue(worker_a.take('k', 1, 0.01)[0])
+            self.assertFalse(worker_b.take('k', 1, 0.01)[0])
+
 
 class TestCustomer(TestBase):
     """Test customer management"""
@@ -95,6 +187,76 @@ class TestCustomer(TestBase):
         customer = Customer.query.filter_by(id_number='12345678').first()
         self.assertIsNotNone(customer)
 
+    def test_outage_broadcast_dedupes_and_resumes(self):
+        from app.models import OutageBroadcast
+        from app.utils.broadcasts import resume_broadcasts
+
+        customers = [Customer(account_number=f'KP-2024-{i:04d}', first_name='Feeder', last_name=str(i),
+                              phone='+254700000000', id_number=f'FDR{i}', address='Grid Road', county='Nairobi',
+                              town='Nairobi', customer_type='residential') for i in range(4)]
+        db.session.add_all(customers)
+        db.session.flush()
+        feeders = ['F-7', 'F-7', 'F-7', 'F-9', 'F-7']  # the first customer has two connections on F-7
+        db.session.add_all([Connection(customer_id=customers[i % 4].customer_id, meter_number=f'MTR-F{i}',
+                                       connection_type='single_phase', load_capacity=5, feeder_line=feeder)
+                            for i, feeder in enumerate(feeders)])
+        db.session.commit()
+        self.login()
+
+        self.app.config['BROADCAST_CHUNK_SIZE'] = 2
+        response = self.client.post('/connections/broadcasts', data={
+            'scope_type': 'feeder', 'scope_value': 'F-7', 'title': 'Outage on F-7', 'message': 'Crews are on site.'
+        }, follow_redirects=True)
+        self.assertIn(b'3 of 3 sent', response.data)
+        notified = [n.customer_id for n in Notification.query.filter_by(reference_type='outage_broadcast')]
+        self.assertEqual(sorted(notified), [c.customer_id for c in customers[:3]])
+
+        # A worker that died after its first chunk: resuming sends only the rest
+        broadcast = OutageBroadcast(scope_type='feeder', scope_value='F-7', title='Again', message='Again',
+                                    status='running', total_recipients=3, sent_count=2,
+                                    last_customer_id=customers[1].customer_id,
+                                    heartbeat_at=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(broadcast)
+        db.session.commit()
+        self.assertEqual(resume_broadcasts(), 1)
+        self.assertEqual(Notification.query.filter_by(reference_id=broadcast.broadcast_id).one().customer_id,
+                         customers[2].customer_id)
+        status = self.client.get(f'/connections/broadcasts/{broadcast.broadcast_id}/status').json
+        self.assertEqual((status['status'], status['sent_count'], status['progress']), ('completed', 3, 100))
+
+        # A worker whose broadcast was taken over stops without sending the takeover's chunk again
+        from app.utils.broadcasts import run_broadcast
+        broadcast = OutageBroadcast(scope_type='feeder', scope_value='F-7', title='Taken', message='Taken',
+                                    status='queued')
+        db.session.add(broadcast)
+        db.session.commit()
+
+        def other_worker_moves_on():
+            OutageBroadcast.query.filter_by(broadcast_id=broadcast.broadcast_id).update(
+                {OutageBroadcast.last_customer_id: customers[2].customer_id, OutageBroadcast.sent_count: 3})
+            db.session.commit()
+            return False
+
+        self.assertIsNone(run_broadcast(broadcast.broadcast_id, should_stop=other_worker_moves_on))
+        self.assertEqual(Notification.query.filter_by(reference_id=broadcast.broadcast_id).count(), 2)
+        self.assertEqual(db.session.get(OutageBroadcast, broadcast.broadcast_id, populate_existing=True).status,
+                         'running')
+
+        # Background workers resume the queue on their own, straight away and then on a timer
+        from unittest import mock
+        from app.utils.broadcasts import BroadcastWorker
+        worker = BroadcastWorker(self.app)
+        worker.start_polling()
+        self.assertIsNone(worker._poller)  # inline broadcasts (BROADCAST_ASYNC off) never wait
+        self.app.config['BROADCAST_ASYNC'] = True
+        resumed = threading.Event()
+        with mock.patch('app.utils.broadcasts.resume_broadcasts', side_effect=resumed.set):
+            worker.start_polling()
+            self.assertTrue(resumed.wait(5))
+            worker.shutdown()
+            worker._poller.join(5)
+        self.assertFalse(worker._poller.is_alive())
+
 
 class TestFault(TestBase):
     """Test fault management"""
@@ -118,6 +280,318 @@ class TestFault(TestBase):
         fault = Fault.query.filter_by(description='Test fault description').first()
         self.assertIsNotNone(fault)
 
+    def test_list_fragments_are_cached_per_role_and_filter(self):
+        self.login()
+        cache = self.app.extensions['fragment_cache']
+        self.assertIsNotNone(self.app.jinja_env.bytecode_cache)
+
+        self.client.get('/faults/')
+        self.client.get('/faults/')
+        self.assertEqual(cache.stats()['hits'], 2)  # sidebar nav + filter dropdowns
+
+        page = self.client.get('/faults/?severity=high').data
+        self.assertIn(b'<option value="high" selected>High (0)</option>', page)
+        self.assertIn(b'<option value="other" >Other (0)</option>', page)
+
+        cache.invalidate()
+        self.client.get('/faults/')
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_filter_facets_respect_other_filters_and_scope(self):
+        from app.utils.query_log import QueryCapture
+
+        technician = User(username='facettech', email='facet@test.com', full_name='Facet Tech', role='technician')
+        technician.set_password('techpass')
+        db.session.add(technician)
+        db.session.flush()
+        db.session.add_all([
+            Fault(fault_type='power_outage', description='a', severity='high'),
+            Fault(fault_type='power_outage', description='b', severity='low', status='assigned',
+                  assigned_to=technician.user_id),
+            Fault(fault_type='line_fault', description='c', severity='high', status='assigned'),
+            Fault(fault_type='line_fault', description='d', severity='high', status='resolved'),
+        ])
+        db.session.commit()
+        self.login()
+
+        with QueryCapture(db.engine) as capture:
+            page = self.client.get('/faults/?severity=high').data.decode()
+        self.assertIn('<option value="reported" >Reported (1)</option>', page)
+        self.assertIn('<option value="assigned" >Assigned (1)</option>', page)
+        self.assertIn('<option value="low" >Low (1)</option>', page)  # its own filter is ignored
+        self.assertIn('<option value="line_fault" >Line Fault (2)</option>', page)
+        self.assertEqual(sum('GROUP BY' in statement for statement in capture.statements), 1)
+
+        with QueryCapture(db.engine) as capture:
+            self.client.get('/faults/?severity=low')
+        self.assertFalse(any('GROUP BY' in statement for statement in capture.statements))  # cached cells
+
+        # A recount with nothing changed reuses the rendered dropdowns
+        fragments = self.app.extensions['fragment_cache']
+        entries, hits = fragments.stats()['entries'], fragments.stats()['hits']
+        self.app.extensions['fault_facets'].clear()
+        self.client.get('/faults/?severity=low')
+        self.assertEqual(fragments.stats()['entries'], entries)
+        self.assertGreater(fragments.stats()['hits'], hits)
+
+        self.client.get('/logout')
+        self.login('facettech', 'techpass')
+        page = self.client.get('/faults/').data.decode()
+        self.assertIn('<option value="assigned" >Assigned (1)</option>', page)
+        self.assertIn('<option value="line_fault" >Line Fault (0)</option>', page)
+
+    def test_timeline_engine_as_of_counts(self):
+        from app.utils.fault_timeline import FaultTimelineEngine
+
+        start = datetime(2024, 5, 1, 8, 0)
+        for i in range(4):
+            fault = Fault(fault_type='power_outage', description=f'Outage {i}', severity='high',
+                          reported_by_user=self.test_user.user_id, reported_date=start + timedelta(hours=i))
+            db.session.add(fault)
+            db.session.flush()
+            if i % 2 == 0:
+                db.session.add(FaultUpdate(fault_id=fault.fault_id, updated_by=self.test_user.user_id,
+                                           update_type='status_change', previous_status='reported',
+                                           new_status='resolved', update_date=start + timedelta(hours=i, minutes=30)))
+        db.session.commit()
+
+        engine = FaultTimelineEngine(snapshot_every=2).build()
+        self.assertEqual(engine.status_counts_as_of(start - timedelta(hours=1)), {})
+        self.assertEqual(engine.status_counts_as_of(start + timedelta(hours=1, minutes=15)),
+                         {'resolved': 1, 'reported': 1})
+        self.assertEqual(engine.status_counts_as_of(start + timedelta(days=1)), {'resolved': 2, 'reported': 2})
+
+        first = Fault.query.filter_by(description='Outage 0').one()
+        self.assertEqual([e['status'] for e in engine.timeline(first.fault_id)], ['reported', 'resolved'])
+
+        self.login()
+        response = self.client.get(f'/faults/{first.fault_id}')
+        self.assertIn(b'Time in Status', response.data)
+
+        # Offsets are normalized to the naive UTC the timeline holds
+        response = self.client.get('/faults/api/status-as-of', query_string={'at': '2024-05-01T12:15:00+03:00'})
+        self.assertEqual(response.get_json()['counts'], {'resolved': 1, 'reported': 1})
+        response = self.client.get('/faults/api/status-as-of', query_string={'at': '2024-05-01T09:15:00Z'})
+        self.assertEqual(response.get_json()['open'], 1)
+        self.assertEqual(self.client.get('/faults/api/status-as-of?at=yesterday').status_code, 400)
+
+        # A backdated update and a moved report land at their times, not at the end
+        second = Fault.query.filter_by(description='Outage 1').one()
+        db.session.add(FaultUpdate(fault_id=second.fault_id, updated_by=self.test_user.user_id,
+                                   update_type='status_change', previous_status='reported', new_status='resolved',
+                                   update_date=start + timedelta(hours=1, minutes=5)))
+        Fault.query.filter_by(description='Outage 3').one().reported_date = start - timedelta(minutes=30)
+        db.session.commit()
+        engine.refresh()
+        self.assertEqual(engine.status_counts_as_of(start - timedelta(minutes=10)), {'reported': 1})
+        self.assertEqual(engine.status_counts_as_of(start + timedelta(hours=1, minutes=15)),
+                         {'resolved': 2, 'reported': 1})
+        self.assertEqual(engine.status_counts_as_of(start + timedelta(days=1)), {'resolved': 3, 'reported': 1})
+        self.assertEqual(engine.snapshots[-1], FaultTimelineEngine(snapshot_every=2).build().snapshots[-1])
+        self.assertEqual([e['status'] for e in engine.timeline(second.fault_id)], ['reported', 'resolved'])
+
+
+    def test_field_update_batch_is_idempotent(self):
+        technician = User(username='tech', email='tech@test.com', full_name='Tech', role='technician')
+        technician.set_password('techpass')
+        db.session.add(technician)
+        db.session.flush()
+        mine = Fault(fault_type='line_fault', description='Mine', severity='high', status='assigned',
+                     assigned_to=technician.user_id)
+        other = Fault(fault_type='line_fault', description='Not mine', severity='low')
+        schedule = MaintenanceSchedule(title='Pole check', maintenance_type='inspection', equipment_type='pole',
+                                       location_description='Depot', scheduled_date=datetime.now().date(),
+                                       assigned_to=technician.user_id, created_by=self.test_user.user_id)
+        db.session.add_all([mine, other, schedule])
+        db.session.commit()
+        self.login('tech', 'techpass')
+
+        batch = {'items': [
+            {'key': 'a1', 'type': 'status_change', 'fault_id': mine.fault_id, 'status': 'in_progress'},
+            {'key': 'a2', 'type': 'note', 'fault_id': mine.fault_id, 'notes': 'Crew on site',
+             'recorded_at': '2024-05-01T08:30:00+03:00'},
+            {'key': 'a3', 'type': 'status_change', 'fault_id': mine.fault_id, 'status': 'resolved', 'notes': 'Fixed'},
+            {'key': 'a4', 'type': 'maintenance_log', 'maintenance_id': schedule.maintenance_id,
+             'work_performed': 'Replaced insulator', 'actual_duration': 2},
+            {'key': 'a5', 'type': 'note', 'fault_id': other.fault_id, 'notes': 'Wrong fault'},
+            {'key': 'a6', 'type': 'status_change', 'fault_id': mine.fault_id, 'status': 'fixed'},
+        ]}
+        data = self.client.post('/api/v1/field-updates', json=batch).json
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['applied', 'applied', 'applied', 'applied', 'error', 'error'])
+        self.assertEqual(data['results'][2]['previous_status'], 'in_progress')
+        self.assertEqual(db.session.get(Fault, mine.fault_id).status, 'resolved')
+        self.assertEqual(FaultUpdate.query.filter_by(fault_id=mine.fault_id).count(), 3)
+        note = FaultUpdate.query.filter_by(update_type='note').one()
+        self.assertEqual(note.update_date, datetime(2024, 5, 1, 5, 30))
+        self.assertEqual(schedule.logs.one().actual_duration, 2)  # hours, as in the schema
+
+        # A retry replays the stored results and writes nothing
+        data = self.client.post('/api/v1/field-updates', json=batch).json
+        self.assertEqual([r['status'] for r in data['results'][:4]], ['duplicate'] * 4)
+        self.assertEqual(data['results'][2]['previous_status'], 'in_progress')
+        self.assertEqual(FaultUpdate.query.count(), 3)
+
+        # Atomic batches are all or nothing
+        response = self.client.post('/api/v1/field-updates', json={'atomic': True, 'items': [
+            {'key': 'b1', 'type': 'note', 'fault_id': mine.fault_id, 'notes': 'Follow-up'},
+            {'key': 'b2', 'type': 'note', 'fault_id': mine.fault_id},
+        ]})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(FaultUpdate.query.count(), 3)
+
+    def test_sync_returns_changes_after_token(self):
+        technician = User(username='tech', email='tech@test.com', full_name='Tech', role='technician')
+        technician.set_password('techpass')
+        db.session.add(technician)
+        db.session.flush()
+        mine = Fault(fault_type='line_fault', description='Mine', status='assigned', assigned_to=technician.user_id)
+        other = Fault(fault_type='line_fault', description='Not mine')
+        db.session.add_all([mine, other])
+        db.session.commit()
+        self.login('tech', 'techpass')
+
+        snapshot = self.client.get('/api/v1/sync').json
+        self.assertEqual([f['id'] for f in snapshot['changes']['faults']], [mine.fault_id])
+        token = snapshot['token']
+        self.assertEqual(self.client.get(f'/api/v1/sync?since={token}').json['changes']['faults'], [])
+
+        # Each transaction gets one sequence value for all the rows it writes
+        self.client.post('/api/v1/field-updates', json={'items': [
+            {'key': 'c1', 'type': 'status_change', 'fault_id': mine.fault_id, 'status': 'in_progress'},
+            {'key': 'c2', 'type': 'note', 'fault_id': mine.fault_id, 'notes': 'On site'},
+        ]})
+        other.description = 'Still not mine'
+        db.session.commit()
+        delta = self.client.get(f'/api/v1/sync?since={token}').json
+        self.assertEqual([f['status'] for f in delta['changes']['faults']], ['in_progress'])
+        self.assertEqual(len(delta['changes']['fault_updates']), 2)
+        self.assertEqual(len({row['seq'] for row in delta['changes']['fault_updates']}), 1)
+        self.assertGreater(delta['token'], token)
+
+        # Reassigned and deleted rows come back as tombstones; paging stops on a whole transaction
+        token = delta['token']
+        fault = db.session.get(Fault, mine.fault_id)
+        fault.assigned_to = self.test_user.user_id
+        db.session.commit()
+        for i in range(3):
+            db.session.add(Fault(fault_type='other', description=f'New {i}', assigned_to=technician.user_id))
+            db.session.commit()
+        delta = self.client.get(f'/api/v1/sync?since={token}&limit=2').json
+        self.assertEqual(delta['removed'], {'faults': [mine.fault_id]})
+        self.assertEqual([f['description'] for f in delta['changes']['faults']], ['New 0', 'New 1'])
+        self.assertTrue(delta['more'])
+        delta = self.client.get(f"/api/v1/sync?since={delta['token']}&limit=2").json
+        self.assertEqual([f['description'] for f in delta['changes']['faults']], ['New 2'])
+        self.assertFalse(delta['more'])
+
+        # A fault handed back brings its earlier updates along
+        fault.assigned_to = technician.user_id
+        db.session.commit()
+        delta = self.client.get(f"/api/v1/sync?since={delta['token']}").json
+        self.assertEqual([f['id'] for f in delta['changes']['faults']], [mine.fault_id])
+        self.assertEqual(len(delta['changes']['fault_updates']), 2)
+
+        # Snapshots page the same way
+        snapshot = self.client.get('/api/v1/sync?limit=2').json
+        self.assertEqual([f['description'] for f in snapshot['changes']['faults']], ['New 0', 'New 1'])
+        self.assertTrue(snapshot['more'])
+        snapshot = self.client.get(f"/api/v1/sync?since={snapshot['token']}&limit=2").json
+        self.assertEqual([f['description'] for f in snapshot['changes']['faults']], ['New 2', 'Mine'])
+        self.assertEqual(len(snapshot['changes']['fault_updates']), 2)
+        self.assertFalse(snapshot['more'])
+
+    def test_bulk_resolve_by_transformer(self):
+        customers = [Customer(account_number=f'KP-2024-{i:04d}', first_name='Bulk', last_name=str(i),
+                              phone='+254700000000', id_number=f'BULK{i}', address='Grid Road', county='Nairobi',
+                              town='Nairobi', customer_type='residential') for i in range(3)]
+        db.session.add_all(customers)
+        db.session.flush()
+        connections = [Connection(customer_id=c.customer_id, meter_number=f'MTR-B{i}', connection_type='single_phase',
+                                  load_capacity=5, transformer_id='TX-1' if i < 2 else 'TX-2')
+                       for i, c in enumerate(customers)]
+        db.session.add_all(connections)
+        db.session.flush()
+        faults = [Fault(fault_type='power_outage', description=f'Outage {i}', connection_id=connection.connection_id)
+                  for i, connection in enumerate(connections + connections[:1])]
+        faults.append(Fault(fault_type='power_outage', description='Already done', status='closed',
+                            connection_id=connections[0].connection_id))
+        db.session.add_all(faults)
+        db.session.commit()
+        self.login()
+
+        self.app.config['BULK_RESOLVE_CHUNK_SIZE'] = 2
+        response = self.client.post('/faults/bulk-resolve', data={
+            'selector': 'transformer', 'value': 'TX-1', 'notes': 'Transformer replaced'
+        }, follow_redirects=True)
+        self.assertIn(b'3 of 3 faults marked resolved; 2 customers notified', response.data)
+
+        by_id = {fault.fault_id: fault for fault in Fault.query}
+        self.assertEqual([by_id[f.fault_id].status for f in faults], ['resolved', 'resolved', 'reported', 'resolved',
+                                                                     'closed'])
+        self.assertIsNotNone(by_id[faults[0].fault_id].resolution_date)
+        self.assertEqual(FaultUpdate.query.filter_by(update_type='resolution').count(), 3)
+        self.assertEqual(Notification.query.filter(Notification.customer_id.isnot(None)).count(), 2)
+        self.assertEqual(AuditLog.query.filter_by(table_name='faults', action='UPDATE').count(), 3)
+
+        response = self.client.post('/faults/bulk-resolve', data={'selector': 'ids', 'value': 'x'},
+                                    follow_redirects=True)
+        self.assertIn(b'IDs must be numbers', response.data)
+
+    def test_topology_localizes_and_follows_connection_changes(self):
+        from app.utils.topology import get_topology
+
+        customers = [Customer(account_number=f'KP-2024-{i:04d}', first_name='Grid', last_name=str(i),
+                              phone='+254700000000', id_number=f'GRID{i}', address='Grid Road', county='Nairobi',
+                              town='Nairobi', customer_type='residential') for i in range(7)]
+        db.session.add_all(customers)
+        db.session.flush()
+        wiring = [('TX-1', 'F-7')] * 4 + [('TX-2', 'F-7')] * 2 + [('TX-3', 'F-9')]
+        connections = [Connection(customer_id=c.customer_id, meter_number=f'MTR-G{i}', connection_type='single_phase',
+                                  load_capacity=5, connection_status='active', transformer_id=tx, feeder_line=feeder)
+                       for i, (c, (tx, feeder)) in enumerate(zip(customers, wiring))]
+        db.session.add_all(connections)
+        db.session.flush()
+        db.session.add_all([Fault(fault_type='power_outage', description=f'Dark {i}',
+                                  connection_id=connections[i].connection_id) for i in range(3)])
+        db.session.commit()
+        self.login()
+
+        result = self.client.get('/faults/api/localize').get_json()
+        self.assertEqual(result['reports'], 3)
+        best = result['candidates'][0]
+        self.assertEqual((best['type'], best['id'], best['feeder'], best['reporting'], best['connections']),
+                         ('transformer', 'TX-1', 'F-7', 3, 4))
+        self.assertEqual(best['maintenance'], [])
+        self.assertEqual(get_topology().children(feeder='F-7'), ['TX-1', 'TX-2'])
+
+        # Committed changes patch the loaded graph without a reload
+        connections[6].transformer_id, connections[6].feeder_line = 'TX-2', 'F-7'
+        db.session.commit()
+        self.assertEqual(sorted(get_topology().children(transformer='TX-2')),
+                         [c.connection_id for c in connections[4:]])
+        result = self.client.post('/faults/api/localize', json={
+            'connection_ids': [c.connection_id for c in connections[4:]] + [999]}).get_json()
+        self.assertEqual((result['candidates'][0]['id'], result['unmatched']), ('TX-2', 1))
+
+        # Deletes patch it too; other processes' deletes and late commits are caught up on refresh
+        graph = get_topology()
+        db.session.delete(connections[6])
+        db.session.commit()
+        self.assertEqual(sorted(graph.children(transformer='TX-2')), [c.connection_id for c in connections[4:6]])
+        table = Connection.__table__
+        db.session.execute(table.delete().where(table.c.connection_id == connections[5].connection_id))
+        db.session.execute(table.update().where(table.c.connection_id == connections[3].connection_id).values(
+            transformer_id='TX-3', updated_at=graph.watermark - timedelta(seconds=30)))
+        db.session.commit()
+        graph.refresh_seconds = graph.reconcile_seconds = 0
+        self.assertEqual(get_topology().children(transformer='TX-2'), [connections[4].connection_id])
+        self.assertEqual(get_topology().children(transformer='TX-3'), [connections[3].connection_id])
+        self.assertEqual(graph.totals()[0].sum(), 5)
+
+        response = self.client.post('/faults/api/localize', json={'connection_ids': 'all'})
+        self.assertEqual(response.status_code, 400)
+
 
 class TestMaintenance(TestBase):
     """Test maintenance management"""
@@ -127,6 +601,775 @@ class TestMaintenance(TestBase):
         response = self.client.get('/maintenance/')
         self.assertEqual(response.status_code, 200)
 
+    def test_recurring_series_is_expanded_lazily(self):
+        from datetime import date
+        from app.models import MaintenanceSeries
+
+        self.login()
+        start = date.today() + timedelta(days=1)
+        response = self.client.post('/maintenance/schedule', data={
+            'title': 'Weekly inspection', 'maintenance_type': 'inspection', 'equipment_type': 'transformer',
+            'equipment_id': 'TX-1', 'location_description': 'Substation', 'scheduled_date': start.isoformat(),
+            'repeat': 'WEEKLY', 'repeat_interval': '1', 'repeat_count': '10', 'priority': 'medium'
+        })
+        self.assertEqual(response.status_code, 302)
+        series = MaintenanceSeries.query.one()
+        self.assertEqual(series.until, start + timedelta(weeks=9))
+        self.assertEqual(MaintenanceSchedule.query.count(), 0)
+
+        events = self.client.get('/maintenance/api/events', query_string={
+            'start': start.isoformat(), 'end': (start + timedelta(days=30)).isoformat()}).get_json()
+        self.assertEqual([e['start'] for e in events], [(start + timedelta(weeks=n)).isoformat() for n in range(5)])
+        self.assertIn(b'Weekly inspection', self.client.get('/maintenance/').data)
+
+        # Logging work on the second visit stores that occurrence, and only that one
+        second = (start + timedelta(weeks=1)).isoformat()
+        self.assertEqual(self.client.get(f'/maintenance/series/{series.series_id}/{second}').status_code, 200)
+        self.assertEqual(self.client.get(
+            f'/maintenance/series/{series.series_id}/{(start + timedelta(days=1)).isoformat()}').status_code, 404)
+        self.client.post(f'/maintenance/series/{series.series_id}/{second}/log',
+                         data={'work_performed': 'Checked oil level'})
+        schedule = MaintenanceSchedule.query.one()
+        self.assertEqual((schedule.series_id, schedule.occurrence_date.isoformat()), (series.series_id, second))
+        self.assertEqual(schedule.logs.count(), 1)
+        response = self.client.get(f'/maintenance/series/{series.series_id}/{second}')
+        self.assertEqual(response.headers['Location'], f'/maintenance/{schedule.maintenance_id}')
+
+        events = self.client.get('/maintenance/api/events', query_string={
+            'start': start.isoformat(), 'end': (start + timedelta(days=30)).isoformat()}).get_json()
+        self.assertEqual(len(events), 5)
+        self.assertEqual(sum(1 for e in events if e['id'] == schedule.maintenance_id), 1)
+
+        # Losing a materialization race rolls back the savepoint only, not the caller's other changes
+        from unittest import mock
+        from flask_sqlalchemy.query import Query
+        from app.utils.recurrence import materialize_occurrence
+        real_first, lookups = Query.first, []
+
+        def first_misses_once(query):
+            lookups.append(query)
+            return None if len(lookups) == 1 else real_first(query)
+
+        db.session.add(Fault(fault_type='power_outage', description='Written alongside the race'))
+        with mock.patch.object(Query, 'first', first_misses_once):
+            self.assertEqual(materialize_occurrence(series, schedule.occurrence_date), schedule)
+        db.session.commit()
+        self.assertEqual(Fault.query.filter_by(description='Written alongside the race').count(), 1)
+        self.assertEqual(MaintenanceSchedule.query.count(), 1)
+
+
+    def test_technician_calendar_matches_a_linear_scan(self):
+        import random
+        from app.utils.crew_calendar import Booking, TechnicianCalendar
+
+        rng = random.Random(7)
+        base = datetime(2024, 6, 1)
+        calendar, bookings = TechnicianCalendar(), {}
+        for ref in range(300):
+            start = base + timedelta(hours=rng.randrange(500))
+            booking = Booking(start, start + timedelta(hours=rng.choice((1, 2, 4, 200))), 'fault', ref % 120)
+            calendar.add(booking)
+            bookings[ref % 120] = booking
+            if ref % 7 == 0:
+                calendar.discard('fault', ref % 50)
+                bookings.pop(ref % 50, None)
+        self.assertEqual(len(calendar), len(bookings))
+
+        for _ in range(50):
+            start = base + timedelta(hours=rng.randrange(-10, 510))
+            end = start + timedelta(hours=rng.randrange(1, 12))
+            expected = sorted(b for b in bookings.values() if b.start < end and b.end > start)
+            self.assertEqual(calendar.overlapping(start, end), expected)
+
+    def test_double_booking_is_caught_and_next_slot_suggested(self):
+        import io
+        from datetime import date
+
+        technician = User(username='tech', email='tech@test.com', full_name='Tech', role='technician')
+        technician.set_password('techpass')
+        db.session.add(technician)
+        db.session.commit()
+        day = date.today() + timedelta(days=2)
+        db.session.add(Fault(fault_type='power_outage', description='Outage', status='assigned',
+                             assigned_to=technician.user_id, assigned_date=datetime.combine(day, datetime.min.time())
+                             + timedelta(hours=8)))
+        db.session.commit()
+
+        self.login()
+        form = {'title': 'Pole check', 'maintenance_type': 'inspection', 'equipment_type': 'pole',
+                'location_description': 'Ngong Road', 'scheduled_date': day.isoformat(), 'scheduled_time': '10:00',
+                'estimated_duration': '2', 'assigned_to': str(technician.user_id), 'priority': 'medium'}
+        response = self.client.post('/maintenance/schedule', data=form)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'fault #', response.data)
+        self.assertIn(f'{day.isoformat()}T12:00:00'.encode(), response.data)  # after the 4-hour fault block
+        self.assertEqual(MaintenanceSchedule.query.count(), 0)
+
+        response = self.client.post('/maintenance/schedule', data=dict(form, suggested_slot=f'{day.isoformat()}T12:00'))
+        self.assertEqual(response.status_code, 302)
+        # The new visit is picked up by the cached calendar on the next check
+        response = self.client.post('/maintenance/schedule', data=dict(form, scheduled_time='13:00'))
+        self.assertIn(b'maintenance #', response.data)
+        self.assertIn(f'{day.isoformat()}T14:00:00'.encode(), response.data)
+
+        plan = ('title,location_description,scheduled_date,scheduled_time,estimated_duration,technician\n'
+                f'Line patrol,Karen,{day},14:00,2,tech\n'
+                f'Meter audit,Karen,{day},15:00,2,tech\n'
+                f'Unknown crew,Karen,{day},09:00,2,nobody\n')
+        response = self.client.post('/maintenance/import-plan', data={
+            'plan': (io.BytesIO(plan.encode()), 'plan.csv'), 'import': '1'}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'plan row 1', response.data)
+        self.assertIn(b'unknown technician nobody', response.data)
+        self.assertEqual(MaintenanceSchedule.query.count(), 1)
+
+        plan = ('title,location_description,scheduled_date,scheduled_time,technician\n'
+                f'Line patrol,Karen,{day},14:00,tech\n')
+        response = self.client.post('/maintenance/import-plan', data={
+            'plan': (io.BytesIO(plan.encode()), 'plan.csv'), 'import': '1'}, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(MaintenanceSchedule.query.count(), 2)
+
+
+class TestStaff(TestBase):
+    """Test staff pages and technician figures"""
+
+    def test_technician_stats_follow_writes(self):
+        from app.models import MaintenanceLog, TechnicianStats
+
+        technician = User(username='tech', email='tech@test.com', full_name='Tech', role='technician')
+        technician.set_password('techpass')
+        db.session.add(technician)
+        db.session.commit()
+        fault = Fault(fault_type='line_fault', description='Line down', severity='critical', status='assigned',
+                      assigned_to=technician.user_id, reported_date=datetime.utcnow() - timedelta(hours=6))
+        schedule = MaintenanceSchedule(title='Pole check', maintenance_type='inspection', equipment_type='pole',
+                                       location_description='Depot', scheduled_date=datetime.now().date(),
+                                       assigned_to=technician.user_id, created_by=self.test_user.user_id)
+        db.session.add_all([fault, schedule])
+        db.session.commit()
+
+        stats = db.session.get(TechnicianStats, technician.user_id)
+        self.assertEqual((stats.open_faults_critical, stats.open_faults, stats.active_maintenance), (1, 1, 1))
+
+        db.session.add(MaintenanceLog(maintenance_id=schedule.maintenance_id, logged_by=technician.user_id,
+                                      work_performed='Checked', actual_duration=2))
+        fault.status = 'resolved'
+        fault.resolution_date = datetime.utcnow()
+        db.session.commit()
+        stats = db.session.get(TechnicianStats, technician.user_id)
+        self.assertEqual((stats.open_faults, stats.resolved_30d, stats.logged_minutes_30d), (0, 1, 120))
+        self.assertAlmostEqual(stats.median_resolution_hours, 6, places=1)
+
+        # Moving the visit to someone else takes it off this technician
+        schedule.assigned_to = None
+        db.session.commit()
+        self.assertEqual(db.session.get(TechnicianStats, technician.user_id).active_maintenance, 0)
+
+        # A rolled back change leaves the figures alone
+        fault.status = 'in_progress'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(db.session.get(TechnicianStats, technician.user_id).open_faults, 0)
+
+        self.login()
+        response = self.client.get(f'/staff/{technician.user_id}')
+        self.assertIn(b'Resolved (30 days): <strong>1</strong>', response.data)
+
+
+class TestAudit(TestBase):
+    """Test audit logging"""
+
+    def test_update_writes_audit_diff(self):
+        self.test_user.full_name = 'Renamed User'
+        self.test_user.set_password('newpass')
+        db.session.commit()
+
+        entry = AuditLog.query.filter_by(table_name='users', action='UPDATE').one()
+        self.assertEqual(entry.record_id, self.test_user.user_id)
+        self.assertEqual(entry.old_values['full_name'], 'Test User')
+        self.assertEqual(entry.new_values['full_name'], 'Renamed User')
+        self.assertEqual(entry.new_values['password'], '***')
+
+    def test_background_writer_batches_rows(self):
+        self.app.config['AUDIT_ASYNC'] = True
+        writer = self.app.extensions['audit_writer']
+        for i in range(5):
+            db.session.add(Customer(account_number=f'KP-2024-{i:04d}', first_name='Batch', last_name=str(i),
+                                    phone='+254700000000', id_number=f'ID{i}', address='Audit Street',
+                                    county='Nairobi', town='Nairobi', customer_type='residential'))
+        db.session.commit()
+
+        self.assertTrue(writer.flush())
+        writer.shutdown()
+        self.assertEqual(AuditLog.query.filter_by(table_name='customers', action='INSERT').count(), 5)
+        stats = writer.stats()
+        self.assertEqual(stats['rows_enqueued'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_full_queue_delays_a_commit_by_one_timeout(self):
+        from unittest import mock
+        from app.utils.audit import AuditWriter
+
+        self.app.config.update(AUDIT_ASYNC=True, AUDIT_QUEUE_SIZE=1, AUDIT_ENQUEUE_TIMEOUT=0.2)
+        writer = AuditWriter(self.app)
+        writer._queue.put({'queued': True})  # nothing drains it: the writer thread is never started
+        with mock.patch.object(writer, '_ensure_started'), mock.patch.object(writer, '_write') as write:
+            started = time.monotonic()
+            writer.submit([{'row': i} for i in range(4)])
+            elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 0.5)
+        write.assert_called_once_with([{'row': i} for i in range(4)], inline=True)
+
+    def test_archive_moves_old_rows_to_segments(self):
+        from app.utils.audit_archive import AuditArchive
+
+        old = datetime.utcnow() - timedelta(days=200)
+        for i in range(3):
+            db.session.add(AuditLog(user_id=self.test_user.user_id, action='UPDATE', table_name='faults',
+                                    record_id=i, new_values={'status': 'closed'},
+                                    action_date=old + timedelta(days=i)))
+        db.session.commit()
+
+        with tempfile.TemporaryDirectory() as directory:
+            archive = AuditArchive(directory, retention_days=90, batch_size=2)
+            result = archive.archive()
+            self.assertEqual(result['rows'], 3)
+            self.assertEqual(result['batches'], 2)
+            self.assertEqual(AuditLog.query.filter(AuditLog.action_date < old + timedelta(days=5)).count(), 0)
+
+            rows = archive.query(old - timedelta(days=1), datetime.utcnow(), user_id=self.test_user.user_id)
+            self.assertEqual([r['record_id'] for r in rows if r['table_name'] == 'faults'], [0, 1, 2])
+            self.assertEqual(archive.query(old - timedelta(days=1), old + timedelta(days=5), user_id=999), [])
+
+
+class TestReports(TestBase):
+    """Test performance reports"""
+
+    def test_report_cache_hits_and_invalidates(self):
+        self.login()
+        cache = self.app.extensions['report_cache']
+
+        self.assertEqual(self.client.get('/reports/faults').status_code, 200)
+        self.client.get('/reports/faults')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # A new fault today bumps the faults generation, so the open range recomputes
+        self.client.post('/faults/report', data={
+            'fault_type': 'power_outage',
+            'description': 'Cache invalidation fault',
+            'severity': 'high'
+        })
+        self.client.get('/reports/faults')
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_report_cache_sees_writes_from_other_processes(self):
+        from app.utils.report_cache import ReportCache
+
+        # Two caches stand in for two gunicorn workers; the write commits outside either
+        worker, calls = ReportCache(), []
+        today = datetime.utcnow()
+        closed = (datetime(2024, 1, 1), datetime(2024, 1, 31))
+
+        def compute(start, end):
+            calls.append((start, end))
+            return len(calls)
+
+        worker.get_or_compute('faults', today, today, ['faults'], compute)
+        worker.get_or_compute('faults', *closed, ['faults'], compute)
+        db.session.add(Fault(fault_type='power_outage', description='Backdated', reported_date=datetime(2024, 1, 9)))
+        db.session.commit()
+
+        self.assertEqual(worker.get_or_compute('faults', today, today, ['faults'], compute), 3)
+        self.assertEqual(worker.get_or_compute('faults', *closed, ['faults'], compute), 4)
+        self.assertEqual(worker.get_or_compute('faults', *closed, ['faults'], compute), 4)
+
+    def test_report_cache_applies_late_and_moved_writes(self):
+        from app.models import ReportCacheInvalidation
+        from app.utils.report_cache import ReportCache
+
+        worker, calls = ReportCache(), []
+        january, march = (datetime(2024, 1, 1), datetime(2024, 1, 31)), (datetime(2024, 3, 1), datetime(2024, 3, 31))
+
+        def compute(start, end):
+            calls.append((start, end))
+            return len(calls)
+
+        fault = Fault(fault_type='power_outage', description='Moved', reported_date=datetime(2024, 1, 9))
+        db.session.add(fault)
+        db.session.commit()
+        worker.get_or_compute('faults', *january, ['faults'], compute)
+        worker.get_or_compute('faults', *march, ['faults'], compute)
+
+        # Moving the fault out of January changes January's report as well as March's
+        fault.reported_date = datetime(2024, 3, 9)
+        db.session.commit()
+        self.assertEqual(worker.get_or_compute('faults', *january, ['faults'], compute), 3)
+        self.assertEqual(worker.get_or_compute('faults', *march, ['faults'], compute), 4)
+
+        # An event below the newest id applied that only becomes visible now is still applied
+        events = ReportCacheInvalidation.__table__
+        newest = db.session.execute(db.select(db.func.max(events.c.event_id))).scalar()
+        for event_id, day in ((newest + 2, datetime(2023, 6, 1)), (newest + 1, datetime(2024, 3, 20))):
+            db.session.execute(events.insert().values(event_id=event_id, table_name='faults', first_day=day.date(),
+                                                      last_day=day.date(), created_at=datetime.utcnow()))
+            db.session.commit()
+            worker.get_or_compute('faults', *january, ['faults'], compute)
+        self.assertEqual(worker.get_or_compute('faults', *march, ['faults'], compute), 5)
+        self.assertEqual(worker.get_or_compute('faults', *january, ['faults'], compute), 3)
+
+    def test_closed_range_invalidated_by_dated_write(self):
+        from app.utils.report_cache import ReportCache
+        cache = ReportCache(max_entries=2)
+        calls = []
+
+        def compute(start, end):
+            calls.append((start, end))
+            return len(calls)
+
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 31)
+        self.assertEqual(cache.get_or_compute('faults', start, end, ['faults'], compute), 1)
+        cache.bump('faults')
+        self.assertEqual(cache.get_or_compute('faults', start, end, ['faults'], compute), 1)
+        cache.bump('faults', {datetime(2024, 1, 15).date()})
+        self.assertEqual(cache.get_or_compute('faults', start, end, ['faults'], compute), 2)
+
+        cache.get_or_compute('faults', datetime(2023, 1, 1), datetime(2023, 1, 2), ['faults'], compute)
+        cache.get_or_compute('faults', datetime(2022, 1, 1), datetime(2022, 1, 2), ['faults'], compute)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_mttr_stats_refresh_incrementally(self):
+        from app.models import MttrStat
+        from app.utils.mttr import refresh_mttr_stats, load_resolution_columns, group_summary
+
+        start = datetime(2024, 3, 1, 8, 0)
+        for i, hours in enumerate((1, 2, 3, 10)):
+            db.session.add(Fault(fault_type='power_outage', description=f'MTTR {i}', severity='high',
+                                 reported_by_user=self.test_user.user_id, status='resolved',
+                                 reported_date=start, resolution_date=start + timedelta(hours=hours)))
+        db.session.commit()
+
+        summary = group_summary(load_resolution_columns(), 'overall')[0]
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['p50'], 2.5)
+        self.assertEqual(summary['mean'], 4.0)
+
+        self.assertEqual(refresh_mttr_stats(), 4)
+        db.session.add(Fault(fault_type='power_outage', description='MTTR late', severity='low',
+                             reported_by_user=self.test_user.user_id, status='resolved',
+                             reported_date=start, resolution_date=start + timedelta(days=2)))
+        db.session.commit()
+        self.assertEqual(refresh_mttr_stats(), 1)
+        self.assertEqual(refresh_mttr_stats(), 0)
+
+        overall = MttrStat.query.filter_by(group_type='overall').one()
+        self.assertEqual(overall.sample_count, 5)
+        self.assertAlmostEqual(overall.mean_hours, (16 + 48) / 5)
+        self.assertEqual(MttrStat.query.filter_by(group_type='severity', group_value='low').one().sample_count, 1)
+
+        # Resolutions dated before ones already folded in, or committed out of order, still count
+        db.session.add(Fault(fault_type='line_fault', description='MTTR backdated', severity='low',
+                             reported_by_user=self.test_user.user_id, status='resolved',
+                             reported_date=start, resolution_date=start + timedelta(minutes=30)))
+        db.session.commit()
+        self.assertEqual(refresh_mttr_stats(), 1)
+        self.assertEqual(MttrStat.query.filter_by(group_type='overall').one().sample_count, 6)
+
+        # Requests only flag; reopening takes the fault out and resolving again puts it back once
+        self.login()
+        fault = Fault.query.filter_by(description='MTTR backdated').one()
+        self.client.post(f'/faults/{fault.fault_id}/update-status', data={'status': 'in_progress'})
+        db.session.refresh(fault)
+        self.assertIsNone(fault.resolution_date)
+        self.assertEqual(MttrStat.query.filter_by(group_type='overall').one().sample_count, 6)
+        self.assertEqual(refresh_mttr_stats(), 1)
+        self.assertEqual(MttrStat.query.filter_by(group_type='overall').one().sample_count, 5)
+        self.assertIsNone(MttrStat.query.filter_by(group_type='fault_type', group_value='line_fault').first())
+
+        self.client.post(f'/faults/{fault.fault_id}/update-status', data={'status': 'resolved'})
+        self.client.post(f'/faults/{fault.fault_id}/update-status', data={'status': 'closed'})
+        self.assertEqual(refresh_mttr_stats(), 1)
+        overall = MttrStat.query.filter_by(group_type='overall').one()
+        self.assertEqual(overall.sample_count, 6)
+        histogram = overall.histogram
+        self.assertEqual(refresh_mttr_stats(full=True), 6)
+        self.assertEqual(MttrStat.query.filter_by(group_type='overall').one().histogram, histogram)
+
+    def test_long_range_report_runs_as_job(self):
+        from app.models import ReportJob
+        self.login()
+        db.session.add(Fault(fault_type='power_outage', description='Old outage', severity='high',
+                             reported_by_user=self.test_user.user_id, reported_date=datetime(2021, 6, 1)))
+        db.session.commit()
+
+        response = self.client.get('/reports/faults?start_date=2020-01-01&end_date=2023-12-31')
+        self.assertEqual(response.status_code, 302)
+        job = ReportJob.query.one()
+        self.assertEqual((job.status, job.progress), ('completed', 100))
+        self.assertEqual(job.result['total_faults'], 1)
+
+        page = self.client.get(response.headers['Location'])
+        self.assertIn(b'Fault Analysis Report', page.data)
+        self.assertEqual(self.client.get(f'/reports/jobs/{job.job_id}/download').json['result']['total_faults'], 1)
+
+        # The same closed range reuses the finished job
+        response = self.client.post('/reports/api/jobs', json={
+            'report': 'faults', 'start_date': '2020-01-01', 'end_date': '2023-12-31'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['job_id'], job.job_id)
+        self.assertEqual(self.client.post('/reports/api/jobs', json={'report': 'nope'}).status_code, 400)
+
+
+    def test_report_jobs_wait_for_the_global_running_cap(self):
+        from app.models import ReportJob
+        from app.utils.report_jobs import enqueue_report, resume_report_jobs
+
+        self.app.config['REPORT_JOB_MAX_RUNNING'] = 1
+        busy = ReportJob(report_name='faults', start_date=datetime(2019, 1, 1).date(),
+                         end_date=datetime(2019, 12, 31).date(), status='running', started_at=datetime.utcnow())
+        db.session.add(busy)
+        db.session.commit()
+
+        job = enqueue_report('faults', datetime(2020, 1, 1), datetime(2020, 12, 31))
+        db.session.refresh(job)
+        self.assertEqual(job.status, 'queued')  # another process holds the only slot
+
+        busy.status = 'completed'
+        db.session.commit()
+        self.assertEqual(resume_report_jobs(), 1)
+        db.session.refresh(job)
+        self.assertEqual(job.status, 'completed')
+
+    def test_report_jobs_are_handed_back_by_heartbeat(self):
+        from app.models import ReportJob
+        from app.utils.report_jobs import claim_job, compute_job, resume_report_jobs
+
+        long_ago = datetime.utcnow() - timedelta(days=1)
+        job = ReportJob(report_name='faults', start_date=datetime(2019, 1, 1).date(),
+                        end_date=datetime(2019, 12, 31).date(), status='queued')
+        db.session.add(job)
+        db.session.commit()
+        first_claim = claim_job(job.job_id)
+
+        # Long running but still beating: left alone
+        job.started_at, job.heartbeat_at = first_claim, datetime.utcnow()
+        db.session.commit()
+        self.app.config['REPORT_JOB_MAX_RUNNING'] = 1
+        self.assertEqual(resume_report_jobs(), 0)
+        self.assertEqual(db.session.get(ReportJob, job.job_id, populate_existing=True).status, 'running')
+
+        # Silent: handed back and run again, and the first worker's late result is dropped
+        job.started_at, job.heartbeat_at = long_ago.replace(microsecond=0), long_ago
+        db.session.commit()
+        self.app.config['REPORT_JOB_MAX_RUNNING'] = 4
+        self.assertEqual(resume_report_jobs(), 1)
+        job = db.session.get(ReportJob, job.job_id, populate_existing=True)
+        self.assertEqual(job.status, 'completed')
+        self.assertIsNone(compute_job(job.job_id, long_ago.replace(microsecond=0)))
+        self.assertEqual(db.session.get(ReportJob, job.job_id, populate_existing=True).status, 'completed')
+
+    def test_chart_data_is_gap_filled_and_bounded(self):
+        self.login()
+        today = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+        for days_ago in (0, 0, 3):
+            db.session.add(Fault(fault_type='power_outage', description='Chart fault', severity='low',
+                                 reported_by_user=self.test_user.user_id,
+                                 reported_date=today - timedelta(days=days_ago)))
+        db.session.commit()
+
+        data = self.client.get('/reports/api/chart-data/faults_trend?days=7').json
+        self.assertEqual(data['resolution'], 'day')
+        self.assertEqual(len(data['labels']), 7)
+        self.assertEqual(data['values'][-1], 2)
+        self.assertEqual(data['values'][-4], 1)
+        self.assertEqual(sum(data['values']), 3)
+
+        data = self.client.get('/reports/api/chart-data/faults_trend?days=1').json
+        self.assertEqual((data['resolution'], len(data['labels']), data['values'][9]), ('hour', 24, 2))
+
+        data = self.client.get('/reports/api/chart-data/faults_trend?days=100000&resolution=day&max_points=50').json
+        self.assertLessEqual(len(data['values']), 50)
+        self.assertEqual(data['resolution'], 'week')
+        data = self.client.get('/reports/api/chart-data/faults_trend?days=90&resolution=hour').json
+        self.assertEqual(data['resolution'], 'day')
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(self.client.get('/reports/api/chart-data/service_requests_trend').json['total'], 0)
+        self.assertEqual(self.client.get('/reports/api/chart-data/unknown').status_code, 400)
+
+    def test_responses_are_compressed_and_revalidated(self):
+        import gzip
+        import json
+        self.login()
+
+        response = self.client.get('/reports/api/chart-data/faults_trend?days=365&resolution=day',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=300')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data))['resolution'], 'day')
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get('/reports/api/chart-data/faults_trend?days=365&resolution=day',
+                                   headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.data), (304, b''))
+
+        # Pages revalidate every time; small bodies and clients without gzip stay uncompressed
+        response = self.client.get('/faults/')
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+        self.assertNotIn('Content-Encoding', response.headers)
+        response = self.client.get('/reports/api/cache-stats', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_responses_are_compressed_incrementally(self):
+        import gzip
+        from flask import stream_with_context
+
+        @self.app.route('/stream-test')
+        def stream_test():
+            return self.app.response_class(stream_with_context(f'line {i}\n' for i in range(1000)),
+                                           mimetype='text/csv')
+
+        response = self.client.get('/stream-test', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(gzip.decompress(response.data).decode().count('\n'), 1000)
+
+
+class TestSchema(TestBase):
+    """Test migrations and query plans"""
+
+    def test_migrations_apply_once_and_indexes_are_used(self):
+        from app.utils.migrations import apply_migrations
+        from app.utils.query_log import QueryCapture, explain
+
+        # Tables from create_all already exist with their indexes, so the migrations only record themselves
+        self.assertEqual(apply_migrations(db.engine), ['000_feature_tables', '001_query_indexes',
+                                                       '002_api_idempotency_keys', '003_sync_sequence',
+                                                       '004_connection_equipment_indexes', '005_outage_broadcasts',
+                                                       '006_maintenance_series', '007_technician_stats',
+                                                       '008_connection_updated_index',
+                                                       '009_report_cache_invalidations', '010_mttr_cursor',
+                                                       '011_mttr_folds', '012_report_cache_events',
+                                                       '013_report_job_heartbeat'])
+        self.assertEqual(apply_migrations(db.engine), [])
+        # 004's single-column indexes are replaced by 005's wider ones
+        self.assertEqual(sorted(index['name'] for index in db.inspect(db.engine).get_indexes('connections')),
+                         ['idx_connection_feeder_customer', 'idx_connection_transformer_customer',
+                          'idx_connection_updated'])
+
+        with QueryCapture(db.engine) as capture:
+            MaintenanceSchedule.query.filter_by(assigned_to=self.test_user.user_id).order_by(
+                MaintenanceSchedule.scheduled_date).all()
+        statement, entry = next(iter(capture.statements.items()))
+        with db.engine.connect() as connection:
+            self.assertEqual(explain(connection, statement, entry['params']), [])
+            self.assertEqual(explain(connection, 'SELECT * FROM maintenance_logs ORDER BY log_date')[0][:2],
+                             ('full_scan', 'maintenance_logs'))
+
+
+class TestReplicaRouting(unittest.TestCase):
+    """Test read-replica routing with two SQLite files"""
+
+    def setUp(self):
+        from unittest import mock
+        from config import config
+
+        self.directory = tempfile.TemporaryDirectory()
+        primary = f'sqlite:///{self.directory.name}/primary.db'
+        replica = f'sqlite:///{self.directory.name}/replica.db'
+
+        class ReplicaConfig(config['default']):
+            SQLALCHEMY_DATABASE_URI = primary
+            REPLICA_DATABASE_URI = replica
+
+        with mock.patch.dict(config, {'replica-test': ReplicaConfig}):
+            self.app = create_app('replica-test')
+        self.app.config.from_object(TestConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = primary
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        # Both databases start with the same user, as if replicated
+        replica_engine = self.app.extensions['replica_monitor'].engine
+        db.create_all()
+        db.metadata.create_all(replica_engine)
+        user = User(username='testuser', email='test@test.com', full_name='Test User', role='admin')
+        user.set_password('testpass')
+        db.session.add(user)
+        db.session.commit()
+        with replica_engine.begin() as connection:
+            connection.execute(User.__table__.insert().values(
+                user_id=user.user_id, username='testuser', email='test@test.com', full_name='Test User',
+                role='admin', password=user.password, is_active=True))
+            connection.execute(Fault.__table__.insert().values(
+                fault_type='other', description='Replica-only fault', severity='low', status='reported'))
+
+        self.client.post('/login', data={'username': 'testuser', 'password': 'testpass'})
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_reads_use_replica_until_a_write_or_lag(self):
+        replica_row, primary_row = b'<td>Other</td>', b'<td>Power Outage</td>'
+        self.assertIn(replica_row, self.client.get('/faults/').data)
+
+        # A write pins the client to the primary for REPLICA_STICKY_SECONDS
+        self.client.post('/faults/report', data={'fault_type': 'power_outage', 'description': 'Primary fault',
+                                                 'severity': 'high'})
+        page = self.client.get('/faults/').data
+        self.assertIn(primary_row, page)
+        self.assertNotIn(replica_row, page)
+
+        self.app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.client.post('/faults/report', data={'fault_type': 'low_voltage', 'description': 'Another',
+                                                 'severity': 'low'})
+        self.assertIn(replica_row, self.client.get('/faults/').data)
+
+        # A lagging replica is skipped
+        monitor = self.app.extensions['replica_monitor']
+        monitor.probe = lambda: 60
+        monitor._checked_at = 0
+        self.assertNotIn(replica_row, self.client.get('/faults/').data)
+
+    def test_cached_report_results_are_computed_on_the_primary(self):
+        # The replica-only fault must not end up in a cached chart
+        data = self.client.get('/reports/api/chart-data/faults_trend?days=7').json
+        self.assertEqual(data['total'], 0)
+        self.assertIn(b'<td>Other</td>', self.client.get('/faults/').data)  # uncached lists still use the replica
+
+    def test_replica_views_do_not_refresh_technician_stats(self):
+        from flask import g
+        from app.models import TechnicianStats
+
+        replica_engine = self.app.extensions['replica_monitor'].engine
+        technician = dict(username='tech', email='tech@test.com', full_name='Tech', role='technician',
+                          password='x', is_active=True)
+        user_id = db.session.execute(User.__table__.insert().values(**technician)).inserted_primary_key[0]
+        db.session.commit()
+        with replica_engine.begin() as connection:
+            connection.execute(User.__table__.insert().values(user_id=user_id, **technician))
+
+        self.assertEqual(self.client.get('/staff/').status_code, 200)
+        self.assertIsNone(db.session.get(TechnicianStats, user_id))
+        g.pop('db_read_replica')  # requests here share the test's app context; a served request starts afresh
+        self.assertEqual(self.client.get(f'/staff/{user_id}').status_code, 200)  # read on the primary
+        self.assertIsNotNone(db.session.get(TechnicianStats, user_id, populate_existing=True))
+
+    def test_after_fork_drops_inherited_connections_and_threads(self):
+        from app.utils.serving import after_fork, app_engines
+
+        engines = app_engines(self.app)
+        self.assertEqual(len(engines), 2)
+        for engine in engines:
+            engine.connect().close()  # leave a pooled connection behind
+        pools = [engine.pool for engine in engines]
+        writer, runner = self.app.extensions['audit_writer'], self.app.extensions['report_jobs']
+
+        after_fork(self.app)
+        for engine, inherited in zip(engines, pools):
+            self.assertIsNot(engine.pool, inherited)
+            self.assertEqual(engine.pool.checkedin(), 0)
+        self.assertIsNot(self.app.extensions['audit_writer'], writer)
+        self.assertIsNot(self.app.extensions['report_jobs'], runner)
+        self.assertEqual(self.app.extensions['report_jobs'].config_name, runner.config_name)
+        self.assertEqual(self.client.get('/faults/').status_code, 200)
+
+
+class TestCustomerPortal(TestBase):
+    """Test customer portal"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer(
+            account_number='KP-2024-0001',
+            first_name='Jane',
+            last_name='Akinyi',
+            phone='+254722222222',
+            id_number='87654321',
+            address='1 Portal Road',
+            county='Mombasa',
+            town='Nyali',
+            customer_type='residential',
+            portal_registered=True
+        )
+        self.customer.set_password('portalpass')
+        db.session.add(self.customer)
+        db.session.commit()
+
+    def portal_login(self):
+        return self.client.post('/portal/login', data={
+            'account_number': 'KP-2024-0001',
+            'password': 'portalpass'
+        }, follow_redirects=True)
+
+    def test_message_thread_summary(self):
+        self.portal_login()
+        self.client.post('/portal/support/new', data={
+            'subject': 'Billing question',
+            'message': 'Why is my bill high?'
+        })
+        thread = MessageThread.query.one()
+        self.assertEqual(thread.unread_for_staff, 1)
+
+        # Staff reply arrives and is counted as unread for the customer
+        reply = CustomerMessage(customer_id=self.customer.customer_id, user_id=self.test_user.user_id,
+                                subject='Re: Billing question', message='Checking now',
+                                is_from_customer=False, parent_message_id=thread.thread_id)
+        db.session.add(reply)
+        MessageThread.record_reply(reply)
+        db.session.commit()
+        db.session.refresh(thread)
+        self.assertEqual(thread.reply_count, 1)
+        self.assertEqual(thread.unread_for_customer, 1)
+
+        response = self.client.get('/portal/support')
+        self.assertIn(b'1 new', response.data)
+
+        self.client.get(f'/portal/support/{thread.thread_id}')
+        db.session.refresh(thread)
+        db.session.refresh(reply)
+        self.assertEqual(thread.unread_for_customer, 0)
+        self.assertTrue(reply.is_read)
+
+    def test_notifications_view_advances_watermark(self):
+        for i in range(3):
+            db.session.add(Notification(customer_id=self.customer.customer_id, title=f'Notice {i}',
+                                        message='Planned outage', notification_type='alert'))
+        db.session.commit()
+        self.assertEqual(self.customer.unread_notifications().count(), 3)
+
+        self.portal_login()
+        response = self.client.get('/portal/notifications')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'New', response.data)
+
+        db.session.refresh(self.customer)
+        self.assertIsNotNone(self.customer.notifications_read_through)
+        self.assertEqual(self.customer.unread_notifications().count(), 0)
+        # Rows themselves are left untouched by a page view
+        self.assertEqual(Notification.query.filter_by(is_read=True).count(), 0)
+
+        # Each new notification has its own mark-read control, which sets the row's flag
+        first = Notification.query.order_by(Notification.notification_id).first()
+        action = f'/portal/notifications/{first.notification_id}/read'
+        self.assertEqual(response.data.decode().count('/read" class="d-inline"'), 3)
+        self.assertIn(action, response.data.decode())
+        self.assertEqual(self.client.post(action, headers={'Referer': '/portal/notifications'}).status_code, 302)
+        db.session.refresh(first)
+        self.assertTrue(first.is_read)
+
+        # A notification stamped in the same second as the watermark is still unread
+        latest = Notification.query.order_by(Notification.notification_id.desc()).first()
+        db.session.add(Notification(customer_id=self.customer.customer_id, title='Same second',
+                                    message='Planned outage', notification_type='alert', created_at=latest.created_at))
+        db.session.commit()
+        self.assertEqual(self.customer.unread_notifications().count(), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+Production WSGI entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The configuration is chosen with FLASK_CONFIG (default: production).
+"""
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'production'))